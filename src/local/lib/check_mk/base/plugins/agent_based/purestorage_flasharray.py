@@ -6,14 +6,23 @@
 
 import purestorage_checkmk.flasharray.check
 from cmk.base.plugins.agent_based.agent_based_api.v1 import register
-from purestorage_checkmk.flasharray.common import flasharray_results_section_id, flasharray_inventory_section_id
+from purestorage_checkmk.flasharray.common import flasharray_results_section_id, flasharray_inventory_section_id, \
+    flasharray_section_ids, flasharray_agent_stats_section_id
 
+for section_id in flasharray_section_ids:
+    register.agent_section(
+        name=section_id,
+        parse_function=purestorage_checkmk.flasharray.check.parse_flasharray,
+    )
+
+# The single results section of older versions of the special agent, e.g. in the cached agent output after an upgrade
 register.agent_section(
     name=flasharray_results_section_id,
     parse_function=purestorage_checkmk.flasharray.check.parse_flasharray,
 )
 register.check_plugin(
     name=flasharray_results_section_id,
+    sections=flasharray_section_ids + [flasharray_results_section_id],
     service_name="%s",
     check_function=purestorage_checkmk.flasharray.check.check_purestorage_flasharray,
     discovery_function=purestorage_checkmk.flasharray.check.discover_purestorage_flasharray,
@@ -27,3 +36,14 @@ register.inventory_plugin(
     name=flasharray_inventory_section_id,
     inventory_function=purestorage_checkmk.flasharray.check.inventory_purestorage_flasharray,
 )
+
+register.agent_section(
+    name=flasharray_agent_stats_section_id,
+    parse_function=purestorage_checkmk.flasharray.check.parse_flasharray_agent_stats,
+)
+register.check_plugin(
+    name=flasharray_agent_stats_section_id,
+    service_name="Agent performance",
+    check_function=purestorage_checkmk.flasharray.check.check_purestorage_flasharray_agent_stats,
+    discovery_function=purestorage_checkmk.flasharray.check.discover_purestorage_flasharray_agent_stats,
+)
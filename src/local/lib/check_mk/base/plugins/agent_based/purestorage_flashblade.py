@@ -6,14 +6,23 @@
 
 import purestorage_checkmk.flashblade.check
 from cmk.base.plugins.agent_based.agent_based_api.v1 import register
-from purestorage_checkmk.flashblade.common import flashblade_results_section_id, flashblade_inventory_section_id
+from purestorage_checkmk.flashblade.common import flashblade_results_section_id, flashblade_inventory_section_id, \
+    flashblade_section_ids, flashblade_agent_stats_section_id
 
+for section_id in flashblade_section_ids:
+    register.agent_section(
+        name=section_id,
+        parse_function=purestorage_checkmk.flashblade.check.parse_flashblade,
+    )
+
+# The single results section of older versions of the special agent, e.g. in the cached agent output after an upgrade
 register.agent_section(
     name=flashblade_results_section_id,
     parse_function=purestorage_checkmk.flashblade.check.parse_flashblade,
 )
 register.check_plugin(
     name=flashblade_results_section_id,
+    sections=flashblade_section_ids + [flashblade_results_section_id],
     service_name="%s",
     check_function=purestorage_checkmk.flashblade.check.check_purestorage_flashblade,
     discovery_function=purestorage_checkmk.flashblade.check.discover_purestorage_flashblade,
@@ -27,3 +36,14 @@ register.inventory_plugin(
     name=flashblade_inventory_section_id,
     inventory_function=purestorage_checkmk.flashblade.check.inventory_purestorage_flashblade,
 )
+
+register.agent_section(
+    name=flashblade_agent_stats_section_id,
+    parse_function=purestorage_checkmk.flashblade.check.parse_flashblade_agent_stats,
+)
+register.check_plugin(
+    name=flashblade_agent_stats_section_id,
+    service_name="Agent performance",
+    check_function=purestorage_checkmk.flashblade.check.check_purestorage_flashblade_agent_stats,
+    discovery_function=purestorage_checkmk.flashblade.check.discover_purestorage_flashblade_agent_stats,
+)
@@ -1,6 +1,8 @@
+from typing import Iterator, Union
+
 from cmk.base.api.agent_based import checking_classes, inventory_classes
 from cmk.utils import pnp_cleanup as quote_pnp_string
-from purestorage_checkmk.common import Result, Metric, Attributes, TableRow
+from purestorage_checkmk.common import Result, Metric, Attributes, TableRow, InventoryTable, AgentStatsSection
 
 
 def result_to_checkmk(result: Result) -> checking_classes.Result:
@@ -57,3 +59,26 @@ def result_to_table_row(table_row: TableRow) -> inventory_classes.TableRow:
         inventory_columns=table_row.inventory_columns,
         status_columns=table_row.status_columns,
     )
+
+
+def table_to_table_rows(table: InventoryTable) -> Iterator[inventory_classes.TableRow]:
+    for key_columns, inventory_columns, status_columns in table.row_columns():
+        yield inventory_classes.TableRow(
+            path=table.path,
+            key_columns=key_columns,
+            inventory_columns=inventory_columns,
+            status_columns=status_columns,
+        )
+
+
+def agent_stats_to_checkmk(
+        section: AgentStatsSection
+) -> Iterator[Union[checking_classes.Result, checking_classes.Metric]]:
+    """
+    This function turns the measurements of a special agent run into the result and metrics of the agent performance
+    service.
+    """
+    result, metrics = section.performance()
+    yield result_to_checkmk(result)
+    for name, metric in metrics.items():
+        yield result_to_metric(name, metric)
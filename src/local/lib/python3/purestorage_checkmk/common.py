@@ -1,18 +1,43 @@
 from __future__ import annotations
 
 import abc
+import argparse
 import base64
+import collections
+import cProfile
+import concurrent.futures
+import contextlib
 import dataclasses
 import enum
+import functools
+import hashlib
+import importlib
 import inspect
+import io
+import itertools
 import json
+import logging
+import marshal
+import os
 import pprint
+import pstats
 import re
+import stat
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
 import typing
+import uuid
+import zlib
 from datetime import datetime
-from typing import Optional, Sequence, NamedTuple, Dict, List
+from typing import Optional, Sequence, NamedTuple, Dict, List, Iterable, Iterator
 
-from pypureclient import ErrorResponse
+from pypureclient import ErrorResponse, ValidResponse
+from pypureclient._transport.rest import ApiException
+from pypureclient.api_token_manager import APITokenManager
 
 
 class SpecialAgentConfiguration(NamedTuple):
@@ -35,7 +60,7 @@ class State(int, enum.Enum):
         return json.dumps(self.value)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Result:
     state: State
     summary: Optional[str] = None
@@ -49,7 +74,6 @@ class Result:
             details: Optional[str] = None,
             notice: Optional[str] = None,
     ):
-        super().__init__()
         assert summary is not None or notice is not None
         self.state = state
         self.summary = summary
@@ -57,14 +81,14 @@ class Result:
         self.details = details
 
     def toJSON(self):
-        return json.dumps(dataclasses.asdict(self))
+        return to_json(self)
 
     @staticmethod
     def from_dict(data: Dict[str, any]) -> Result:
         return Result(**data)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Metric:
     """
     A metric is a graphable value in Checkmk.
@@ -77,14 +101,14 @@ class Metric:
     """The lower and upper bounds of the graph (e.g. (0,1) or (0,100)"""
 
     def toJSON(self):
-        return json.dumps(dataclasses.asdict(self))
+        return to_json(self)
 
     @staticmethod
     def from_dict(data: Dict[str, any]) -> Metric:
         return Metric(**data)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Attributes:
     """
     This class represents the data of a single item in a key-value fashion. If you have more of the same item, use
@@ -95,14 +119,14 @@ class Attributes:
     status_attributes: Dict[str, int] = dataclasses.field(default_factory=dict)
 
     def toJSON(self):
-        return json.dumps(dataclasses.asdict(self))
+        return to_json(self)
 
     @staticmethod
     def from_dict(data: Dict[str, any]) -> Attributes:
         return Attributes(**data)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class TableRow:
     path: typing.List[str]
     key_columns: Dict[str, any] = dataclasses.field(default_factory=dict)
@@ -110,33 +134,112 @@ class TableRow:
     status_columns: Optional[Dict[str, any]] = None
 
     def toJSON(self):
-        return json.dumps(dataclasses.asdict(self))
+        return to_json(self)
 
     @classmethod
     def from_dict(cls, data: Dict[str, any]) -> TableRow:
         return cls(**data)
 
 
+def _intern_names(names: Optional[Sequence[str]]) -> Optional[typing.Tuple[str, ...]]:
+    if names is None:
+        return None
+    return tuple(sys.intern(name) for name in names)
+
+
+class CompactTableRow(TableRow):
+    """
+    CompactTableRow is the base class of the table rows whose path and column names are the same for every row of the
+    type. The path and the column names are declared once per type as interned tuples, and each row only stores its
+    column values. The rows are read and serialized like any other TableRow.
+
+    >>> class VolumeRow(CompactTableRow):
+    ...     __slots__ = ()
+    ...     table_path = ("hardware", "volumes")
+    ...     key_column_names = ("name",)
+    ...     inventory_column_names = ("size",)
+    ...
+    ...     def __init__(self, name: str, size: int):
+    ...         super().__init__((name,), (size,))
+    >>> VolumeRow("vol1", 1024)
+    VolumeRow(path=['hardware', 'volumes'], key_columns={'name': 'vol1'}, inventory_columns={'size': 1024}, \
+status_columns=None)
+    """
+    __slots__ = ("_key_values", "_inventory_values", "_status_values")
+
+    table_path: typing.Tuple[str, ...] = ()
+    key_column_names: typing.Tuple[str, ...] = ()
+    inventory_column_names: Optional[typing.Tuple[str, ...]] = None
+    """The names of the inventory columns, or None if the rows have no inventory columns."""
+    status_column_names: Optional[typing.Tuple[str, ...]] = None
+    """The names of the status columns, or None if the rows have no status columns."""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.table_path = _intern_names(cls.table_path)
+        cls.key_column_names = _intern_names(cls.key_column_names)
+        cls.inventory_column_names = _intern_names(cls.inventory_column_names)
+        cls.status_column_names = _intern_names(cls.status_column_names)
+
+    # noinspection PyMissingConstructor
+    def __init__(
+            self,
+            key_values: typing.Tuple[any, ...],
+            inventory_values: typing.Tuple[any, ...] = (),
+            status_values: typing.Tuple[any, ...] = (),
+    ):
+        """
+        :param key_values: The values of the key columns, in the order of key_column_names.
+        :param inventory_values: The values of the inventory columns, in the order of inventory_column_names.
+        :param status_values: The values of the status columns, in the order of status_column_names.
+        """
+        self._key_values = key_values
+        self._inventory_values = inventory_values
+        self._status_values = status_values
+
+    def column_values(self) -> typing.Tuple[any, ...]:
+        """
+        This function returns the values of the key, inventory and status columns of the row.
+        """
+        return self._key_values + self._inventory_values + self._status_values
+
+    @property
+    def path(self) -> typing.List[str]:
+        return list(self.table_path)
+
+    @property
+    def key_columns(self) -> Dict[str, any]:
+        return dict(zip(self.key_column_names, self._key_values))
+
+    @property
+    def inventory_columns(self) -> Optional[Dict[str, any]]:
+        if self.inventory_column_names is None:
+            return None
+        return dict(zip(self.inventory_column_names, self._inventory_values))
+
+    @property
+    def status_columns(self) -> Optional[Dict[str, any]]:
+        if self.status_column_names is None:
+            return None
+        return dict(zip(self.status_column_names, self._status_values))
+
+
 ipv4_regex = re.compile("^[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}$")
 
 
-@dataclasses.dataclass
-class NetworkAddressTableRow(TableRow):
+class NetworkAddressTableRow(CompactTableRow):
+    __slots__ = ()
+    table_path = ("networking", "addresses")
+    key_column_names = ("device",)
+    inventory_column_names = ("address", "type", "subnet")
 
     def __init__(self, address: str, device: str, subnet: str):
         ip_type = "IPv4"
         if not ipv4_regex.match(address):
             ip_type = "IPv6"
         super().__init__(
-            path=["networking", "addresses"],
-            key_columns={
-                "device": device
-            },
-            inventory_columns={
-                "address": address,
-                "type": ip_type,
-                "subnet": subnet
-            }
+            (device,),
+            (address, ip_type, subnet),
         )
 
 
@@ -150,7 +253,12 @@ class NetworkInterfaceStatus(enum.Enum):
     LOWER_LAYER_DOWN = 7
 
 
-class NIC(TableRow):
+class NIC(CompactTableRow):
+    __slots__ = ()
+    table_path = ("networking", "nics")
+    key_column_names = ("name", "interface_type")
+    inventory_column_names = ("address", "netmask", "gateway", "mac_address", "vlan", "mtu", "speed", "services")
+
     def __init__(
             self,
             name: str,
@@ -177,26 +285,17 @@ class NIC(TableRow):
         :param services:
         """
         super().__init__(
-            path=["networking", "nics"],
-            key_columns={
-                "name": name,
-                "interface_type": interface_type,
-            },
-            inventory_columns={
-                "address": address,
-                "netmask": netmask,
-                "gateway": gateway,
-                "mac_address": mac_address,
-                "vlan": vlan,
-                "mtu": mtu,
-                "speed": speed,
-                "services": services
-            }
+            (name, interface_type),
+            (address, netmask, gateway, mac_address, vlan, mtu, speed, services),
         )
 
 
-@dataclasses.dataclass
-class NetworkInterfaceTableRow(TableRow):
+class NetworkInterfaceTableRow(CompactTableRow):
+    __slots__ = ()
+    table_path = ("networking", "interfaces")
+    key_column_names = ("port_type", "description", "alias")
+    inventory_column_names = ("model", "serial", "speed", "phys_address", "oper_status", "admin_status", "vlans")
+
     def __init__(
             self,
             description: str,
@@ -223,83 +322,66 @@ class NetworkInterfaceTableRow(TableRow):
         :param serial:
         """
         super().__init__(
-            path=["networking", "interfaces"],
-            key_columns={
-                "port_type": snmp_type,
-                "description": description,
-                "alias": alias,
-            },
-            inventory_columns={
-                "model": model,
-                "serial": serial,
-                "speed": speed,
-                "phys_address": mac,
-                "oper_status": operational_status.value if operational_status is not None else None,
-                "admin_status": administrative_status.value if administrative_status is not None else None,
-                "vlans": (','.join(str(vlan) for vlan in vlans)) if vlans is not None else None
-            }
+            (snmp_type, description, alias),
+            (
+                model,
+                serial,
+                speed,
+                mac,
+                operational_status.value if operational_status is not None else None,
+                administrative_status.value if administrative_status is not None else None,
+                (','.join(str(vlan) for vlan in vlans)) if vlans is not None else None,
+            ),
         )
 
 
-@dataclasses.dataclass
-class NetworkRouteTableRow(TableRow):
+class NetworkRouteTableRow(CompactTableRow):
+    __slots__ = ()
+    table_path = ("networking", "routes")
+    key_column_names = ("target", "gateway")
+    inventory_column_names = ("type", "device")
+    status_column_names = ()
+
     def __init__(self, target: str, gateway: str, type: Optional[str] = None, device: Optional[str] = None):
         super().__init__(
-            path=["networking", "routes"],
-            key_columns={
-                "target": target,
-                "gateway": gateway,
-            },
-            inventory_columns={
-                "type": type,
-                "device": device,
-            },
-            status_columns={},
+            (target, gateway),
+            (type, device),
         )
 
 
-@dataclasses.dataclass
-class HardwareModuleTableRow(TableRow):
+class HardwareModuleTableRow(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "components", "modules")
+    key_column_names = ("index", "name")
+    inventory_column_names = ("model", "serial", "type", "capacity")
+
     def __init__(self, index: int, name: str, model: Optional[str] = None, serial: Optional[str] = None,
                  type: Optional[str] = None, capacity: Optional[int] = None):
         super().__init__(
-            path=["hardware", "components", "modules"],
-            key_columns={
-                "index": index,
-                "name": name,
-            },
-            inventory_columns={
-                "model": model,
-                "serial": serial,
-                "type": type,
-                "capacity": capacity,
-            }
+            (index, name),
+            (model, serial, type, capacity),
         )
 
 
-@dataclasses.dataclass
-class ChassisTableRow(TableRow):
+class ChassisTableRow(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "chassis")
+    key_column_names = ("name", "Manufacturer", "model")
+    inventory_column_names = ("serial", "Type", "bootloader", "firmware")
+
     def __init__(self, name: str, manufacturer: Optional[str] = None, type: Optional[str] = None,
                  serial: Optional[str] = None,
                  model: Optional[str] = None, bootloader: Optional[str] = None, firmware: Optional[str] = None):
         super().__init__(
-            path=["hardware", "chassis"],
-            key_columns={
-                "name": name,
-                "Manufacturer": manufacturer,
-                "model": model,
-            },
-            inventory_columns={
-                "serial": serial,
-                "Type": type,
-                "bootloader": bootloader,
-                "firmware": firmware,
-            }
+            (name, manufacturer, model),
+            (serial, type, bootloader, firmware),
         )
 
 
 @dataclasses.dataclass
 class ChassisAttributes(Attributes):
+    __slots__ = ()
+
     def __init__(self, manufacturer: Optional[str] = None, type: Optional[str] = None, serial: Optional[str] = None,
                  model: Optional[str] = None, bootloader: Optional[str] = None, firmware: Optional[str] = None):
         super().__init__(
@@ -317,6 +399,8 @@ class ChassisAttributes(Attributes):
 
 @dataclasses.dataclass
 class SupportAttributes(Attributes):
+    __slots__ = ()
+
     def __init__(self, name: Optional[str] = None, id: Optional[str] = None, phonehome_enabled: Optional[bool] = None,
                  remote_assist_active: Optional[bool] = None):
         super().__init__(
@@ -332,6 +416,8 @@ class SupportAttributes(Attributes):
 
 @dataclasses.dataclass
 class DNSAttributes(Attributes):
+    __slots__ = ()
+
     def __init__(self, name: [str], domain: Optional[str] = None, nameservers: Optional[str] = None):
         super().__init__(
             path=["software", "os", "DNS"],
@@ -344,6 +430,8 @@ class DNSAttributes(Attributes):
 
 
 class SMTPAttributes(Attributes):
+    __slots__ = ()
+
     def __init__(self, name: Optional[str] = None, relay_host: Optional[str] = None,
                  sender_domain: Optional[str] = None):
         super().__init__(
@@ -356,120 +444,100 @@ class SMTPAttributes(Attributes):
         )
 
 
-@dataclasses.dataclass
-class DriveController(TableRow):
+class DriveController(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "storage", "controller")
+    key_column_names = ("name",)
+    inventory_column_names = ("Manufacturer", "model", "serial", "Type", "bootloader", "firmware")
+
     def __init__(self, name: str, manufacturer: Optional[str] = None, type: Optional[str] = None,
                  serial: Optional[str] = None,
                  model: Optional[str] = None, bootloader: Optional[str] = None, firmware: Optional[str] = None):
         super().__init__(
-            path=["hardware", "storage", "controller"],
-            key_columns={
-                "name": name,
-            },
-            inventory_columns={
-                "Manufacturer": manufacturer,
-                "model": model,
-                "serial": serial,
-                "Type": type,
-                "bootloader": bootloader,
-                "firmware": firmware,
-            }
+            (name,),
+            (manufacturer, model, serial, type, bootloader, firmware),
         )
 
 
-@dataclasses.dataclass
-class BackplaneTableRow(TableRow):
+class BackplaneTableRow(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "components", "backplanes")
+    key_column_names = ("index", "name")
+    inventory_column_names = ("model", "serial", "type")
+
     def __init__(self, index: int, name: str, model: Optional[str] = None, serial: Optional[str] = None,
                  type: Optional[str] = None):
         super().__init__(
-            path=["hardware", "components", "backplanes"],
-            key_columns={
-                "index": index,
-                "name": name,
-            },
-            inventory_columns={
-                "model": model,
-                "serial": serial,
-                "type": type,
-            }
+            (index, name),
+            (model, serial, type),
         )
 
 
-@dataclasses.dataclass
-class FanTableRow(TableRow):
+class FanTableRow(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "components", "fans")
+    key_column_names = ("index", "name")
+    inventory_column_names = ("model", "serial", "type")
+
     def __init__(self, index: int, name: str, model: Optional[str] = None, serial: Optional[str] = None,
                  type: Optional[str] = None):
         super().__init__(
-            path=["hardware", "components", "fans"],
-            key_columns={
-                "index": index,
-                "name": name,
-            },
-            inventory_columns={
-                "model": model,
-                "serial": serial,
-                "type": type,
-            }
+            (index, name),
+            (model, serial, type),
         )
 
 
-@dataclasses.dataclass
-class SensorTableRow(TableRow):
+class SensorTableRow(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "components", "snsors")
+    key_column_names = ("index", "name")
+    inventory_column_names = ("model", "serial", "type")
+    status_column_names = ("temperature",)
+
     def __init__(self, index: int, name: str, model: Optional[str] = None, serial: Optional[str] = None,
                  type: Optional[str] = None, temperature: Optional[float] = None):
         super().__init__(
-            path=["hardware", "components", "snsors"],
-            key_columns={
-                "index": index,
-                "name": name,
-            },
-            inventory_columns={
-                "model": model,
-                "serial": serial,
-                "type": type,
-            },
-            status_columns={
-                "temperature": temperature
-            }
+            (index, name),
+            (model, serial, type),
+            (temperature,),
         )
 
 
-@dataclasses.dataclass
-class ManagementPortTableRow(TableRow):
+class ManagementPortTableRow(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "management_interface")
+    key_column_names = ("name",)
+    inventory_column_names = ("model", "serial", "type")
+
     def __init__(self, name: str, model: Optional[str] = None, serial: Optional[str] = None,
                  type: Optional[str] = None):
         super().__init__(
-            path=["hardware", "management_interface"],
-            key_columns={
-                "name": name,
-            },
-            inventory_columns={
-                "model": model,
-                "serial": serial,
-                "type": type,
-            }
+            (name,),
+            (model, serial, type),
         )
 
 
-@dataclasses.dataclass
-class OtherHardwareComponentTableRow(TableRow):
+class OtherHardwareComponentTableRow(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "components", "others")
+    key_column_names = ("name",)
+    inventory_column_names = ("model", "serial", "type")
+
     def __init__(self, name: str, model: Optional[str] = None, serial: Optional[str] = None,
                  type: Optional[str] = None):
         super().__init__(
-            path=["hardware", "components", "others"],
-            key_columns={
-                "name": name,
-            },
-            inventory_columns={
-                "model": model,
-                "serial": serial,
-                "type": type,
-            }
+            (name,),
+            (model, serial, type),
         )
 
 
-@dataclasses.dataclass
-class PSUTableRow(TableRow):
+class PSUTableRow(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "components", "psus")
+    key_column_names = ("index",)
+    inventory_column_names = ("description", "model", "serial")
+    status_column_names = ("voltage",)
+
     def __init__(
             self,
             index: int,
@@ -479,33 +547,25 @@ class PSUTableRow(TableRow):
             voltage: Optional[int] = None
     ):
         super().__init__(
-            path=["hardware", "components", "psus"],
-            key_columns={
-                "index": index
-            },
-            inventory_columns={
-                "description": description,
-                "model": model,
-                "serial": serial,
-            },
-            status_columns={
-                "voltage": voltage
-            }
+            (index,),
+            (description, model, serial),
+            (voltage,),
         )
 
 
-@dataclasses.dataclass
-class APIToken(TableRow):
+class APIToken(CompactTableRow):
+    __slots__ = ()
+    table_path = ("software", "os", "API_tokens")
+    key_column_names = ("name",)
+    inventory_column_names = ("created_at", "expires_at")
+
     def __init__(self, name: str, created_at: Optional[int] = None, expires_at: Optional[int] = None):
         super().__init__(
-            path=["software", "os", "API_tokens"],
-            key_columns={
-                "name": name,
-            },
-            inventory_columns={
-                "created_at": str(datetime.fromtimestamp(created_at)) if created_at is not None else None,
-                "expires_at": str(datetime.fromtimestamp(expires_at)) if expires_at is not None else None,
-            }
+            (name,),
+            (
+                str(datetime.fromtimestamp(created_at)) if created_at is not None else None,
+                str(datetime.fromtimestamp(expires_at)) if expires_at is not None else None,
+            ),
         )
 
 
@@ -575,19 +635,117 @@ class SpecialAgentResult:
         return dataclasses.asdict(self)
 
 
+@dataclasses.dataclass(slots=True)
+class InventoryTable:
+    """
+    InventoryTable holds the rows of an inventory table column by column. The path and the column names are stored
+    once, and the values are kept in one list per column, so the rows don't repeat them in memory or in the section.
+
+    >>> table = InventoryTable(["hardware", "volumes"], ["name"], ["size"])
+    >>> table.append(["vol1", 1024])
+    >>> table.append(["vol2", 2048])
+    >>> table.values
+    [['vol1', 'vol2'], [1024, 2048]]
+    >>> list(table.rows())[1]
+    TableRow(path=['hardware', 'volumes'], key_columns={'name': 'vol2'}, inventory_columns={'size': 2048}, \
+status_columns=None)
+    """
+    path: List[str]
+    key_columns: List[str]
+    inventory_columns: Optional[List[str]] = None
+    """The names of the inventory columns, or None if the rows have no inventory columns."""
+    status_columns: Optional[List[str]] = None
+    """The names of the status columns, or None if the rows have no status columns."""
+    values: List[List[any]] = dataclasses.field(default_factory=list)
+    """One list of values per column, in the order of the key, inventory and status columns."""
+
+    def __post_init__(self):
+        if not self.values:
+            columns = len(self.key_columns) + len(self.inventory_columns or []) + len(self.status_columns or [])
+            self.values = [[] for _ in range(columns)]
+
+    def append(self, values: Sequence[any]):
+        """
+        This function adds a row to the table.
+
+        :param values: The values of the row, in the order of the key, inventory and status columns.
+        """
+        for column, value in zip(self.values, values):
+            column.append(value)
+
+    def row_columns(self) -> Iterator[typing.Tuple[Dict[str, any], Optional[Dict[str, any]], Optional[Dict[str, any]]]]:
+        """
+        This function produces the key, inventory and status columns of each row as dicts.
+        """
+        keys = len(self.key_columns)
+        inventory_end = keys + len(self.inventory_columns or [])
+        for row in zip(*self.values):
+            yield (
+                dict(zip(self.key_columns, row[:keys])),
+                None if self.inventory_columns is None else dict(zip(self.inventory_columns, row[keys:inventory_end])),
+                None if self.status_columns is None else dict(zip(self.status_columns, row[inventory_end:])),
+            )
+
+    def rows(self) -> Iterator[TableRow]:
+        for key_columns, inventory_columns, status_columns in self.row_columns():
+            yield TableRow(list(self.path), key_columns, inventory_columns, status_columns)
+
+
 @dataclasses.dataclass
 class SpecialAgentInventory:
     inventory_attributes: List[Attributes] = dataclasses.field(default_factory=list)
     inventory_table_rows: List[TableRow] = dataclasses.field(default_factory=list)
+    """Table rows as sent by earlier versions of the special agent. Rows added now are stored in inventory_tables."""
+    inventory_tables: List[InventoryTable] = dataclasses.field(default_factory=list)
+
+    def __post_init__(self):
+        self._tables: Dict[typing.Hashable, InventoryTable] = {}
 
     def add_attributes(self, attributes: Attributes) -> SpecialAgentInventory:
         self.inventory_attributes.append(attributes)
         return self
 
     def add_table_row(self, table_row: TableRow) -> SpecialAgentInventory:
-        self.inventory_table_rows.append(table_row)
+        """
+        This function adds the row to the table with the same path and columns. Compact rows are added without building
+        their column dicts.
+        """
+        if isinstance(table_row, CompactTableRow):
+            schema = type(table_row)
+            values = table_row.column_values()
+        else:
+            schema = (
+                tuple(table_row.path),
+                tuple(table_row.key_columns),
+                None if table_row.inventory_columns is None else tuple(table_row.inventory_columns),
+                None if table_row.status_columns is None else tuple(table_row.status_columns),
+            )
+            values = [
+                *table_row.key_columns.values(),
+                *(table_row.inventory_columns or {}).values(),
+                *(table_row.status_columns or {}).values(),
+            ]
+        table = self._tables.get(schema)
+        if table is None:
+            table = InventoryTable(
+                list(table_row.path),
+                list(table_row.key_columns),
+                None if table_row.inventory_columns is None else list(table_row.inventory_columns),
+                None if table_row.status_columns is None else list(table_row.status_columns),
+            )
+            self._tables[schema] = table
+            self.inventory_tables.append(table)
+        table.append(values)
         return self
 
+    def table_rows(self) -> Iterator[TableRow]:
+        """
+        This function produces all table rows of the inventory.
+        """
+        yield from self.inventory_table_rows
+        for table in self.inventory_tables:
+            yield from table.rows()
+
     def to_dict(self):
         return dataclasses.asdict(self)
 
@@ -604,6 +762,11 @@ class CheckmkSection:
     <<<linux_usbstick>>>
     Hello world!
     <BLANKLINE>
+    >>> section = CheckmkSection("linux_usbstick", "Hello world!", (1700000000, 300))
+    >>> print(str(section))
+    <<<linux_usbstick:cached(1700000000,300)>>>
+    Hello world!
+    <BLANKLINE>
     """
 
     """
@@ -615,13 +778,35 @@ class CheckmkSection:
     This field can hold any data structure as long as it can be converted to a string.
     """
     data: any
+    """
+    This field holds the time the data was collected at and the interval in seconds it is valid for, if the data is
+    reused for several runs. Checkmk then shows the age of the data.
+    """
+    cached: Optional[typing.Tuple[int, int]] = None
+
+    def write(self, stream: typing.TextIO):
+        """
+        This function writes the section to the stream in the Checkmk format. If the data is an iterator of lines, such
+        as the one returned by encode_section_lines(), each line is written as soon as it is produced.
+        """
+        header = self.id
+        if self.cached is not None:
+            header = f"{self.id}:cached({self.cached[0]},{self.cached[1]})"
+        stream.write(f"<<<{header}>>>\n")
+        if isinstance(self.data, typing.Iterator):
+            for line in self.data:
+                stream.write(line)
+                stream.write("\n")
+        else:
+            stream.write(f"{self.data}\n")
 
     def __str__(self):
         """
         This function produces a string in the Checkmk format.
         """
-        nl = '\n'
-        return f"<<<{self.id}>>>{nl}{str(self.data)}{nl}"
+        buffer = io.StringIO()
+        self.write(buffer)
+        return buffer.getvalue()
 
 
 @dataclasses.dataclass
@@ -654,6 +839,16 @@ class AbstractSpecialAgentConfiguration(abc.ABC):
         return self.to_json()
 
 
+section_format_header = "purestorage-section"
+section_format_version = 2
+section_format_zlib = "zlib"
+section_line_bytes = 48 * 1024
+"""
+This is the number of compressed bytes encoded per line of a section. It is a multiple of 3, so the lines can be
+base64-decoded as one string.
+"""
+
+
 @dataclasses.dataclass
 class AbstractSpecialAgentSection(abc.ABC):
     """
@@ -671,20 +866,223 @@ class AbstractSpecialAgentSection(abc.ABC):
         return from_dict(data, cls)
 
     def toJSON(self):
-        return json.dumps(self.to_dict())
+        return to_json(self)
 
     def to_section(self) -> str:
-        return base64.b64encode(self.toJSON().encode('ascii')).decode('ascii')
+        """
+        This function encodes the section, see encode_section().
+        """
+        return encode_section({field.name: getattr(self, field.name) for field in dataclasses.fields(self)})
 
     @classmethod
     def from_section(cls, data: str):
-        data = json.loads(base64.b64decode(data))
-        return cls.from_dict(data)
+        """
+        This function decodes a section produced by to_section(), see decode_section().
+        """
+        return cls.from_dict(decode_section(data))
+
+    @classmethod
+    def from_string_table(cls, string_table: List[List[str]]):
+        """
+        This function decodes the section from the string table Checkmk passes to the parse function.
+        """
+        return cls.from_section(string_table_to_section(string_table))
 
     def __str__(self):
         return self.to_section()
 
 
+_json_fields: Dict[type, typing.Tuple[str, ...]] = {}
+
+
+def _json_default(o: any) -> Dict[str, any]:
+    """
+    This function is the fallback of the JSON encoder for objects it can't serialize itself. Dataclasses are serialized
+    as a dict of their fields. The values are not copied, so nested dicts and lists are written by the encoder
+    directly.
+    """
+    cls = type(o)
+    try:
+        names = _json_fields[cls]
+    except KeyError:
+        if not dataclasses.is_dataclass(cls):
+            raise TypeError(f"Object of type {cls.__name__} is not JSON serializable") from None
+        names = tuple(field.name for field in dataclasses.fields(cls))
+        _json_fields[cls] = names
+    return {name: getattr(o, name) for name in names}
+
+
+def to_json(data: any) -> str:
+    """
+    This function serializes data, which may contain dataclasses such as Result, Metric, Attributes and TableRow, to
+    JSON. The result is the same as json.dumps(dataclasses.asdict(data)) without copying the data first.
+
+    >>> to_json({"Array 1": Metric(70.0, (80.0, 90.0), (0, 100))})
+    '{"Array 1": {"value": 70.0, "levels": [80.0, 90.0], "boundaries": [0, 100]}}'
+    >>> to_json(Result(State.WARN, summary="too full"))
+    '{"state": 1, "summary": "too full", "details": null, "notice": null}'
+    """
+    return json.dumps(data, default=_json_default, check_circular=False)
+
+
+def encode_section_lines(
+        items: Iterable[typing.Tuple[str, any]],
+        line_bytes: int = section_line_bytes
+) -> Iterator[str]:
+    """
+    This function encodes the JSON object made of the passed key-value pairs as a header line naming the format,
+    followed by lines with the zlib-compressed JSON data in base64. The values may contain dataclasses, see to_json().
+
+    The items are serialized and compressed one at a time while the lines are consumed, and a line is produced as soon
+    as enough compressed data is available. If items is a generator, only one value has to be held in memory at a
+    time. The header is produced before the first item is requested, so a generator that may fail while producing an
+    item would leave a truncated section behind. Pass a list of the items in that case.
+
+    >>> lines = list(encode_section_lines({"array": {"services": {}}}.items()))
+    >>> lines[0]
+    'purestorage-section 2 zlib'
+    >>> decode_section("\\n".join(lines))
+    {'array': {'services': {}}}
+    """
+    yield f"{section_format_header} {section_format_version} {section_format_zlib}"
+    compressor = zlib.compressobj()
+    pending = bytearray()
+    separator = "{"
+    for key, value in items:
+        data = f"{separator}{json.dumps(key)}: {to_json(value)}"
+        separator = ", "
+        for start in range(0, len(data), line_bytes):
+            pending += compressor.compress(data[start:start + line_bytes].encode('ascii'))
+        del data
+        while len(pending) >= line_bytes:
+            yield base64.b64encode(pending[:line_bytes]).decode('ascii')
+            del pending[:line_bytes]
+    pending += compressor.compress(b"{}" if separator == "{" else b"}")
+    pending += compressor.flush()
+    for start in range(0, len(pending), line_bytes):
+        yield base64.b64encode(pending[start:start + line_bytes]).decode('ascii')
+
+
+def encode_section(data: Dict[str, any]) -> str:
+    """
+    This function encodes JSON data as a string, see encode_section_lines().
+    """
+    return "\n".join(encode_section_lines(data.items()))
+
+
+def decode_section(data: str) -> Dict[str, any]:
+    """
+    This function decodes the data of a section produced by AbstractSpecialAgentSection.to_section() into plain JSON
+    data. Sections without a header line are decoded as base64-encoded JSON, as produced by earlier versions of the
+    special agent.
+
+    :raises ValueError: If the section has an unknown format.
+    """
+    lines = data.strip().splitlines()
+    if len(lines) == 1:
+        return json.loads(base64.b64decode(lines[0]))
+    header = lines[0].split()
+    if len(header) != 3 or header[0] != section_format_header:
+        raise ValueError("Invalid section data")
+    if header[1] != str(section_format_version) or header[2] != section_format_zlib:
+        raise ValueError(f"Unsupported section format {header[1]} ({header[2]})")
+    return json.loads(zlib.decompress(base64.b64decode("".join(lines[1:]))))
+
+
+def string_table_to_section(string_table: List[List[str]]) -> str:
+    """
+    This function restores the section data from the string table Checkmk passes to the parse function.
+    """
+    return "\n".join(" ".join(row) for row in string_table)
+
+
+class IndexedResultsSection:
+    """
+    IndexedResultsSection is the form of a results section the check plugins work with. When the section is parsed, it
+    indexes the services and metrics of all subsystems by item, but keeps them as plain JSON data. A Result or Metric is
+    only decoded when its item is checked for the first time, so checking an item costs the same regardless of how
+    many subsystems and services the section contains. An item may be reported by several subsystems, e.g. a drive bay
+    by the hardware and the drives, and the check reports the results of all of them.
+    """
+
+    def __init__(self, data: Dict[str, Dict[str, Dict[str, any]]]):
+        """
+        :param data: The JSON data of a results section, mapping each subsystem to a serialized SpecialAgentResult.
+        """
+        self._entries: Dict[str, List[typing.Tuple[Optional[Dict[str, any]], Optional[Dict[str, any]]]]] = {}
+        for result in data.values():
+            services = result.get("services", {})
+            metrics = result.get("metrics", {})
+            for item in itertools.chain(services.keys(), (item for item in metrics.keys() if item not in services)):
+                self._entries.setdefault(item, []).append((services.get(item), metrics.get(item)))
+        self._decoded: Dict[str, List[typing.Tuple[Optional[Result], Optional[Metric]]]] = {}
+
+    @classmethod
+    def from_string_table(cls, string_table: List[List[str]]) -> IndexedResultsSection:
+        return cls(decode_section(string_table_to_section(string_table)))
+
+    def items(self) -> typing.Iterable[str]:
+        """
+        :return: All items with a service or a metric, in the order of the section.
+        """
+        return self._entries.keys()
+
+    def results(self, item: str) -> List[typing.Tuple[Optional[Result], Optional[Metric]]]:
+        """
+        :return: The service and the metric of the item for each subsystem that reports the item, in the order of the
+            section. Either of them may be None. The list is empty if the item is not in the section.
+        """
+        if item not in self._decoded:
+            entries = self._entries.get(item)
+            if entries is None:
+                return []
+            self._decoded[item] = [
+                (
+                    from_dict(service, Result) if service is not None else None,
+                    from_dict(metric, Metric) if metric is not None else None,
+                )
+                for service, metric in entries
+            ]
+        return self._decoded[item]
+
+
+def legacy_results_sections(
+        sections: Sequence[Optional[IndexedResultsSection]],
+        legacy: Optional[IndexedResultsSection],
+) -> Sequence[Optional[IndexedResultsSection]]:
+    """
+    This function returns the sections the check plugins read the results from. Older versions of the special agent
+    sent the results of all subsystems in a single section. It is only used if none of the sections per subsystem is
+    present, e.g. for the output of an older agent right after an upgrade, so no result is reported twice.
+    """
+    if legacy is not None and all(section is None for section in sections):
+        return [legacy]
+    return sections
+
+
+def indexed_items(sections: typing.Iterable[Optional[IndexedResultsSection]]) -> List[str]:
+    """
+    This function returns the items of the sections a special agent sent, each item only once, even if several
+    sections report it. Sections that are missing, for example because the subsystem failed, are None.
+    """
+    items: Dict[str, None] = {}
+    for section in sections:
+        if section is not None:
+            items.update(dict.fromkeys(section.items()))
+    return list(items.keys())
+
+
+def indexed_results(
+        item: str,
+        sections: typing.Iterable[Optional[IndexedResultsSection]]
+) -> List[typing.Tuple[Optional[Result], Optional[Metric]]]:
+    """
+    This function returns the service and the metric of an item from every section that reports the item, in the
+    order of the sections. Sections that are missing are None.
+    """
+    return [result for section in sections if section is not None for result in section.results(item)]
+
+
 class ErrorResponseException(Exception):
     """
     This is an exception that gets raised when the response from the pypureclient library is an
@@ -726,74 +1124,1552 @@ class CheckResponse(typing.Generic[T]):
         return response
 
 
-def _from_type(data, target: typing.Type, origin, args):
-    if origin == dict:
-        # Dict
-        value_type = args[1]
-        origin = typing.get_origin(value_type)
-        args = typing.get_args(value_type)
-        result = {}
-        for key in data:
-            result[key] = _from_type(data[key], value_type, origin, args)
-        return result
-    elif origin == list:
-        # List
-        value_type = args[0]
-        origin = typing.get_origin(value_type)
-        args = typing.get_args(value_type)
-        result = []
-        for value in data:
-            result.append(_from_type(value, value_type, origin, args))
-        return result
-    elif origin == tuple:
-        i = 0
-        result = []
-        for arg in args:
-            new_origin = typing.get_origin(arg)
-            new_args = typing.get_args(arg)
-            result.append(_from_type(data[i], arg, new_origin, new_args))
-            i += 1
-        return tuple(result)
-    elif origin == typing.Union:
-        # Optional, we don't support union
-        new_target = args[0]
-        origin = typing.get_origin(new_target)
-        args = typing.get_args(new_target)
-        if data is None:
-            return None
-        return _from_type(data, new_target, origin, args)
-    elif inspect.isclass(target) and issubclass(target, enum.Enum):
-        # Enums
-        for key in target:
-            if data == key.value:
-                return key
-        raise Exception("Invalid value %v for %T", data, target)
-    elif target not in [str, int, bool, float, any]:
-        # Dataclass
-        result = {}
-        # noinspection PyDataclass
-        try:
-            fs = dataclasses.fields(target)
-            type_hints = typing.get_type_hints(target)
-        except TypeError as e:
-            raise Exception(f"{pprint.pformat(target)} is not a dataclass") from e
-        for field in fs:
-            if field.name in data:
-                type_hint = type_hints[field.name]
-                if field.type not in [str, int, bool, float]:
-                    origin = typing.get_origin(type_hint)
-                    args = typing.get_args(type_hint)
-                    data[field.name] = _from_type(data[field.name], type_hint, origin, args)
-                result[field.name] = data[field.name]
-        return target(**result)
-    else:
-        return data
+def page_items(response: ValidResponse) -> typing.List:
+    """
+    This function returns the items of a single page of a paginated response. The item iterator of a pypureclient
+    response stops at the end of the page unless the response reports more items remaining. In that case it requests
+    further pages on its own if the page is shorter than the requested limit, which duplicates the requests and items of
+    data sources that follow the continuation token themselves, so the page is read from the iterator instead.
+    :raises UnsupportedClientException: If more items remain and the iterator does not hold the page it was created with.
+    """
+    if not getattr(response, "more_items_remaining", False):
+        return list(response.items)
+    items = getattr(response.items, "_items", None)
+    if not isinstance(items, (list, tuple)):
+        raise UnsupportedClientException("The item iterator of the response does not hold the page it was created with")
+    return list(items)
 
 
-def from_dict(data: dict, target: typing.Type[dataclasses.dataclass]):
+class ModelRecord:
+    """
+    ModelRecord is the base class of the records the data sources keep instead of the pypureclient models. A record is a
+    slotted dataclass declaring only the attributes of a model the collectors read, so the items kept for a run carry
+    neither the unused attributes nor the validation machinery of the models. Use project() to create a record from a
+    model.
+
+    >>> @dataclasses.dataclass(slots=True)
+    ... class VolumeRecord(ModelRecord):
+    ...     name: Optional[str] = None
+    ...     connection_count: Optional[int] = None
+    >>> class Volume:
+    ...     name = "vol1"
+    ...     serial = "0123456789ABCDEF"
+    >>> project(Volume(), VolumeRecord)
+    VolumeRecord(name='vol1', connection_count=None)
+    """
+    __slots__ = ()
+
+
+_projectors: Dict[typing.Any, typing.Callable[[any], any]] = {}
+"""
+This dictionary holds the projection function for each record type project() was called with, and for the types nested
+in them. Like the decoders of from_dict(), projectors are compiled once and concurrent callers at worst compile the same
+projector twice.
+"""
+
+
+def projector(target: typing.Any) -> typing.Callable[[any], any]:
+    """
+    This function returns the function turning a model into an instance of the target type, compiling it on first use.
+    Data sources projecting many items should call the returned function directly instead of project().
+    """
+    try:
+        return _projectors[target]
+    except KeyError:
+        pass
+    result = _compile_projector(target)
+    _projectors[target] = result
+    return result
+
+
+def _compile_projector(target: typing.Any) -> typing.Callable[[any], any]:
+    """
+    This function builds the projection function for the target type. Dataclass fields are read from the attribute of
+    the model with the same name, and attributes the model does not have or has not set are None. Fields holding a
+    dataclass, or a list of dataclasses, are projected recursively. All other values are taken over as-is.
+    """
     origin = typing.get_origin(target)
     args = typing.get_args(target)
-    return _from_type(data, target, origin, args)
+    if origin == typing.Union:
+        # Optional, we don't support union
+        return projector([arg for arg in args if arg is not type(None)][0])
+    elif origin == list:
+        item_projector = projector(args[0])
+        if item_projector is _identity:
+            return _identity
+        return lambda value: None if value is None else [item_projector(item) for item in value]
+    elif not dataclasses.is_dataclass(target):
+        return _identity
+    type_hints = typing.get_type_hints(target)
+    names = tuple(field.name for field in dataclasses.fields(target))
+    field_projectors = tuple(projector(type_hints[name]) for name in names)
+    if all(field_projector is _identity for field_projector in field_projectors):
+        # pypureclient models raise an AttributeError for unset attributes.
+        return lambda model: None if model is None else target(*[getattr(model, name, None) for name in names])
+
+    def project_dataclass(model):
+        if model is None:
+            return None
+        return target(*[
+            field_projector(getattr(model, name, None))
+            for name, field_projector in zip(names, field_projectors)
+        ])
+
+    return project_dataclass
+
+
+def project(model: any, target: typing.Type[T]) -> T:
+    """
+    This function creates an instance of the target dataclass, usually a ModelRecord, from the attributes of a model
+    with the same names as its fields. A model of None results in None.
+    """
+    return projector(target)(model)
+
+
+class Prefetchable(abc.ABC):
+    """
+    Prefetchable is implemented by data sources that can fill their cache ahead of time.
+    """
+
+    @abc.abstractmethod
+    def prefetch(self) -> None:
+        """
+        This function fetches the data of the data source. It must not raise an exception, failures must be kept until
+        the data is queried.
+        """
+        pass
+
+
+def prefetch(data_sources: typing.Iterable[Prefetchable], workers: int) -> None:
+    """
+    This function fills the passed data sources concurrently using a thread pool of at most the specified number of
+    workers. Since each data source keeps its own failure, one failing data source does not affect the others.
+
+    :param data_sources: The data sources to fill.
+    :param workers: The maximum number of concurrent requests.
+    """
+    data_sources = list(data_sources)
+    if len(data_sources) == 0:
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(data_sources)))) as executor:
+        for future in [executor.submit(_profiled, data_source.prefetch) for data_source in data_sources]:
+            future.result()
+
+
+def paginate_by_offset(
+        query: typing.Callable[[int], typing.Any],
+        workers: int,
+) -> typing.Iterator:
+    """
+    This function fetches all pages of a list endpoint by offset. It fetches the first page, reads the total number of
+    items from the response and then fetches the remaining pages concurrently, keeping at most the specified number of
+    requests in flight. The items are returned in the order of the pages.
+
+    Unlike continuation tokens, offsets do not refer to a snapshot of the collection. If items are added or removed
+    while the pages are fetched, an item may be returned twice or not at all. If the response does not contain the
+    total number of items, the pages are fetched one after the other until a page is not full.
+
+    :param query: Function requesting the page starting at the passed offset. It must pass the same limit every time.
+    :param workers: The maximum number of concurrent requests.
+    :return: An iterator over the items of all pages.
+    """
+    resp = CheckResponse(query(0))
+    items = page_items(resp)
+    yield from items
+    step = len(items)
+    total = resp.total_item_count
+    if step == 0 or (total is not None and step >= total):
+        return
+    if total is None:
+        offset = step
+        while len(items) == step:
+            items = page_items(CheckResponse(query(offset)))
+            offset += len(items)
+            yield from items
+        return
+    offsets = iter(range(step, total, step))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = collections.deque(
+            executor.submit(_profiled, query, offset) for offset in itertools.islice(offsets, max(1, workers))
+        )
+        while len(pending) > 0:
+            resp = CheckResponse(pending.popleft().result())
+            offset = next(offsets, None)
+            if offset is not None:
+                pending.append(executor.submit(_profiled, query, offset))
+            yield from page_items(resp)
+
+
+class Tracer:
+    """
+    Tracer records the spans of a special agent run in the Chrome trace event format, which Perfetto and
+    chrome://tracing can load. Each span is recorded on the thread it ran on, so the requests of the prefetch workers
+    are shown next to the collectors and the writing of the sections.
+
+    >>> tracer = Tracer()
+    >>> with tracer.span("Client bootstrap", "agent"):
+    ...     pass
+    >>> event = json.loads(tracer.to_json())["traceEvents"][-1]
+    >>> event["name"], event["cat"], event["ph"]
+    ('Client bootstrap', 'agent', 'X')
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._events: List[Dict[str, any]] = []
+        self._threads: Dict[int, str] = {}
+
+    def complete(
+            self,
+            name: str,
+            category: str,
+            start: float,
+            end: float,
+            args: Optional[Dict[str, any]] = None,
+    ) -> None:
+        """
+        This function records a span of the current thread.
+
+        :param start: The start of the span, as returned by time.perf_counter().
+        :param end: The end of the span, as returned by time.perf_counter().
+        :param args: Details shown with the span.
+        """
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self._start) * 1000000,
+            "dur": (end - start) * 1000000,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self._events.append(event)
+            self._threads[thread.ident] = thread.name
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str) -> Iterator[None]:
+        """
+        This function records the code run in the context as a span.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, category, start, time.perf_counter())
+
+    def lines(self, lines: Iterator[str], name: str) -> Iterator[str]:
+        """
+        This function passes the lines of a section through and records the production of each line as an encoding
+        span. Collectors that run while the lines are produced are shown inside these spans.
+        """
+        while True:
+            start = time.perf_counter()
+            try:
+                line = next(lines)
+            except StopIteration:
+                return
+            finally:
+                self.complete(name, "encode", start, time.perf_counter())
+            yield line
+
+    def stream(self, stream: typing.TextIO) -> typing.TextIO:
+        """
+        This function returns a proxy for the passed stream that records its writes and flushes as spans.
+        """
+        return typing.cast(typing.TextIO, _TracedStream(stream, self))
+
+    def to_json(self) -> str:
+        """
+        This function returns the trace as a JSON object in the Chrome trace event format.
+        """
+        with self._lock:
+            metadata = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": ident, "args": {"name": name}}
+                for ident, name in self._threads.items()
+            ]
+            return json.dumps({"traceEvents": metadata + self._events, "displayTimeUnit": "ms"})
+
+
+class _TracedStream:
+    def __init__(self, stream: typing.TextIO, tracer: Tracer):
+        self._stream = stream
+        self._tracer = tracer
+
+    def write(self, data: str) -> int:
+        start = time.perf_counter()
+        try:
+            return self._stream.write(data)
+        finally:
+            self._tracer.complete("write", "stdout", start, time.perf_counter(), {"characters": len(data)})
+
+    def flush(self) -> None:
+        start = time.perf_counter()
+        try:
+            self._stream.flush()
+        finally:
+            self._tracer.complete("flush", "stdout", start, time.perf_counter())
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+
+@dataclasses.dataclass
+class EndpointStats:
+    """
+    EndpointStats holds what the requests to one REST API endpoint cost in a special agent run.
+    """
+    requests: int = 0
+    """The number of calls of the client function, each of which requests one page."""
+    seconds: float = 0.0
+    """The time spent in the client calls, including the deserialization of the responses."""
+    pages: int = 0
+    """The number of calls that returned a page instead of an error."""
+    items: int = 0
+    """The number of items on the pages, i.e. the number of items deserialized."""
+    http_requests: int = 0
+    """The number of HTTP requests sent, including the retries of the client."""
+    bytes: int = 0
+    """The size of the HTTP response bodies received."""
+    retries: int = 0
+    """The number of HTTP requests the client repeated after an error, e.g. when the array was busy."""
+    throttled: int = 0
+    """The number of HTTP responses with status 429 (too many requests)."""
+
+
+class _CallStats:
+    __slots__ = ("http_requests", "bytes", "throttled")
+
+    def __init__(self):
+        self.http_requests = 0
+        self.bytes = 0
+        self.throttled = 0
+
+
+def _response_items(response) -> Optional[int]:
+    """
+    This function returns the number of items on the page of a response without iterating over them, see page_items().
+    """
+    if isinstance(response, ErrorResponse):
+        return None
+    items = getattr(response, "items", None)
+    items = getattr(items, "_items", items)
+    if not isinstance(items, typing.Sized):
+        return None
+    return len(items)
+
+
+class RequestCounter:
+    """
+    RequestCounter accounts for the REST API requests of a special agent run per endpoint: the number of calls, the time
+    they take, the pages and items received, and the HTTP requests, response bytes, retries and 429 responses below
+    them. The data sources receive the client returned by wrap(), so every request is counted regardless of which data
+    source sends it or in which thread.
+    """
+
+    def __init__(self, tracer: Optional[Tracer] = None):
+        """
+        :param tracer: The tracer to record each request as a span with, if the run is traced.
+        """
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, EndpointStats] = {}
+        self._local = threading.local()
+        self._tracer = tracer
+
+    def call(self, endpoint: str, function: typing.Callable[..., T], *args, **kwargs) -> T:
+        """
+        This function calls the function that requests a page of the endpoint and counts the request. The HTTP requests
+        the function sends through a client passed to wrap() in the same thread are counted for the endpoint.
+        """
+        call = _CallStats()
+        outer = getattr(self._local, "call", None)
+        self._local.call = call
+        response = None
+        start = time.perf_counter()
+        try:
+            response = function(*args, **kwargs)
+            return response
+        finally:
+            end = time.perf_counter()
+            self._local.call = outer
+            items = _response_items(response)
+            self._count(endpoint, end - start, call, items)
+            if self._tracer is not None:
+                self._tracer.complete(endpoint, "rest", start, end, {
+                    "items": items,
+                    "http_requests": call.http_requests,
+                    "bytes": call.bytes,
+                    "throttled": call.throttled,
+                })
+
+    def _count(self, endpoint: str, seconds: float, call: _CallStats, items: Optional[int]) -> None:
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = EndpointStats()
+                self._endpoints[endpoint] = stats
+            stats.requests += 1
+            stats.seconds += seconds
+            if items is not None:
+                stats.pages += 1
+                stats.items += items
+            stats.http_requests += call.http_requests
+            stats.bytes += call.bytes
+            stats.retries += max(0, call.http_requests - 1)
+            stats.throttled += call.throttled
+
+    def _http_response(self, body: Optional[typing.Union[bytes, str]], status: Optional[int]) -> None:
+        call: Optional[_CallStats] = getattr(self._local, "call", None)
+        if call is None:
+            return
+        call.http_requests += 1
+        call.bytes += len(body) if isinstance(body, (bytes, str)) else 0
+        if status == 429:
+            call.throttled += 1
+
+    def requests(self) -> Dict[str, int]:
+        """
+        :return: The number of requests sent so far per endpoint, keyed by the name of the client function.
+        """
+        with self._lock:
+            return {endpoint: stats.requests for endpoint, stats in self._endpoints.items()}
+
+    def endpoints(self) -> Dict[str, EndpointStats]:
+        """
+        :return: A copy of the statistics of the requests sent so far per endpoint, keyed by the name of the client
+            function.
+        """
+        with self._lock:
+            return {endpoint: dataclasses.replace(stats) for endpoint, stats in self._endpoints.items()}
+
+    def wrap(self, cli: T) -> T:
+        """
+        This function returns a proxy for the passed client that counts the calls to its get_* functions. The HTTP
+        requests of the client are counted from then on, including those sent by a RawClient of the same client.
+        """
+        self._hook(cli)
+        return typing.cast(T, _CountingClient(cli, self))
+
+    def _hook(self, cli) -> None:
+        """
+        This function counts the HTTP requests the client sends by replacing the request function of its internal API
+        client. If the client lacks these internals, only the HTTP counters stay at zero. The attributes of the responses
+        are read the same way, so a response lacking one of them is still counted.
+        """
+        api_client = getattr(cli, "_api_client", None)
+        if api_client is None or getattr(api_client, "_request_counter", None) is not None:
+            return
+        request = getattr(api_client, "request", None)
+        if not callable(request):
+            logging.debug(f"Not counting the HTTP requests of {type(cli).__name__}, its API client has no request()")
+            return
+
+        def counted_request(*args, **kwargs):
+            try:
+                response = request(*args, **kwargs)
+            except ApiException as e:
+                self._http_response(getattr(e, "body", None), getattr(e, "status", None))
+                raise
+            self._http_response(getattr(response, "data", None), getattr(response, "status", None))
+            return response
+
+        try:
+            api_client.request = counted_request
+        except AttributeError as e:
+            logging.debug(f"Not counting the HTTP requests of {type(cli).__name__} ({e.__str__()})")
+            return
+        api_client._request_counter = self
+
+
+class _CountingClient:
+    def __init__(self, cli, counter: RequestCounter):
+        self._cli = cli
+        self._counter = counter
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._cli, name)
+        if not name.startswith("get_") or not callable(attr):
+            return attr
+
+        def counted(*args, **kwargs):
+            return self._counter.call(name, attr, *args, **kwargs)
+
+        return counted
+
+
+@dataclasses.dataclass
+class RawResponse:
+    """
+    RawResponse holds a page of a list endpoint returned by RawClient. The items are the parsed JSON objects, so the
+    response can be used with page_items(), CheckResponse() and paginate_by_offset() like a pypureclient response.
+    """
+    items: List[Dict[str, any]]
+    continuation_token: Optional[str] = None
+    total_item_count: Optional[int] = None
+
+
+class UnsupportedClientException(Exception):
+    """
+    This is an exception that gets raised when pypureclient lacks the internals RawClient, SessionCache or page_items()
+    rely on, e.g. because a newer version of the library changed them.
+    """
+
+
+class RawClient:
+    """
+    RawClient sends GET requests through the connection pool, the session token and the retry handling of a pypureclient
+    client, but returns the parsed JSON of the response instead of models. Turning large responses into models takes
+    most of the CPU time of a run, while the data sources only keep a few attributes of each item.
+
+    These are internals of pypureclient, so the versions of the library the plugin supports are pinned in
+    requirements.txt, and a client lacking any of them is rejected. Use create() to fall back to the models then.
+
+    Example:
+
+        raw = RawClient(cli)
+        resp = CheckResponse(raw.get("volumes", limit=1000))
+        volumes = [from_dict(item, VolumeRecord) for item in page_items(resp)]
+    """
+
+    _client_attributes = ("_api_client", "_timeout", "_call_with_retries", "_create_error_response")
+
+    def __init__(self, cli, counter: Optional[RequestCounter] = None):
+        """
+        :param cli: The pypureclient client to send the requests with. It must not be wrapped by a RequestCounter.
+        :param counter: The counter the requests are counted with, named like the matching function of the client.
+        :raises UnsupportedClientException: If the client lacks an internal RawClient relies on, or its REST API version
+            can't be determined.
+        """
+        missing = [name for name in self._client_attributes if not hasattr(cli, name)]
+        if len(missing) == 0 and not hasattr(cli._api_client, "call_api"):
+            missing.append("_api_client.call_api")
+        if len(missing) > 0:
+            raise UnsupportedClientException(
+                f"{type(cli).__module__}.{type(cli).__name__} lacks {', '.join(missing)}"
+            )
+        version = _client_version(cli)
+        if version is None:
+            raise UnsupportedClientException(
+                f"The REST API version of {type(cli).__module__}.{type(cli).__name__} is unknown"
+            )
+        self._cli = cli
+        self._counter = counter
+        self._version = version
+        if counter is not None:
+            counter._hook(cli)
+
+    @classmethod
+    def create(cls, cli, counter: Optional[RequestCounter] = None) -> Optional[RawClient]:
+        """
+        This function returns a RawClient for the client, or None if the client is not supported, so the data sources
+        request the models instead.
+        """
+        try:
+            return cls(cli, counter)
+        except UnsupportedClientException as e:
+            logging.warning(f"Requesting JSON is not supported by the installed pypureclient, using models ({e})")
+            return None
+
+    def get(self, path: str, **params) -> typing.Union[RawResponse, ErrorResponse]:
+        """
+        This function requests a list endpoint.
+
+        :param path: The path of the endpoint below the versioned API root, e.g. "network-interfaces/port-details".
+        :param params: The query parameters. Parameters that are None are not sent.
+        :return: The response, or an ErrorResponse if the request failed.
+        """
+        if self._counter is None:
+            return self._get(path, params)
+        return self._counter.call("get_" + path.replace("/", "_").replace("-", "_"), self._get, path, params)
+
+    def _get(self, path: str, params: Dict[str, any]) -> typing.Union[RawResponse, ErrorResponse]:
+        query_params = [(name, value) for name, value in params.items() if value is not None]
+        api_client = self._cli._api_client
+
+        def request():
+            return api_client.call_api(
+                f"/api/{self._version}/{path}",
+                "GET",
+                query_params=query_params,
+                header_params={"Accept": "application/json", "X-Request-ID": str(uuid.uuid4())},
+                response_types_map={},
+                _request_timeout=self._cli._timeout,
+            )
+
+        try:
+            response = self._cli._call_with_retries(request)
+        except ApiException as e:
+            return self._cli._create_error_response(e)
+        data = json.loads(response.raw_data)
+        return RawResponse(data.get("items", []), data.get("continuation_token"), data.get("total_item_count"))
+
+
+@dataclasses.dataclass
+class AgentStatsSection(AbstractSpecialAgentSection):
+    """
+    This class holds the measurements of a special agent run, see AgentStats. All durations are in seconds.
+    """
+    runtime: float
+    """The time from the start of the special agent until the last section was written."""
+    runtime_levels: typing.Tuple[Optional[float], Optional[float]] = (None, None)
+    steps: Dict[str, float] = dataclasses.field(default_factory=dict)
+    """The duration of the steps of a run that are not bound to a section, e.g. creating the client."""
+    endpoints: Dict[str, EndpointStats] = dataclasses.field(default_factory=dict)
+    collectors: Dict[str, float] = dataclasses.field(default_factory=dict)
+    """The duration of each collector that ran, including the requests it sent itself."""
+    sections: Dict[str, float] = dataclasses.field(default_factory=dict)
+    """The time spent encoding and writing each section, excluding the collectors that ran meanwhile."""
+
+    def to_dict(self) -> Dict[str, any]:
+        return dataclasses.asdict(self)
+
+    def performance(self) -> typing.Tuple[Result, Dict[str, Metric]]:
+        """
+        This function turns the measurements into the result and the metrics of the agent performance service. The
+        state depends on the runtime, the details list where the time went.
+
+        >>> result, metrics = AgentStatsSection(
+        ...     runtime=50.0,
+        ...     runtime_levels=(45.0, 55.0),
+        ...     endpoints={"get_volumes": EndpointStats(requests=2, seconds=1.5)},
+        ... ).performance()
+        >>> result.state, result.summary
+        (<State.WARN: 1>, 'Runtime 50.00 s, 2 requests (warn/crit at 45.00 s/55.00 s)')
+        >>> metrics["get_volumes_seconds"]
+        Metric(value=1.5, levels=(None, None), boundaries=(0, None))
+        """
+        warn, crit = self.runtime_levels
+        state = State.OK
+        if crit is not None and self.runtime >= crit:
+            state = State.CRIT
+        elif warn is not None and self.runtime >= warn:
+            state = State.WARN
+        summary = f"Runtime {self.runtime:.2f} s, {sum(stats.requests for stats in self.endpoints.values())} requests"
+        retries = sum(stats.retries for stats in self.endpoints.values())
+        if retries > 0:
+            summary += f", {retries} retries"
+        if state != State.OK:
+            summary += f" (warn/crit at {warn:.2f} s/{crit:.2f} s)"
+
+        details = [f"{name}: {seconds:.3f} s" for name, seconds in self.steps.items()]
+        for endpoint, stats in sorted(self.endpoints.items(), key=lambda item: item[1].seconds, reverse=True):
+            details.append(
+                f"{endpoint}: {stats.requests} requests, {stats.pages} pages, {stats.items} items, "
+                f"{format_bytes(stats.bytes)}, {stats.retries} retries, {stats.throttled} throttled, "
+                f"{stats.seconds:.3f} s"
+            )
+        for name, seconds in self.collectors.items():
+            details.append(f"Collector {name}: {seconds:.3f} s")
+        for section_id, seconds in self.sections.items():
+            details.append(f"Section {section_id}: {seconds:.3f} s")
+
+        metrics = {"runtime": Metric(self.runtime, self.runtime_levels, (0, None))}
+        for endpoint, stats in self.endpoints.items():
+            metrics[f"{endpoint}_seconds"] = Metric(stats.seconds, boundaries=(0, None))
+            metrics[f"{endpoint}_bytes"] = Metric(stats.bytes, boundaries=(0, None))
+            metrics[f"{endpoint}_items"] = Metric(stats.items, boundaries=(0, None))
+        return Result(state, summary=summary, details="\n".join(details)), metrics
+
+    def report(self) -> str:
+        """
+        This function formats the counters of the endpoints as a table for the --stats option of the special agents.
+
+        >>> print(AgentStatsSection(
+        ...     runtime=1.5,
+        ...     endpoints={"get_volumes": EndpointStats(1, 0.25, 1, 1000, 2, 524288, 1, 1)},
+        ... ).report())
+        endpoint     requests  pages  items  http   bytes  retries  429  seconds
+        get_volumes         1      1   1000     2  524288        1    1    0.250
+        total               1      1   1000     2  524288        1    1    0.250
+        runtime 1.500 s
+        """
+        columns = ["requests", "pages", "items", "http_requests", "bytes", "retries", "throttled"]
+        headers = ["requests", "pages", "items", "http", "bytes", "retries", "429", "seconds"]
+        total = EndpointStats()
+        rows = []
+        for endpoint, stats in sorted(self.endpoints.items()):
+            rows.append([endpoint] + [str(getattr(stats, column)) for column in columns] + [f"{stats.seconds:.3f}"])
+            for column in columns + ["seconds"]:
+                setattr(total, column, getattr(total, column) + getattr(stats, column))
+        rows.append(["total"] + [str(getattr(total, column)) for column in columns] + [f"{total.seconds:.3f}"])
+        rows.insert(0, ["endpoint"] + headers)
+        widths = [max(len(row[i]) for row in rows) for i in range(len(headers) + 1)]
+        lines = [
+            "  ".join([row[0].ljust(widths[0])] + [value.rjust(width) for value, width in zip(row[1:], widths[1:])])
+            for row in rows
+        ]
+        lines.append(f"runtime {self.runtime:.3f} s")
+        return "\n".join(lines)
+
+
+class AgentStats:
+    """
+    AgentStats measures where the time of a special agent run goes: the steps before the sections are produced, the
+    requests per endpoint (through the RequestCounter of the run), each collector, and encoding and writing each
+    section. It is created when the run starts.
+    """
+
+    def __init__(self, requests: RequestCounter, tracer: Optional[Tracer] = None):
+        """
+        :param requests: The counter of the requests of the run.
+        :param tracer: The tracer to record the steps, collectors and sections as spans with, if the run is traced.
+        """
+        self._requests = requests
+        self._tracer = tracer
+        self._start = time.perf_counter()
+        self._steps: Dict[str, float] = {}
+        self._collectors: Dict[str, float] = {}
+        self._collecting = 0.0
+        self._sections: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        """
+        This function measures the duration of the code run in the context as the step with the passed name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._steps[name] = self._steps.get(name, 0.0) + end - start
+            if self._tracer is not None:
+                self._tracer.complete(name, "agent", start, end)
+
+    def collectors(self, collectors: Dict[str, typing.Callable[[], T]], prefix: str = "") -> Dict[
+        str, typing.Callable[[], T]
+    ]:
+        """
+        This function returns the passed collectors wrapped so that their durations are measured.
+
+        :param prefix: The prefix of the names the durations are reported with, e.g. to tell the inventory collectors
+            from the result collectors of the same name.
+        """
+
+        def measured(name: str, collect: typing.Callable[[], T]) -> typing.Callable[[], T]:
+            def collect_measured() -> T:
+                start = time.perf_counter()
+                try:
+                    return collect()
+                finally:
+                    end = time.perf_counter()
+                    self._collectors[name] = self._collectors.get(name, 0.0) + end - start
+                    self._collecting += end - start
+                    if self._tracer is not None:
+                        self._tracer.complete(name, "collector", start, end)
+
+            return collect_measured
+
+        return {name: measured(prefix + name, collect) for name, collect in collectors.items()}
+
+    def output(self, sections: Iterable[CheckmkSection]) -> Iterator[CheckmkSection]:
+        """
+        This function passes the sections through and measures how long the caller takes to write each of them. The
+        lines of a section may be encoded while it is written, so this is the time spent encoding and writing the
+        section. Collectors that run while the section is written are not included.
+        """
+        for section in sections:
+            if self._tracer is not None and isinstance(section.data, Iterator):
+                section = CheckmkSection(section.id, self._tracer.lines(section.data, section.id), section.cached)
+            collecting = self._collecting
+            start = time.perf_counter()
+            yield section
+            end = time.perf_counter()
+            self._sections[section.id] = end - start - (self._collecting - collecting)
+            if self._tracer is not None:
+                self._tracer.complete(section.id, "section", start, end)
+
+    def section(self, runtime_levels: typing.Tuple[Optional[float], Optional[float]]) -> AgentStatsSection:
+        """
+        This function returns the measurements of the run so far.
+        """
+        return AgentStatsSection(
+            runtime=time.perf_counter() - self._start,
+            runtime_levels=runtime_levels,
+            steps=dict(self._steps),
+            endpoints=self._requests.endpoints(),
+            collectors=dict(self._collectors),
+            sections=dict(self._sections),
+        )
+
+
+profile_environment_variable = "PURESTORAGE_CHECKMK_PROFILE"
+"""
+This environment variable enables profiling like the --profile option, e.g. for the runs Checkmk starts.
+"""
+profile_directory_environment_variable = "PURESTORAGE_CHECKMK_PROFILE_DIR"
+profile_modes = ("cpu", "memory", "trace")
+default_profile_top = 25
+
+
+def _profile_modes(value: str) -> typing.Tuple[str, ...]:
+    modes = tuple(mode.strip() for mode in value.split(",") if mode.strip() != "")
+    for mode in modes:
+        if mode not in profile_modes:
+            raise argparse.ArgumentTypeError(f"invalid profile mode {mode} (choose from {', '.join(profile_modes)})")
+    return modes
+
+
+def special_agent_argument_parser(platform: str) -> argparse.ArgumentParser:
+    """
+    This function returns the parser of the command line options of the special agents. Checkmk passes no options and
+    the configuration on the standard input, the options are meant for running a special agent by hand. Profiling can
+    also be enabled through environment variables, see profile_environment_variable.
+
+    :param platform: The name of the platform the special agent monitors, e.g. FlashArray.
+    """
+    parser = argparse.ArgumentParser(
+        description=f"Checkmk special agent for Pure Storage {platform}. It reads its configuration as JSON from the "
+                    f"standard input and writes the agent sections to the standard output."
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print the REST API requests, pages, items, bytes and retries per endpoint to the standard error",
+    )
+    parser.add_argument(
+        "--profile",
+        type=_profile_modes,
+        default=os.environ.get(profile_environment_variable, ""),
+        metavar="MODES",
+        help=f"profile the run: cpu writes a cProfile .prof file covering the main and the worker threads, memory a "
+             f"report of the top allocations and trace a Chrome trace of the requests, collectors and sections, "
+             f"several modes are separated by a comma "
+             f"(default: ${profile_environment_variable})",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=os.environ.get(profile_directory_environment_variable) or cache_directory("profiles"),
+        metavar="DIRECTORY",
+        help=f"directory to write the profiles to (default: ${profile_directory_environment_variable} or "
+             f"{cache_directory('profiles')})",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=default_profile_top,
+        metavar="N",
+        help=f"number of allocation sites in the memory report (default: {default_profile_top})",
+    )
+    return parser
+
+
+_worker_profiles: Optional[List[pstats.Stats]] = None
+"""
+This list collects the CPU profiles of the calls run in worker threads while profile() runs in the cpu mode, see
+_profiled().
+"""
+_worker_profiles_lock = threading.Lock()
+_worker_profiling = threading.local()
+
+
+def _profiled(function: typing.Callable[..., typing.Any], *args) -> typing.Any:
+    """
+    This function calls the function in a worker thread of prefetch() or paginate_by_offset(). Before Python 3.12,
+    cProfile only profiles the thread it was enabled in, so while profile() runs in the cpu mode, the call is profiled
+    on its own and its statistics are added to the profile of the run.
+    """
+    profiles = _worker_profiles
+    if profiles is None or getattr(_worker_profiling, "active", False):
+        return function(*args)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Since Python 3.12, the profiler of the run already covers all threads and no second one can be enabled.
+        return function(*args)
+    _worker_profiling.active = True
+    try:
+        return function(*args)
+    finally:
+        profiler.disable()
+        _worker_profiling.active = False
+        stats = pstats.Stats(profiler)
+        with _worker_profiles_lock:
+            profiles.append(stats)
+
+
+@contextlib.contextmanager
+def profile(
+        modes: Sequence[str],
+        directory: str,
+        name: str,
+        top: int = default_profile_top
+) -> Iterator[Optional[Tracer]]:
+    """
+    This function profiles the code run in the context. With the cpu mode, the statistics of cProfile are written to
+    <name>-<timestamp>.prof, which can be read with pstats or snakeviz. They include the requests run in the worker
+    threads of prefetch() and paginate_by_offset(). With the memory mode, the peak memory and the
+    top allocation sites traced by tracemalloc are written to <name>-<timestamp>-memory.txt. With the trace mode, the
+    context receives a Tracer to record spans with, and the trace is written to <name>-<timestamp>.trace.json. The
+    profiles are only written to files and failing to write them is logged, so the output of the special agent is not
+    affected.
+
+    :param modes: The profile modes, see profile_modes. Nothing is profiled without a mode.
+    :param directory: The directory to write the profiles to.
+    :param name: The start of the file names, e.g. the platform and the array host.
+    :param top: The number of allocation sites to report.
+    """
+    global _worker_profiles
+    if len(modes) == 0:
+        yield None
+        return
+    tracer = Tracer() if "trace" in modes else None
+    profiler = cProfile.Profile() if "cpu" in modes else None
+    if profiler is not None:
+        _worker_profiles = []
+    if "memory" in modes:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield tracer
+    finally:
+        worker_profiles = _worker_profiles
+        if profiler is not None:
+            profiler.disable()
+            _worker_profiles = None
+        base = os.path.join(
+            directory,
+            f"{re.sub('[^a-zA-Z0-9_.-]', '_', name)}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        )
+        try:
+            if profiler is not None:
+                stats = pstats.Stats(profiler)
+                with _worker_profiles_lock:
+                    if len(worker_profiles) > 0:
+                        stats.add(*worker_profiles)
+                write_private_file(f"{base}.prof", marshal.dumps(stats.stats))
+            if "memory" in modes:
+                write_private_file(f"{base}-memory.txt", _memory_report(top).encode("utf-8"))
+            if tracer is not None:
+                write_private_file(f"{base}.trace.json", tracer.to_json().encode("utf-8"))
+        except Exception as e:
+            logging.warning(f"Failed to write the profile {base} ({e.__str__()})")
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+
+def _memory_report(top: int) -> str:
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+    lines = [f"Peak traced memory: {format_bytes(peak)}, still allocated at the end: {format_bytes(current)}", ""]
+    lines.append(f"Top {top} allocation sites still allocated at the end of the run:")
+    lines.extend(str(statistic) for statistic in snapshot.statistics("lineno")[:top])
+    return "\n".join(lines) + "\n"
+
+
+def cache_directory(*parts: str) -> str:
+    """
+    This function returns the directory for data the special agents keep between runs. Inside a Checkmk site the
+    directory is located in the tmp directory of the site, otherwise in the temporary directory of the system. The
+    directory is created by write_private_file() when the first file is written.
+
+    :param parts: Path components below the cache directory, e.g. the platform and the array host.
+    :return: The absolute path of the directory.
+    """
+    omd_root = os.environ.get("OMD_ROOT")
+    if omd_root is not None and omd_root != "":
+        base = os.path.join(omd_root, "tmp", "check_mk", "purestorage")
+    else:
+        base = os.path.join(tempfile.gettempdir(), "purestorage_checkmk")
+    return os.path.join(base, *[re.sub("[^a-zA-Z0-9_.-]", "_", part) for part in parts])
+
+
+def check_private_directory(directory: str) -> None:
+    """
+    This function makes sure that the directory is a real directory owned by the current user and only accessible by
+    them (0700). The cache directory may be located in a temporary directory shared with other users, so files in a
+    directory another user could have created or can write to must not be trusted.
+    :raises PermissionError: If the directory is a symlink, belongs to another user or is accessible by others.
+    """
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o700:
+        raise PermissionError(
+            f"{directory} must be a directory owned by the current user with 0700 permissions "
+            f"(owner {st.st_uid}, mode {oct(stat.S_IMODE(st.st_mode))})"
+        )
+
+
+def write_private_file(path: str, data: bytes) -> None:
+    """
+    This function atomically replaces the file at the specified path with a file only accessible by the current user
+    (0600). Missing parent directories are created with 0700 permissions. The file is only written if its directory
+    passes check_private_directory().
+    """
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    check_private_directory(os.path.dirname(path))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class PersistentCache:
+    """
+    PersistentCache stores query results on disk so they can be reused by later runs of the special agent. Each entry
+    is stored as JSON in its own file, the modification time of the file determines its age. Entries are only read
+    from a directory that passes check_private_directory().
+    """
+
+    def __init__(self, directory: str):
+        self._directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, re.sub("[^a-zA-Z0-9_.-]", "_", key) + ".json")
+
+    def load(self, key: str, ttl: Optional[int], target: typing.Any = None) -> Optional[typing.Any]:
+        """
+        This function returns the stored entry if it is younger than ttl seconds, or None otherwise. If ttl is None, the
+        entry does not expire.
+        :param target: The type to decode the entry into with from_dict(), e.g. List[HardwareRecord]. If it is None,
+            the entry is returned as plain JSON data.
+        """
+        path = self._path(key)
+        try:
+            if ttl is not None and time.time() - os.stat(path).st_mtime >= ttl:
+                return None
+            check_private_directory(self._directory)
+            with open(path, "r") as f:
+                data = json.load(f)
+            if target is None:
+                return data
+            return _decoder(target)(data)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.debug(f"Failed to read cache entry {path} ({e.__str__()})")
+            return None
+
+    def store(self, key: str, entry: typing.Any) -> None:
+        """
+        This function stores the entry, which may contain dataclasses, see to_json().
+        """
+        path = self._path(key)
+        try:
+            write_private_file(path, to_json(entry).encode("utf-8"))
+        except Exception as e:
+            logging.debug(f"Failed to write cache entry {path} ({e.__str__()})")
+
+
+class CachedSections:
+    """
+    CachedSections keeps the output of sections that only need to be collected every few runs. While the stored output
+    of a section is younger than the interval configured for it, the stored output is emitted again with a cached
+    header instead of collecting the data of the section.
+    """
+
+    def __init__(self, cache: PersistentCache, intervals: Dict[str, int]):
+        """
+        :param cache: The cache to store the section output in.
+        :param intervals: The interval in seconds per section name. Sections without an interval, or with an interval of
+            0, are collected on every run.
+        """
+        self._cache = cache
+        self._intervals = intervals
+
+    @staticmethod
+    def _key(name: str) -> str:
+        return f"section_{name}"
+
+    def fresh(self, name: str) -> bool:
+        """
+        This function returns True if the stored output of the section can be used instead of collecting its data.
+        """
+        interval = self._intervals.get(name, 0)
+        return interval > 0 and self._cache.load(self._key(name), interval) is not None
+
+    def section(self, name: str, section_id: str, collect: typing.Callable[[], Iterator[str]]) -> CheckmkSection:
+        """
+        This function returns the section with the passed name. If the stored output is not fresh, collect is called to
+        produce the lines of the output and the output is stored. Sections without an interval are not stored, so
+        their lines are only produced when the section is written.
+        """
+        interval = self._intervals.get(name, 0)
+        if interval <= 0:
+            return CheckmkSection(section_id, collect())
+        entry = self._cache.load(self._key(name), interval)
+        if entry is None:
+            entry = [int(time.time()), "\n".join(collect())]
+            self._cache.store(self._key(name), entry)
+        return CheckmkSection(section_id, entry[1], (entry[0], interval))
+
+
+class ItemFilter:
+    """
+    ItemFilter describes the subset of the items of an endpoint a collector needs. It can be passed to the REST API as a
+    filter expression, so only the subset is transferred, and it can be applied to items that have already been
+    fetched.
+    """
+
+    def __init__(self, expression: str, predicate: typing.Callable[[typing.Any], bool]):
+        self._expression = expression
+        self._predicate = predicate
+
+    @staticmethod
+    def not_in(attribute: str, values: typing.List[str]) -> ItemFilter:
+        """
+        This function creates a filter for the items whose attribute has none of the specified values.
+        """
+        return ItemFilter(
+            " and ".join(f"{attribute}!='{value}'" for value in values),
+            lambda item: getattr(item, attribute, None) not in values,
+        )
+
+    def matches(self, item) -> bool:
+        return self._predicate(item)
+
+    def __str__(self) -> str:
+        return self._expression
+
+
+def name_key(item) -> Optional[str]:
+    """
+    This function returns the name of an item, for indexing items by name with ItemIndex.
+    """
+    return getattr(item, "name", None)
+
+
+def lower_name_key(item) -> Optional[str]:
+    """
+    This function returns the lowercase name of an item, for indexing items by name regardless of case with ItemIndex.
+    """
+    name = getattr(item, "name", None)
+    if name is None:
+        return None
+    return name.lower()
+
+
+class ItemIndex(typing.Generic[T]):
+    """
+    ItemIndex groups the items of a data source by a key, so a collector joining two data sources looks up the matching
+    items instead of scanning all items of the other data source for every item. The items of a key keep the order of
+    the data source.
+
+    >>> class Port(NamedTuple):
+    ...     name: str
+    ...     type: str
+    >>> ports = ItemIndex([Port("CT0.ETH0", "eth_port"), Port("CT0.FC0", "fc_port")], lower_name_key)
+    >>> ports.get("ct0.eth0")
+    [Port(name='CT0.ETH0', type='eth_port')]
+    >>> ports.first("ct1.eth0") is None
+    True
+    """
+
+    def __init__(self, items: Iterable[T], key: typing.Callable[[T], typing.Hashable]):
+        self._items: Dict[typing.Hashable, List[T]] = {}
+        for item in items:
+            self._items.setdefault(key(item), []).append(item)
+
+    def get(self, key: typing.Hashable) -> List[T]:
+        """
+        :return: The items with the specified key, or an empty list if there are none.
+        """
+        return self._items.get(key, [])
+
+    def first(self, key: typing.Hashable) -> Optional[T]:
+        """
+        :return: The first item with the specified key, or None if there is none.
+        """
+        items = self._items.get(key)
+        if not items:
+            return None
+        return items[0]
+
+
+def alerts_filter(updated_since: int) -> str:
+    """
+    This function returns the REST API filter for the alerts that are not closed or have been updated since the
+    specified timestamp (in milliseconds).
+    """
+    return f"state!='closed' or updated>={updated_since}"
+
+
+@dataclasses.dataclass
+class AlertRecord:
+    """
+    AlertRecord holds the properties of an alert the special agents report, so they can be kept between runs.
+    """
+    id: str
+    name: str
+    severity: Optional[str]
+    state: Optional[str]
+    summary: Optional[str]
+    description: Optional[str]
+    updated: Optional[int]
+
+    @staticmethod
+    def from_alert(alert) -> AlertRecord:
+        return project(alert, AlertRecord)
+
+
+class AlertState:
+    """
+    AlertState keeps the alerts of an array between runs of the special agent, so each run only needs to fetch the
+    alerts that are not closed or were updated since the previous run instead of the whole alert history. The
+    watermark is the newest updated timestamp (in milliseconds, as reported by the array) seen so far. It is only ever
+    taken from the array, so a difference between the clocks of the array and the Checkmk server can't skip alerts.
+    """
+
+    _key = "alerts"
+
+    def __init__(self, cache: PersistentCache, closed_alerts_lifetime: int):
+        self._cache = cache
+        self._closed_alerts_lifetime = closed_alerts_lifetime
+        self._alerts: Dict[str, AlertRecord] = {}
+        # Without a previous run, or if the array reported no alert with an updated timestamp yet, all alerts are
+        # fetched once.
+        self._watermark: Optional[int] = None
+        state = cache.load(self._key, None, typing.Tuple[Optional[int], List[AlertRecord]])
+        if state is not None:
+            self._watermark, alerts = state
+            for alert in alerts:
+                self._alerts[alert.id] = alert
+
+    def filter(self) -> Optional[str]:
+        """
+        This function returns the REST API filter for the alerts that need to be fetched, or None if all alerts need
+        to be fetched.
+        """
+        if self._watermark is None:
+            return None
+        return alerts_filter(self._watermark)
+
+    def update(self, alerts: typing.Iterable[AlertRecord]) -> List[AlertRecord]:
+        """
+        This function merges the alerts fetched with filter() into the state, stores it and returns all alerts that
+        should be reported.
+        """
+        fetched = {}
+        for alert in alerts:
+            fetched[alert.id] = alert
+            if alert.updated is not None and (self._watermark is None or alert.updated > self._watermark):
+                self._watermark = alert.updated
+
+        # Alerts that are not closed are always fetched, so any that are missing have been closed or removed.
+        limit = 1000 * (time.time() - self._closed_alerts_lifetime)
+        merged = {}
+        for alert in {**self._alerts, **fetched}.values():
+            if alert.state == "closed":
+                if alert.updated is not None and alert.updated > limit:
+                    merged[alert.id] = alert
+            elif alert.id in fetched:
+                merged[alert.id] = alert
+        self._alerts = merged
+        self._cache.store(self._key, [self._watermark, list(merged.values())])
+        return list(merged.values())
+
+
+def _client_version(cli) -> Optional[str]:
+    """
+    This function returns the REST API version of a pypureclient client based on the versioned module it is
+    implemented in (e.g. pypureclient.flasharray.FA_2_21), since not all clients offer get_rest_version().
+    """
+    match = re.search("\\.F[AB]_([0-9]+)_([0-9]+)\\.", type(cli).__module__)
+    if match is None:
+        return None
+    return f"{match.group(1)}.{match.group(2)}"
+
+
+class _SessionTokenManager(APITokenManager):
+    """
+    _SessionTokenManager is the token manager of the clients created by SessionCache. The first session token it needs
+    is the stored one if it is still valid; later ones, e.g. after the array rejected the session with a 401 response,
+    come from a fresh login and are stored. The session is not closed when the client is discarded, so later runs can
+    reuse it.
+    """
+
+    def __init__(self, session: SessionCache, *args, **kwargs):
+        self._session = session
+        self._reuse = True
+        super().__init__(*args, **kwargs)
+
+    def _request_session_token(self) -> str:
+        reuse, self._reuse = self._reuse, False
+        if reuse and self._session.session_token is not None and time.time() < self._session.expires:
+            return self._session.session_token
+        return self._session.login(super()._request_session_token())
+
+    def close_session(self) -> None:
+        pass
+
+    @classmethod
+    def adopt(cls, token_manager: APITokenManager, session: SessionCache) -> None:
+        """
+        This function turns the token manager of a client created without a stored version into a _SessionTokenManager
+        and stores the session token it logged in with.
+        """
+        token_manager.__class__ = cls
+        token_manager._session = session
+        token_manager._reuse = False
+        session.login(token_manager.get_session_token())
+
+
+class SessionCache:
+    """
+    SessionCache keeps the connection bootstrap of a special agent between runs: the REST API version negotiated with
+    the array, the session token the API token was exchanged for and the CA certificate file. The state is stored in a
+    file only accessible by the site user. A stored session token is reused until its lifetime is over; if the array
+    rejects it earlier, the client retries the request after a fresh login.
+    """
+
+    def __init__(self, directory: str, api_token: str, lifetime: int):
+        """
+        :param directory: The directory to store the state in, see cache_directory().
+        :param api_token: The API token used for logging in. Session tokens obtained for a different API token are
+            discarded.
+        :param lifetime: The number of seconds a session token is reused for. If it is 0, the state is neither loaded
+            nor stored.
+        """
+        self._directory = directory
+        self._path = os.path.join(directory, "session.json")
+        self._api_token_hash = hashlib.sha256(api_token.encode("utf-8")).hexdigest()
+        self._lifetime = lifetime
+        self.version: Optional[str] = None
+        self.session_token: Optional[str] = None
+        self.expires: float = 0
+        if lifetime > 0:
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            check_private_directory(self._directory)
+            with open(self._path, "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logging.debug(f"Failed to read session state {self._path} ({e.__str__()})")
+            return
+        self.version = state.get("version")
+        if state.get("api_token") == self._api_token_hash:
+            self.session_token = state.get("session_token")
+            self.expires = state.get("expires", 0)
+
+    def _store(self) -> None:
+        if self._lifetime <= 0:
+            return
+        state = {
+            "version": self.version,
+            "api_token": self._api_token_hash,
+            "session_token": self.session_token,
+            "expires": self.expires,
+        }
+        try:
+            write_private_file(self._path, json.dumps(state).encode("ascii"))
+        except Exception as e:
+            logging.debug(f"Failed to write session state {self._path} ({e.__str__()})")
+
+    def cert_file(self, cacert: str) -> str:
+        """
+        This function returns the path of a file containing the specified CA certificate. The file is named after the
+        hash of the certificate, so it is only written again when the certificate changes.
+        :raises PermissionError: If the directory does not pass check_private_directory().
+        """
+        data = cacert.encode("ascii")
+        path = os.path.join(self._directory, "ca-" + hashlib.sha256(data).hexdigest()[:16] + ".pem")
+        if os.path.exists(path):
+            check_private_directory(self._directory)
+        else:
+            write_private_file(path, data)
+        return path
+
+    def login(self, session_token: str) -> str:
+        """
+        This function stores a session token obtained by a fresh login.
+        """
+        self.session_token = session_token
+        self.expires = time.time() + self._lifetime
+        self._store()
+        return session_token
+
+    def client(self, factory, target: str, **kwargs):
+        """
+        This function creates a pypureclient client using the stored version and session token if they are available.
+        Without a stored version, the client of the factory module negotiates the version and logs in as usual, and its
+        session is kept for later runs.
+
+        :param factory: The pypureclient client module, e.g. pypureclient.flasharray.client.
+        :param target: The host of the array.
+        :param kwargs: Further arguments for the Client() function of the factory module, e.g. api_token.
+        """
+        if self._lifetime <= 0:
+            return factory.Client(target, **kwargs)
+
+        cli = None
+        if self.version is not None:
+            try:
+                cli = self._session_client(factory, target, **kwargs)
+            except UnsupportedClientException as e:
+                logging.warning(f"Not reusing the session with {target} ({e.__str__()})")
+        if cli is None:
+            cli = factory.Client(target, **kwargs)
+            token_manager = getattr(cli, "_token_man", None)
+            if type(token_manager) is APITokenManager:
+                _SessionTokenManager.adopt(token_manager, self)
+        self.version = _client_version(cli)
+        self._store()
+        return cli
+
+    def _session_client(self, factory, target: str, ssl_cert: Optional[str] = None, verify_ssl: Optional[bool] = None,
+                        configuration=None, retries: Optional[int] = None, **kwargs):
+        """
+        This function creates the client of the versioned pypureclient module for the stored version directly, skipping
+        the version negotiation, with a _SessionTokenManager as its token manager. The versioned client has no parameter
+        for its token manager, so its constructor is rebuilt with its own copy of the module globals; the pypureclient
+        modules themselves are left untouched.
+
+        :raises UnsupportedClientException: If the client library does not offer the stored version or constructs its
+            clients differently.
+        """
+        prefix = {"flasharray": "FA", "flashblade": "FB"}.get(factory.__name__.split(".")[-2])
+        create_transport_config = getattr(factory, "create_transport_config", None)
+        if prefix is None or create_transport_config is None:
+            raise UnsupportedClientException(f"{factory.__name__} is not a supported client module")
+        if re.fullmatch("[0-9]+\\.[0-9]+", self.version) is None:
+            raise UnsupportedClientException(f"Invalid version {self.version}")
+        module_name = f"{factory.__package__}.{prefix}_{self.version.replace('.', '_')}"
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            raise UnsupportedClientException(f"Version {self.version} is not supported by the client library") from None
+
+        init = getattr(getattr(module, "Client", None), "__init__", None)
+        if not isinstance(init, types.FunctionType) or init.__closure__ is not None or \
+                "APITokenManager" not in init.__code__.co_names:
+            raise UnsupportedClientException(f"{module_name}.Client does not create an APITokenManager")
+        namespace = dict(init.__globals__)
+        namespace["APITokenManager"] = functools.partial(_SessionTokenManager, self)
+        session_init = types.FunctionType(init.__code__, namespace, init.__name__, init.__defaults__)
+        session_init.__kwdefaults__ = init.__kwdefaults__
+        client_class = type(module.Client.__name__, (module.Client,), {
+            "__init__": session_init,
+            "__module__": module.Client.__module__,
+        })
+
+        cli = client_class(
+            configuration=create_transport_config(
+                target=target, configuration=configuration, ssl_cert=ssl_cert, verify_ssl=verify_ssl
+            ),
+            retries=retries if retries is not None else getattr(factory, "DEFAULT_RETRIES", None),
+            **kwargs
+        )
+        if not isinstance(getattr(cli, "_token_man", None), _SessionTokenManager) or _client_version(cli) is None:
+            raise UnsupportedClientException(f"{module_name}.Client does not use the session token manager")
+        return cli
+
+
+def _identity(data):
+    return data
+
+
+_decoders: Dict[typing.Any, typing.Callable[[any], any]] = {}
+"""
+This dictionary holds the decode function for each target type from_dict() was called with, and for the types nested in
+them. Compiling a decoder is idempotent, so concurrent callers at worst compile the same decoder twice.
+"""
+
+
+def _decoder(target: typing.Any) -> typing.Callable[[any], any]:
+    """
+    This function returns the decode function for the target type, compiling it on first use.
+    """
+    try:
+        return _decoders[target]
+    except KeyError:
+        pass
+    decoder = _compile_decoder(target)
+    _decoders[target] = decoder
+    return decoder
+
+
+def _compile_decoder(target: typing.Any) -> typing.Callable[[any], any]:
+    """
+    This function builds a function that turns the JSON data of the target type into an instance of it. All type
+    introspection happens here, so the returned function only walks the data. JSON values that need no conversion are
+    passed through as-is.
+    """
+    origin = typing.get_origin(target)
+    args = typing.get_args(target)
+    if origin == dict:
+        value_decoder = _decoder(args[1])
+        if value_decoder is _identity:
+            return dict
+        return lambda data: {key: value_decoder(value) for key, value in data.items()}
+    elif origin == list:
+        item_decoder = _decoder(args[0])
+        if item_decoder is _identity:
+            return list
+        return lambda data: [item_decoder(value) for value in data]
+    elif origin == tuple:
+        if len(args) == 2 and args[1] is Ellipsis:
+            item_decoder = _decoder(args[0])
+            return lambda data: tuple(item_decoder(value) for value in data)
+        item_decoders = [_decoder(arg) for arg in args]
+        if all(item_decoder is _identity for item_decoder in item_decoders):
+            return tuple
+        return lambda data: tuple(item_decoder(value) for item_decoder, value in zip(item_decoders, data))
+    elif origin == typing.Union:
+        # Optional, we don't support union
+        value_decoder = _decoder([arg for arg in args if arg is not type(None)][0])
+        if value_decoder is _identity:
+            return _identity
+        return lambda data: None if data is None else value_decoder(data)
+    elif inspect.isclass(target) and issubclass(target, enum.Enum):
+        members = {member.value: member for member in target}
+
+        def decode_enum(data):
+            try:
+                return members[data]
+            except KeyError:
+                raise ValueError(f"Invalid value {data} for {target.__name__}") from None
+
+        return decode_enum
+    elif target in [str, int, bool, float, any]:
+        return _identity
+    else:
+        # Dataclass
+        # noinspection PyDataclass
+        try:
+            fs = dataclasses.fields(target)
+            type_hints = typing.get_type_hints(target)
+        except TypeError as e:
+            raise Exception(f"{pprint.pformat(target)} is not a dataclass") from e
+        field_decoders = [(field.name, _decoder(type_hints[field.name])) for field in fs]
+
+        def decode_dataclass(data):
+            result = {}
+            for name, field_decoder in field_decoders:
+                if name in data:
+                    result[name] = field_decoder(data[name])
+            return target(**result)
+
+        return decode_dataclass
+
+
+def from_dict(data: dict, target: typing.Type[dataclasses.dataclass]):
+    """
+    This function turns JSON data into an instance of the target type. The data is not modified.
+
+    >>> from_dict({"state": 1, "summary": "too full"}, Result)
+    Result(state=<State.WARN: 1>, summary='too full', details=None, notice=None)
+    >>> from_dict({"value": 70.0, "levels": [80.0, 90.0]}, Metric)
+    Metric(value=70.0, levels=(80.0, 90.0), boundaries=(None, None))
+    """
+    return _decoder(target)(data)
 
 
 _byte_dividers = {
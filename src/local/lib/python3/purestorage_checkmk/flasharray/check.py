@@ -4,54 +4,81 @@ from typing import Optional
 from cmk.base.api.agent_based.checking_classes import DiscoveryResult, CheckResult, Service
 from cmk.base.api.agent_based.inventory_classes import InventoryResult
 from cmk.base.api.agent_based.type_defs import StringTable
-from purestorage_checkmk.checkmk import result_to_checkmk, result_to_metric, result_to_attributes, result_to_table_row
-from purestorage_checkmk.flasharray.common import FlashArraySpecialAgentResultsSection, \
-    FlashArraySpecialAgentInventorySection
+from purestorage_checkmk.checkmk import result_to_checkmk, result_to_metric, result_to_attributes, result_to_table_row, \
+    table_to_table_rows, agent_stats_to_checkmk
+from purestorage_checkmk.common import IndexedResultsSection, AgentStatsSection, indexed_items, indexed_results, \
+    legacy_results_sections
+from purestorage_checkmk.flasharray.common import FlashArraySpecialAgentInventorySection
 
 
-def parse_flasharray(string_table: StringTable) -> FlashArraySpecialAgentResultsSection:
-    return FlashArraySpecialAgentResultsSection.from_section(string_table[0][0])
+def parse_flasharray(string_table: StringTable) -> IndexedResultsSection:
+    return IndexedResultsSection.from_string_table(string_table)
 
 
 def parse_flasharray_inventory(
         string_table: StringTable
 ) -> FlashArraySpecialAgentInventorySection:
-    return FlashArraySpecialAgentInventorySection.from_section(string_table[0][0])
+    return FlashArraySpecialAgentInventorySection.from_string_table(string_table)
 
 
-def discover_purestorage_flasharray(section: Optional[FlashArraySpecialAgentResultsSection] = None) -> DiscoveryResult:
+def discover_purestorage_flasharray(
+        section_purestorage_flasharray_hardware: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray_certificates: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray_drives: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray_array: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray_alerts: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray_arrayconnections: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray_portdetails: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray: Optional[IndexedResultsSection] = None,
+) -> DiscoveryResult:
     """
-    This function discovers the services of the FlashArray.
-    :param section: Data from the special agent.
+    This function discovers the services of the FlashArray. The special agent sends one section per subsystem, each of
+    which may be missing, for example if it failed or is not configured. The single results section of older versions
+    of the special agent is read if none of them is present.
     :return:
     """
-    if section is None:
-        return
-    for field in fields(FlashArraySpecialAgentResultsSection):
-        for name in getattr(section, field.name).services.keys():
-            yield Service(item=name)
-        for name in getattr(section, field.name).metrics.keys():
-            yield Service(item=name)
+    for name in indexed_items(legacy_results_sections((
+            section_purestorage_flasharray_hardware,
+            section_purestorage_flasharray_certificates,
+            section_purestorage_flasharray_drives,
+            section_purestorage_flasharray_array,
+            section_purestorage_flasharray_alerts,
+            section_purestorage_flasharray_arrayconnections,
+            section_purestorage_flasharray_portdetails,
+        ), section_purestorage_flasharray)):
+        yield Service(item=name)
 
 
 def check_purestorage_flasharray(
         item: str = "",
-        section: Optional[FlashArraySpecialAgentResultsSection] = None
+        section_purestorage_flasharray_hardware: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray_certificates: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray_drives: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray_array: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray_alerts: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray_arrayconnections: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray_portdetails: Optional[IndexedResultsSection] = None,
+        section_purestorage_flasharray: Optional[IndexedResultsSection] = None,
 ) -> CheckResult:
     """
-    This function parses the section from the special agent and returns the result. It will be invoked
+    This function returns the result for an item from the sections of the special agent. It will be invoked
     once per discovered item.
     :param item: The item being checked.
-    :param section: The section received from the special agent.
     :return: The check result.
     """
-    if section is None:
-        return
-    for field in fields(FlashArraySpecialAgentResultsSection):
-        if item in getattr(section, field.name).services:
-            yield result_to_checkmk(getattr(section, field.name).services[item])
-        if item in getattr(section, field.name).metrics:
-            yield result_to_metric(item, getattr(section, field.name).metrics[item])
+    for service, metric in indexed_results(item, legacy_results_sections((
+            section_purestorage_flasharray_hardware,
+            section_purestorage_flasharray_certificates,
+            section_purestorage_flasharray_drives,
+            section_purestorage_flasharray_array,
+            section_purestorage_flasharray_alerts,
+            section_purestorage_flasharray_arrayconnections,
+            section_purestorage_flasharray_portdetails,
+        ), section_purestorage_flasharray)):
+        if service is not None:
+            yield result_to_checkmk(service)
+        if metric is not None:
+            yield result_to_metric(item, metric)
 
 
 def inventory_purestorage_flasharray(
@@ -61,3 +88,20 @@ def inventory_purestorage_flasharray(
             yield result_to_attributes(attributes)
         for table_row in getattr(section, field.name).inventory_table_rows:
             yield result_to_table_row(table_row)
+        for table in getattr(section, field.name).inventory_tables:
+            yield from table_to_table_rows(table)
+
+
+def parse_flasharray_agent_stats(string_table: StringTable) -> AgentStatsSection:
+    return AgentStatsSection.from_string_table(string_table)
+
+
+def discover_purestorage_flasharray_agent_stats(section: AgentStatsSection) -> DiscoveryResult:
+    yield Service()
+
+
+def check_purestorage_flasharray_agent_stats(section: AgentStatsSection) -> CheckResult:
+    """
+    This function reports how long the last run of the special agent took and where the time went.
+    """
+    yield from agent_stats_to_checkmk(section)
@@ -3,16 +3,57 @@ import typing
 from typing import Optional, List
 
 from purestorage_checkmk.common import SpecialAgentResult, AbstractSpecialAgentSection, \
-    AbstractSpecialAgentConfiguration, LimitConfiguration, SpecialAgentInventory, Attributes, TableRow
+    AbstractSpecialAgentConfiguration, LimitConfiguration, SpecialAgentInventory, Attributes, CompactTableRow
 
 flasharray_results_section_id = "purestorage_flasharray"
 flasharray_inventory_section_id = "purestorage_flasharray_inventory"
+flasharray_agent_stats_section_id = "purestorage_flasharray_agent_stats"
+
+
+def flasharray_section_id(subsystem: str) -> str:
+    """
+    This function returns the ID of the section holding the results of a single subsystem, e.g. the hardware.
+    """
+    return f"{flasharray_results_section_id}_{subsystem}"
+
 
 default_array_warn = 80
 default_array_crit = 90
 default_cert_warn = 90
 default_cert_crit = 30
+default_runtime_warn = 45
+default_runtime_crit = 55
 default_closed_alerts_lifetime = 3600
+default_prefetch_workers = 8
+default_session_lifetime = 30 * 60
+default_cache_ttls = {
+    "admin_settings": 4 * 3600,
+    "api_tokens": 4 * 3600,
+    "certificates": 4 * 3600,
+    "dns": 4 * 3600,
+    "hosts": 4 * 3600,
+    "smtp_servers": 4 * 3600,
+    "support": 4 * 3600,
+    "volumes": 4 * 3600,
+}
+default_section_intervals = {
+    "array": 5 * 60,
+    "certificates": 4 * 3600,
+    "inventory": 4 * 3600,
+}
+default_page_size = 1000
+default_pagination_workers = 4
+default_page_sizes = {
+    "alerts": default_page_size,
+    "api_tokens": default_page_size,
+    "array_connections": default_page_size,
+    "certificates": default_page_size,
+    "controllers": default_page_size,
+    "drives": default_page_size,
+    "hosts": default_page_size,
+    "network_interfaces": default_page_size,
+    "volumes": default_page_size,
+}
 
 
 @dataclasses.dataclass
@@ -22,6 +63,7 @@ class AlertsConfiguration:
     warning: bool
     critical: bool
     hidden: bool
+    incremental: bool = False
 
 
 @dataclasses.dataclass
@@ -52,6 +94,23 @@ class FlashArraySpecialAgentConfiguration(AbstractSpecialAgentConfiguration):
     hardware: typing.List[FlashArrayHardwareServiceNameCustomization] = dataclasses.field(
         default_factory=list,
     )
+    prefetch_workers: int = default_prefetch_workers
+    cache_ttls: typing.Dict[str, int] = dataclasses.field(
+        default_factory=dict,
+    )
+    session_lifetime: int = 0
+    streaming: bool = False
+    page_sizes: typing.Dict[str, int] = dataclasses.field(
+        default_factory=dict,
+    )
+    pagination_workers: int = default_pagination_workers
+    section_intervals: typing.Dict[str, int] = dataclasses.field(
+        default_factory=dict,
+    )
+    raw_json: bool = False
+    agent_runtime: LimitConfiguration = dataclasses.field(
+        default_factory=lambda: LimitConfiguration(default_runtime_warn, default_runtime_crit)
+    )
 
 
 @dataclasses.dataclass
@@ -69,8 +128,15 @@ class FlashArraySpecialAgentResultsSection(AbstractSpecialAgentSection):
     portdetails: SpecialAgentResult
 
 
+flasharray_section_ids = [
+    flasharray_section_id(field.name) for field in dataclasses.fields(FlashArraySpecialAgentResultsSection)
+]
+
+
 @dataclasses.dataclass
 class SupportAttributes(Attributes):
+    __slots__ = ()
+
     def __init__(self, name: Optional[str] = None, id: Optional[str] = None, phonehome_enabled: Optional[bool] = None,
                  remote_assist_active: Optional[bool] = None):
         super().__init__(
@@ -84,34 +150,41 @@ class SupportAttributes(Attributes):
         )
 
 
-class NIC(TableRow):
+class NIC(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "array", "network")
+    key_column_names = ("name",)
+    inventory_column_names = (
+        "subtype",
+        "subinterfaces",
+        "address",
+        "netmask",
+        "gateway",
+        "mac_address",
+        "vlan",
+        "mtu",
+        "speed",
+        "type",
+        "wwn",
+    )
+
     def __init__(self, name: str, subtype: Optional[str] = None, address: Optional[str] = None,
                  netmask: Optional[str] = None, subinterfaces: Optional[str] = None, wwn: Optional[str] = None,
                  gateway: Optional[str] = None, mac_address: Optional[str] = None, vlan: Optional[int] = None,
                  mtu: Optional[int] = None, speed: Optional[int] = None, interface_type: Optional[str] = None,
                  services: Optional[str] = None):
         super().__init__(
-            path=["hardware", "array", "network"],
-            key_columns={
-                "name": name,
-            },
-            inventory_columns={
-                "subtype": subtype,
-                "subinterfaces": subinterfaces,
-                "address": address,
-                "netmask": netmask,
-                "gateway": gateway,
-                "mac_address": mac_address,
-                "vlan": vlan,
-                "mtu": mtu,
-                "speed": speed,
-                "type": interface_type,
-                "wwn": wwn
-            }
+            (name,),
+            (subtype, subinterfaces, address, netmask, gateway, mac_address, vlan, mtu, speed, interface_type, wwn),
         )
 
 
-class DNSServer(TableRow):
+class DNSServer(CompactTableRow):
+    __slots__ = ()
+    table_path = ("software", "os", "DNS")
+    key_column_names = ("name",)
+    inventory_column_names = ("domain", "nameservers", "services")
+
     def __init__(self, name: str, domain: Optional[str] = None, services: Optional[List[str]] = None,
                  nameservers: Optional[List[str]] = None):
         if isinstance(services, list):
@@ -119,91 +192,102 @@ class DNSServer(TableRow):
         else:
             services_new = services
         super().__init__(
-            path=["software", "os", "DNS"],
-            key_columns={
-                "name": name,
-            },
-            inventory_columns={
-                "domain": domain,
-                "nameservers": ','.join(nameservers),
-                "services": services_new,
-            }
+            (name,),
+            (domain, ','.join(nameservers), services_new),
         )
 
 
-class Volumes(TableRow):
+class Volumes(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "array", "volumes")
+    key_column_names = ("name",)
+    inventory_column_names = ("id", "connection_count")
+
     def __init__(self, name: str, id: Optional[str], connection_count: Optional[int] = None):
         super().__init__(
-            path=["hardware", "array", "volumes"],
-            key_columns={
-                "name": name,
-            },
-            inventory_columns={
-                "id": id if id is not None else None,
-                "connection_count": connection_count if connection_count is not None else None,
-            }
+            (name,),
+            (id, connection_count),
         )
 
 
-class ArrayConnection(TableRow):
+class ArrayConnection(CompactTableRow):
+    __slots__ = ()
+    table_path = ("software", "array", "connections")
+    key_column_names = ("name",)
+    inventory_column_names = ("management_address", "type")
+
     def __init__(self, name: str, management_address: Optional[str] = None, connection_type: Optional[str] = None):
         super().__init__(
-            path=["software", "array", "connections"],
-            key_columns={
-                "name": name,
-            },
-            inventory_columns={
-                "management_address": management_address if management_address is not None else None,
-                "type": connection_type if connection_type is not None else None
-            }
+            (name,),
+            (
+                management_address,
+                connection_type,
+            ),
         )
 
 
-class Hosts(TableRow):
+class Hosts(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "array", "connections")
+    key_column_names = ("name",)
+    inventory_column_names = ("connection_count", "iqns")
+
     def __init__(self, name: str, connection_count: Optional[int] = None, iqns: Optional[str] = None):
         super().__init__(
-            path=["hardware", "array", "connections"],
-            key_columns={
-                "name": name,
-            },
-            inventory_columns={
-                "connection_count": connection_count if connection_count is not None else None,
-                "iqns": iqns if iqns is not None else None,
-            }
+            (name,),
+            (connection_count, iqns),
         )
 
 
-class NetworkInterface(TableRow):
+class NetworkInterface(CompactTableRow):
+    __slots__ = ()
+    table_path = ("hardware", "array", "network")
+    key_column_names = ("name",)
+    inventory_column_names = (
+        "enabled",
+        "services",
+        "speed",
+        "address",
+        "gateway",
+        "mac_address",
+        "mtu",
+        "netmask",
+        "subtype",
+        "subinterfaces",
+        "subnet",
+        "vlan",
+        "wwn",
+    )
+
     def __init__(self, name: str, enabled: Optional[str] = None, interface_type: Optional[str] = None,
                  services: Optional[str] = None, speed: Optional[int] = None, address: Optional[str] = None,
                  gateway: Optional[str] = None, mac_address: Optional[str] = None, mtu: Optional[int] = None,
                  netmask: Optional[str] = None, subtype: Optional[str] = None, subinterfaces: Optional[str] = None,
                  subnet: Optional[str] = None, vlan: Optional[int] = None, wwn: Optional[str] = None):
         super().__init__(
-            path=["hardware", "array", "network"],
-            key_columns={
-                "name": name,
-            },
-            inventory_columns={
-                "enabled": enabled if not None else None,
-                "services": services if not None else None,
-                "speed": speed if not None else None,
-                "address": address if not None else None,
-                "gateway": gateway if not None else None,
-                "mac_address": mac_address if not None else None,
-                "mtu": mtu if not None else None,
-                "netmask": netmask if not None else None,
-                "subtype": subtype if not None else None,
-                "subinterfaces": subinterfaces if not None else None,
-                "subnet": subnet if not None else None,
-                "vlan": vlan if not None else None,
-                "wwn": wwn if not None else None
-            }
+            (name,),
+            (
+                enabled,
+                services,
+                speed,
+                address,
+                gateway,
+                mac_address,
+                mtu,
+                netmask,
+                subtype,
+                subinterfaces,
+                subnet,
+                vlan,
+                wwn,
+            ),
         )
 
 
 @dataclasses.dataclass
 class FlashArraySoftwareAttributes(Attributes):
+    __slots__ = ()
+
     def __init__(self, single_sign_on_enabled: Optional[bool] = None, min_password_length: Optional[int] = None,
                  max_login_attempts: Optional[int] = None, lockout_duration: Optional[int] = None,
                  array_os: Optional[str] = None, array_version: Optional[str] = None,
@@ -1,57 +1,388 @@
 import abc
+import dataclasses
 import logging
-import tempfile
+import sys
+import threading
 import time
-from typing import TextIO, TypeVar, Generic, List, Optional
+from typing import TextIO, TypeVar, Generic, List, Optional, Iterable, Iterator, Dict, Callable, Type, Hashable, \
+    Sequence
 
 import pypureclient
 from purestorage_checkmk.common import CheckmkSection, Result, State, CheckResponse, SpecialAgentResult, Metric, \
     Compare, SpecialAgentInventory, DriveController, OtherHardwareComponentTableRow, FanTableRow, ChassisTableRow, \
     PSUTableRow, SensorTableRow, BackplaneTableRow, NetworkInterfaceStatus, NetworkInterfaceTableRow, APIToken, \
-    NetworkAddressTableRow, ipv4_regex, NetworkRouteTableRow, format_bytes
+    NetworkAddressTableRow, ipv4_regex, NetworkRouteTableRow, format_bytes, Prefetchable, prefetch, \
+    PersistentCache, cache_directory, SessionCache, AlertRecord, AlertState, ItemFilter, \
+    alerts_filter, page_items, paginate_by_offset, RequestCounter, CachedSections, encode_section_lines, \
+    ModelRecord, projector, RawClient, from_dict, ItemIndex, name_key, lower_name_key, AgentStats, \
+    AgentStatsSection, special_agent_argument_parser, profile, Tracer
 from purestorage_checkmk.flasharray.common import FlashArraySpecialAgentConfiguration, \
     FlashArraySpecialAgentResultsSection, \
-    flasharray_results_section_id, flasharray_inventory_section_id, FlashArraySpecialAgentInventorySection, DNSServer, \
-    FlashArraySoftwareAttributes, ArrayConnection, Hosts, Volumes, SupportAttributes, NIC
+    flasharray_section_id, flasharray_inventory_section_id, FlashArraySpecialAgentInventorySection, DNSServer, \
+    flasharray_agent_stats_section_id, \
+    FlashArraySoftwareAttributes, ArrayConnection, Hosts, Volumes, SupportAttributes, NIC, default_page_size, \
+    default_pagination_workers
 from purestorage_checkmk.version import __version__
 from pypureclient.flasharray.FA_2_32 import models
 
 T = TypeVar("T")
 
+# The subsets of the hardware and drives endpoints the result collectors report on.
+hardware_components_filter = ItemFilter.not_in("status", ["unused", "not_installed"])
+drives_filter = ItemFilter.not_in("status", ["unused"])
+
+
+# The records below hold the attributes of the pypureclient models the collectors read. The data sources keep these
+# records instead of the models for the rest of the run, and in the persistent cache.
+
+
+@dataclasses.dataclass(slots=True)
+class HardwareRecord(ModelRecord):
+    name: Optional[str] = None
+    type: Optional[str] = None
+    status: Optional[str] = None
+    details: Optional[str] = None
+    index: Optional[int] = None
+    model: Optional[str] = None
+    serial: Optional[str] = None
+    speed: Optional[int] = None
+    temperature: Optional[int] = None
+    voltage: Optional[int] = None
+
+
+@dataclasses.dataclass(slots=True)
+class DriveRecord(ModelRecord):
+    name: Optional[str] = None
+    status: Optional[str] = None
+
+
+@dataclasses.dataclass(slots=True)
+class ControllerRecord(ModelRecord):
+    name: Optional[str] = None
+    status: Optional[str] = None
+    mode: Optional[str] = None
+
+
+@dataclasses.dataclass(slots=True)
+class SpaceRecord(ModelRecord):
+    total_physical: Optional[int] = None
+    shared: Optional[int] = None
+    snapshots: Optional[int] = None
+    system: Optional[int] = None
+    total_provisioned: Optional[int] = None
+    used_provisioned: Optional[int] = None
+    total_reduction: Optional[float] = None
+    data_reduction: Optional[float] = None
+    thin_provisioning: Optional[float] = None
+
+
+@dataclasses.dataclass(slots=True)
+class ArrayRecord(ModelRecord):
+    id: Optional[str] = None
+    name: Optional[str] = None
+    os: Optional[str] = None
+    version: Optional[str] = None
+    ntp_servers: Optional[List[str]] = None
+    capacity: Optional[int] = None
+    space: Optional[SpaceRecord] = None
+
+
+@dataclasses.dataclass(slots=True)
+class CertificateRecord(ModelRecord):
+    name: Optional[str] = None
+    status: Optional[str] = None
+    valid_to: Optional[int] = None
+
+
+@dataclasses.dataclass(slots=True)
+class AdminSettingsRecord(ModelRecord):
+    single_sign_on_enabled: Optional[bool] = None
+    min_password_length: Optional[int] = None
+    max_login_attempts: Optional[int] = None
+    lockout_duration: Optional[int] = None
+
+
+@dataclasses.dataclass(slots=True)
+class DNSRecord(ModelRecord):
+    name: Optional[str] = None
+    domain: Optional[str] = None
+    nameservers: Optional[List[str]] = None
+    services: Optional[List[str]] = None
+
+
+@dataclasses.dataclass(slots=True)
+class APITokenRecord(ModelRecord):
+    created_at: Optional[int] = None
+    expires_at: Optional[int] = None
+
+
+@dataclasses.dataclass(slots=True)
+class AdminAPITokenRecord(ModelRecord):
+    name: Optional[str] = None
+    api_token: Optional[APITokenRecord] = None
+
+
+@dataclasses.dataclass(slots=True)
+class SMTPServerRecord(ModelRecord):
+    relay_host: Optional[str] = None
+
+
+@dataclasses.dataclass(slots=True)
+class ArrayConnectionRecord(ModelRecord):
+    name: Optional[str] = None
+    status: Optional[str] = None
+    management_address: Optional[str] = None
+    type: Optional[str] = None
+
+
+@dataclasses.dataclass(slots=True)
+class ReferenceRecord(ModelRecord):
+    name: Optional[str] = None
+
+
+@dataclasses.dataclass(slots=True)
+class NetworkInterfaceEthRecord(ModelRecord):
+    address: Optional[str] = None
+    netmask: Optional[str] = None
+    gateway: Optional[str] = None
+    mac_address: Optional[str] = None
+    subtype: Optional[str] = None
+    subinterfaces: Optional[List[ReferenceRecord]] = None
+    vlan: Optional[int] = None
+    mtu: Optional[int] = None
+
+
+@dataclasses.dataclass(slots=True)
+class NetworkInterfaceFCRecord(ModelRecord):
+    wwn: Optional[str] = None
+
+
+@dataclasses.dataclass(slots=True)
+class NetworkInterfaceRecord(ModelRecord):
+    name: Optional[str] = None
+    speed: Optional[int] = None
+    interface_type: Optional[str] = None
+    eth: Optional[NetworkInterfaceEthRecord] = None
+    fc: Optional[NetworkInterfaceFCRecord] = None
+
+
+@dataclasses.dataclass(slots=True)
+class PortMeasurementRecord(ModelRecord):
+    status: Optional[str] = None
+    measurement: Optional[float] = None
+
+
+@dataclasses.dataclass(slots=True)
+class PortFlagRecord(ModelRecord):
+    channel: Optional[int] = None
+    flag: Optional[bool] = None
+
+
+@dataclasses.dataclass(slots=True)
+class PortDetailsRecord(ModelRecord):
+    name: Optional[str] = None
+    temperature: Optional[List[PortMeasurementRecord]] = None
+    voltage: Optional[List[PortMeasurementRecord]] = None
+    tx_bias: Optional[List[PortMeasurementRecord]] = None
+    tx_power: Optional[List[PortMeasurementRecord]] = None
+    rx_power: Optional[List[PortMeasurementRecord]] = None
+    tx_fault: Optional[List[PortFlagRecord]] = None
+    rx_los: Optional[List[PortFlagRecord]] = None
+
+
+@dataclasses.dataclass(slots=True)
+class HostRecord(ModelRecord):
+    name: Optional[str] = None
+    connection_count: Optional[int] = None
+    iqns: Optional[List[str]] = None
+
+
+@dataclasses.dataclass(slots=True)
+class VolumeRecord(ModelRecord):
+    id: Optional[str] = None
+    name: Optional[str] = None
+    connection_count: Optional[int] = None
+
+
+@dataclasses.dataclass(slots=True)
+class SupportRecord(ModelRecord):
+    phonehome_enabled: Optional[bool] = None
+    remote_assist_active: Optional[bool] = None
+
 
 class FlashArraySpecialAgentDataSource(Generic[T], abc.ABC):
     @abc.abstractmethod
-    def query(self) -> List[T]:
+    def query(self) -> Iterable[T]:
+        """
+        This function returns the items of the data source. The items may be returned as a generator that fetches
+        them page by page, in which case they can only be iterated once.
+        """
         pass
 
 
-class CachingFlashArraySpecialAgentDataSource(FlashArraySpecialAgentDataSource[T]):
+class CachingFlashArraySpecialAgentDataSource(FlashArraySpecialAgentDataSource[T], Prefetchable):
+    """
+    This data source queries the backend once and keeps the result for the rest of the run. It can be filled ahead of
+    time using prefetch(). If the backend fails, the error is kept and raised again on every query.
+    """
     _cache: Optional[List[T]] = None
+    _error: Optional[Exception] = None
 
     def __init__(self, backend: FlashArraySpecialAgentDataSource[T]):
         self._backend = backend
+        self._lock = threading.Lock()
+        self._indexes: Dict[Callable[[T], Hashable], ItemIndex[T]] = {}
+
+    def prefetch(self) -> None:
+        try:
+            self.query()
+        except Exception as e:
+            logging.debug(f"Prefetching {type(self._backend).__name__} failed ({e.__str__()})")
 
     def query(self) -> List[T]:
-        if self._cache is None:
-            result = []
-            for item in self._backend.query():
-                result.append(item)
-            self._cache = result
+        with self._lock:
+            if self._cache is None:
+                if self._error is not None:
+                    raise self._error
+                try:
+                    result = self._backend.query()
+                    if not isinstance(result, list):
+                        result = list(result)
+                except Exception as e:
+                    self._error = e
+                    raise
+                self._cache = result
+            return self._cache
+
+    def cached(self) -> Optional[List[T]]:
+        """
+        This function returns the result if the backend has already been queried successfully, or None otherwise.
+        """
         return self._cache
 
+    def index(self, key: Callable[[T], Hashable]) -> ItemIndex[T]:
+        """
+        This function returns the result grouped by the specified key function, e.g. name_key. The index is built on
+        first use and shared by all collectors for the rest of the run.
+        """
+        items = self.query()
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = ItemIndex(items, key)
+                self._indexes[key] = index
+            return index
+
+
+class SubsetFlashArraySpecialAgentDataSource(CachingFlashArraySpecialAgentDataSource[T]):
+    """
+    This data source returns the items of another data source that match a filter. If the other data source has
+    already been fetched, the subset is taken from it. Otherwise, only the subset is requested from the backend, which
+    must apply the same filter. When both are prefetched in the same run, only the other data source is fetched, see
+    FlashArraySpecialAgent.prefetch().
+    """
+
+    def __init__(
+            self,
+            complete: CachingFlashArraySpecialAgentDataSource[T],
+            backend: FlashArraySpecialAgentDataSource[T],
+            item_filter: ItemFilter,
+    ):
+        super().__init__(backend)
+        self.complete = complete
+        self._item_filter = item_filter
+
+    def query(self) -> List[T]:
+        items = self.complete.cached()
+        if items is not None:
+            return [item for item in items if self._item_filter.matches(item)]
+        return super().query()
+
+
+class PersistentCachingFlashArraySpecialAgentDataSource(FlashArraySpecialAgentDataSource[T]):
+    """
+    This data source keeps the results of its backend on disk for ttl seconds, so slowly changing data is not fetched
+    and deserialized again on every run. A ttl of 0 disables the cache. The items are stored as JSON and decoded into
+    the record type of the backend when they are loaded.
+    """
+
+    def __init__(
+            self,
+            backend: FlashArraySpecialAgentDataSource[T],
+            cache: PersistentCache,
+            key: str,
+            ttl: int,
+            record: Type[ModelRecord],
+    ):
+        self._backend = backend
+        self._cache = cache
+        self._key = key
+        self._ttl = ttl
+        self._record = record
+
+    def query(self) -> Iterable[T]:
+        if self._ttl <= 0:
+            return self._backend.query()
+        result = self._cache.load(self._key, self._ttl, List[self._record])
+        if result is None:
+            result = list(self._backend.query())
+            self._cache.store(self._key, result)
+        return result
+
 
 class PyPureClientFlashArraySpecialAgentDataSource(FlashArraySpecialAgentDataSource[T], abc.ABC):
-    def __init__(self, cli: pypureclient.flasharray.client.Client):
+    record: Optional[Type[ModelRecord]] = None
+    """
+    The record type holding the attributes of the models the collectors read. Data sources without a record type return
+    the models of the client.
+    """
+
+    def __init__(
+            self,
+            cli: pypureclient.flasharray.client.Client,
+            item_filter: Optional[str] = None,
+            page_size: int = default_page_size,
+            raw: Optional[RawClient] = None,
+    ):
+        """
+        :param cli: The client to query.
+        :param item_filter: A REST API filter expression limiting the returned items. Only used by data sources for
+            endpoints that support filtering.
+        :param page_size: The maximum number of items fetched in a single request. Only used by paginated data sources.
+        :param raw: The client for requesting the parsed JSON instead of models. Only used by data sources for large
+            endpoints, which decode the JSON items into their records directly.
+        """
         self._cli = cli
+        self._filter = item_filter
+        self._page_size = page_size
+        self._raw = raw
+
+    def _records(self, items: Iterable) -> Iterable[T]:
+        """
+        This function projects the models returned by the client to the record type of the data source. If the data
+        source queries the raw client, the items are JSON objects and are decoded into the record type instead.
+        """
+        if self.record is None:
+            return items
+        if self._raw is not None:
+            return (from_dict(item, self.record) for item in items)
+        return map(projector(self.record), items)
 
 
 class PyPureClientFlashArraySpecialAgentPaginatedDataSource(PyPureClientFlashArraySpecialAgentDataSource[T]):
+    """
+    This data source fetches its items in pages of at most page_size items, following the continuation token of the
+    response until all pages have been fetched.
+    """
+
     @abc.abstractmethod
     def _query(self, continuation_token: str):
+        """
+        This function requests a single page. Implementations must pass self._page_size as the limit.
+        """
         pass
 
-    def query(self) -> List[T]:
-        result = []
+    def query(self) -> Iterator[T]:
         finished = False
         continuation_token = None
         while not finished:
@@ -60,47 +391,101 @@ class PyPureClientFlashArraySpecialAgentPaginatedDataSource(PyPureClientFlashArr
                 finished = True
             else:
                 continuation_token = resp.continuation_token
-            for item in resp.items:
-                result.append(item)
-        return result
+            yield from self._records(page_items(resp))
 
 
-class PyPureClientFlashArrayHardwareDataSource(PyPureClientFlashArraySpecialAgentDataSource[models.Hardware]):
-    def query(self) -> List[models.Hardware]:
-        return CheckResponse(self._cli.get_hardware()).items
+class PyPureClientFlashArraySpecialAgentOffsetPaginatedDataSource(PyPureClientFlashArraySpecialAgentDataSource[T]):
+    """
+    This data source fetches its items in pages of at most page_size items. Once the first page has been fetched, the
+    remaining pages are fetched concurrently by offset. It is meant for large collections, see paginate_by_offset().
+    """
 
-class PyPureClientFlashArrayPortDetailsDataSource(PyPureClientFlashArraySpecialAgentDataSource[models.NetworkInterfacesPortDetails]):
-    def query(self) -> List[models.NetworkInterfacesPortDetails]:
-        return CheckResponse(self._cli.get_network_interfaces_port_details()).items
+    def __init__(
+            self,
+            cli: pypureclient.flasharray.client.Client,
+            item_filter: Optional[str] = None,
+            page_size: int = default_page_size,
+            workers: int = default_pagination_workers,
+            raw: Optional[RawClient] = None,
+    ):
+        """
+        :param workers: The maximum number of pages fetched concurrently.
+        """
+        super().__init__(cli, item_filter, page_size, raw)
+        self._workers = workers
 
-class PyPureClientFlashArrayArraysDataSource(PyPureClientFlashArraySpecialAgentDataSource[models.Array]):
-    def query(self) -> List[models.Array]:
-        return CheckResponse(self._cli.get_arrays()).items
+    @abc.abstractmethod
+    def _query(self, offset: int):
+        """
+        This function requests the page starting at offset. Implementations must pass self._page_size as the limit.
+        """
+        pass
 
+    def query(self) -> Iterator[T]:
+        return self._records(paginate_by_offset(self._query, self._workers))
 
-class PyPureClientFlashArrayCertificatesDataSource(PyPureClientFlashArraySpecialAgentDataSource[models.Certificate]):
-    def query(self) -> List[models.Certificate]:
-        return CheckResponse(self._cli.get_certificates()).items
 
+class PyPureClientFlashArrayHardwareDataSource(PyPureClientFlashArraySpecialAgentDataSource[HardwareRecord]):
+    record = HardwareRecord
 
-class PyPureClientFlashArrayDrivesDataSource(PyPureClientFlashArraySpecialAgentPaginatedDataSource[models.Hardware]):
-    def _query(self, continuation_token):
-        return self._cli.get_drives(continuation_token=continuation_token)
+    def query(self) -> List[HardwareRecord]:
+        return list(self._records(CheckResponse(self._cli.get_hardware(filter=self._filter)).items))
 
+class PyPureClientFlashArrayPortDetailsDataSource(PyPureClientFlashArraySpecialAgentDataSource[PortDetailsRecord]):
+    record = PortDetailsRecord
 
-class PyPureClientFlashArrayAdminSettingsDataSource(PyPureClientFlashArraySpecialAgentDataSource[models.AdminSettings]):
-    def query(self) -> List[models.AdminSettings]:
-        return CheckResponse(self._cli.get_admins_settings()).items
+    def query(self) -> List[PortDetailsRecord]:
+        if self._raw is not None:
+            return list(self._records(CheckResponse(self._raw.get("network-interfaces/port-details")).items))
+        return list(self._records(CheckResponse(self._cli.get_network_interfaces_port_details()).items))
 
+class PyPureClientFlashArrayArraysDataSource(PyPureClientFlashArraySpecialAgentDataSource[ArrayRecord]):
+    record = ArrayRecord
 
-class PyPureClientFlashArrayArraysSettingsDataSource(PyPureClientFlashArraySpecialAgentDataSource[models.Array]):
-    def query(self) -> List[models.Arrays]:
-        return CheckResponse(self._cli.get_arrays()).items
+    def query(self) -> List[ArrayRecord]:
+        return list(self._records(CheckResponse(self._cli.get_arrays()).items))
 
 
-class PyPureClientFlashArrayDNSSettingsDataSource(PyPureClientFlashArraySpecialAgentDataSource[models.Dns]):
-    def query(self) -> List[models.Dns]:
-        return CheckResponse(self._cli.get_dns()).items
+class PyPureClientFlashArrayCertificatesDataSource(
+    PyPureClientFlashArraySpecialAgentPaginatedDataSource[CertificateRecord]):
+    record = CertificateRecord
+
+    def _query(self, continuation_token: str):
+        return self._cli.get_certificates(continuation_token=continuation_token, limit=self._page_size)
+
+
+class PyPureClientFlashArrayDrivesDataSource(
+    PyPureClientFlashArraySpecialAgentOffsetPaginatedDataSource[DriveRecord]):
+    record = DriveRecord
+
+    def _query(self, offset: int):
+        if self._raw is not None:
+            return self._raw.get("drives", filter=self._filter, offset=offset, limit=self._page_size)
+        return self._cli.get_drives(filter=self._filter, offset=offset, limit=self._page_size)
+
+
+class PyPureClientFlashArrayAlertsDataSource(
+    PyPureClientFlashArraySpecialAgentOffsetPaginatedDataSource[AlertRecord]):
+    record = AlertRecord
+
+    def _query(self, offset: int):
+        if self._raw is not None:
+            return self._raw.get("alerts", filter=self._filter, offset=offset, limit=self._page_size)
+        return self._cli.get_alerts(filter=self._filter, offset=offset, limit=self._page_size)
+
+
+class PyPureClientFlashArrayAdminSettingsDataSource(PyPureClientFlashArraySpecialAgentDataSource[AdminSettingsRecord]):
+    record = AdminSettingsRecord
+
+    def query(self) -> List[AdminSettingsRecord]:
+        return list(self._records(CheckResponse(self._cli.get_admins_settings()).items))
+
+
+class PyPureClientFlashArrayDNSSettingsDataSource(PyPureClientFlashArraySpecialAgentDataSource[DNSRecord]):
+    record = DNSRecord
+
+    def query(self) -> List[DNSRecord]:
+        return list(self._records(CheckResponse(self._cli.get_dns()).items))
 
 
 class PyPureClientFlashArrayPerformanceDataSource(
@@ -109,56 +494,71 @@ class PyPureClientFlashArrayPerformanceDataSource(
         return CheckResponse(self._cli.get_arrays_performance()).items
 
 
-class PyPureClientFlashArrayApiTokenDataSource(PyPureClientFlashArraySpecialAgentDataSource[models.AdminApiToken]):
-    def query(self) -> List[models.AdminApiToken]:
-        return CheckResponse(self._cli.get_admins_api_tokens()).items
+class PyPureClientFlashArrayApiTokenDataSource(
+    PyPureClientFlashArraySpecialAgentPaginatedDataSource[AdminAPITokenRecord]):
+    record = AdminAPITokenRecord
 
+    def _query(self, continuation_token: str):
+        return self._cli.get_admins_api_tokens(continuation_token=continuation_token, limit=self._page_size)
+
+
+class PyPureClientFlashArraySNMPServersDataSource(PyPureClientFlashArraySpecialAgentDataSource[SMTPServerRecord]):
+    record = SMTPServerRecord
 
-class PyPureClientFlashArraySNMPServersDataSource(PyPureClientFlashArraySpecialAgentDataSource[models.SmtpServer]):
-    def query(self) -> List[models.SmtpServer]:
-        return CheckResponse(self._cli.get_smtp_servers()).items
+    def query(self) -> List[SMTPServerRecord]:
+        return list(self._records(CheckResponse(self._cli.get_smtp_servers()).items))
 
 
 class PyPureClientFlashArrayArrayConnectionDataSource(
-    PyPureClientFlashArraySpecialAgentDataSource[models.ArrayConnection]):
-    def query(self) -> List[models.ArrayConnection]:
-        return CheckResponse(self._cli.get_array_connections()).items
+    PyPureClientFlashArraySpecialAgentPaginatedDataSource[ArrayConnectionRecord]):
+    record = ArrayConnectionRecord
+
+    def _query(self, continuation_token: str):
+        return self._cli.get_array_connections(continuation_token=continuation_token, limit=self._page_size)
 
 
 class PyPureClientFlashArrayNetworkInterfacesDataSource(
-    PyPureClientFlashArraySpecialAgentDataSource[models.NetworkInterface]):
-    def query(self) -> List[models.NetworkInterface]:
-        return CheckResponse(self._cli.get_network_interfaces()).items
+    PyPureClientFlashArraySpecialAgentPaginatedDataSource[NetworkInterfaceRecord]):
+    record = NetworkInterfaceRecord
+
+    def _query(self, continuation_token: str):
+        return self._cli.get_network_interfaces(continuation_token=continuation_token, limit=self._page_size)
 
 
 class PyPureClientFlashArrayHostsDataSource(
-    PyPureClientFlashArraySpecialAgentDataSource[models.Host]):
-    def query(self) -> List[models.Host]:
-        return CheckResponse(self._cli.get_hosts()).items
+    PyPureClientFlashArraySpecialAgentPaginatedDataSource[HostRecord]):
+    record = HostRecord
+
+    def _query(self, continuation_token: str):
+        if self._raw is not None:
+            return self._raw.get("hosts", continuation_token=continuation_token, limit=self._page_size)
+        return self._cli.get_hosts(continuation_token=continuation_token, limit=self._page_size)
 
 
 class PyPureClientFlashArrayVolumesDataSource(
-    PyPureClientFlashArraySpecialAgentDataSource[models.Volume]):
-    def query(self) -> List[models.Volume]:
-        return CheckResponse(self._cli.get_volumes()).items
+    PyPureClientFlashArraySpecialAgentOffsetPaginatedDataSource[VolumeRecord]):
+    record = VolumeRecord
+
+    def _query(self, offset: int):
+        if self._raw is not None:
+            return self._raw.get("volumes", offset=offset, limit=self._page_size)
+        return self._cli.get_volumes(offset=offset, limit=self._page_size)
 
 
 class PyPureClientFlashArraySupportDataSource(
-    PyPureClientFlashArraySpecialAgentDataSource[models.Support]):
-    def query(self) -> List[models.Support]:
-        return CheckResponse(self._cli.get_support()).items
+    PyPureClientFlashArraySpecialAgentDataSource[SupportRecord]):
+    record = SupportRecord
 
+    def query(self) -> List[SupportRecord]:
+        return list(self._records(CheckResponse(self._cli.get_support()).items))
 
-class PyPureClientFlashArrayControllerDataSource(
-    PyPureClientFlashArraySpecialAgentDataSource[models.Controller]):
-    def query(self) -> List[models.Controller]:
-        return CheckResponse(self._cli.get_controllers()).items
 
+class PyPureClientFlashArrayControllerDataSource(
+    PyPureClientFlashArraySpecialAgentPaginatedDataSource[ControllerRecord]):
+    record = ControllerRecord
 
-class PyPureClientFlashArrayNICDataSource(
-    PyPureClientFlashArraySpecialAgentDataSource[models.NetworkInterface]):
-    def query(self) -> List[models.NetworkInterface]:
-        return CheckResponse(self._cli.get_network_interfaces()).items
+    def _query(self, continuation_token: str):
+        return self._cli.get_controllers(continuation_token=continuation_token, limit=self._page_size)
 
 
 def _safe(object: any, attribute: str):
@@ -169,105 +569,257 @@ def _safe(object: any, attribute: str):
 
 
 class FlashArraySpecialAgent:
-    _cert_file = None
-
-    def __init__(self, cfg: FlashArraySpecialAgentConfiguration):
+    def __init__(self, cfg: FlashArraySpecialAgentConfiguration, tracer: Optional[Tracer] = None):
+        """
+        :param cfg: The configuration of the special agent.
+        :param tracer: The tracer to record the spans of the run with, if the run is traced.
+        """
         self._cfg = cfg
+        self._requests = RequestCounter(tracer)
+        self._stats = AgentStats(self._requests, tracer)
+        directory = cache_directory("flasharray", cfg.host)
+        self._session = SessionCache(directory, cfg.api_token, cfg.session_lifetime)
         ssl_cert = None
         agent = f'checkmk-purefa-'
         if cfg.verify_tls:
-            self._cert_file = tempfile.NamedTemporaryFile()
-            self._cert_file.write(cfg.cacert.encode('ascii'))
-            self._cert_file.flush()
-            ssl_cert = self._cert_file.name
-
-        self._cli = pypureclient.flasharray.client.Client(
-            cfg.host,
-            api_token=cfg.api_token,
-            ssl_cert=ssl_cert,
-            user_agent=f"checkmk-purefa-{__version__}"
-        )
+            ssl_cert = self._session.cert_file(cfg.cacert)
+
+        with self._stats.step("Client bootstrap"):
+            cli = self._session.client(
+                pypureclient.flasharray.client,
+                cfg.host,
+                api_token=cfg.api_token,
+                ssl_cert=ssl_cert,
+                user_agent=f"checkmk-purefa-{__version__}"
+            )
+        self._cli = self._requests.wrap(cli)
+        # The largest endpoints are requested as JSON if enabled, skipping the models of the client.
+        raw = RawClient.create(cli, self._requests) if cfg.raw_json else None
+        self._persistent_cache = PersistentCache(directory)
         self._hardware = CachingFlashArraySpecialAgentDataSource(
             PyPureClientFlashArrayHardwareDataSource(self._cli)
         )
-        self._drives = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayDrivesDataSource(self._cli)
+        self._hardware_components = SubsetFlashArraySpecialAgentDataSource(
+            self._hardware,
+            PyPureClientFlashArrayHardwareDataSource(self._cli, str(hardware_components_filter)),
+            hardware_components_filter,
+        )
+        self._drives = self._single_use(
+            PyPureClientFlashArrayDrivesDataSource(
+                self._cli, str(drives_filter), self._page_size("drives"), cfg.pagination_workers, raw
+            )
         )
         self._arrays = CachingFlashArraySpecialAgentDataSource(
             PyPureClientFlashArrayArraysDataSource(self._cli)
         )
         self._certificates = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayCertificatesDataSource(self._cli)
+            self._persistent("certificates", PyPureClientFlashArrayCertificatesDataSource(
+                self._cli, page_size=self._page_size("certificates")
+            ))
         )
         self._adminsettings = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayAdminSettingsDataSource(self._cli)
-        )
-        self._arraysettings = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayArraysSettingsDataSource(self._cli)
+            self._persistent("admin_settings", PyPureClientFlashArrayAdminSettingsDataSource(self._cli))
         )
         self._dnssettings = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayDNSSettingsDataSource(self._cli)
+            self._persistent("dns", PyPureClientFlashArrayDNSSettingsDataSource(self._cli))
         )
         self._performance = CachingFlashArraySpecialAgentDataSource(
             PyPureClientFlashArrayPerformanceDataSource(self._cli)
         )
         self._apitokens = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayApiTokenDataSource(self._cli)
+            self._persistent("api_tokens", PyPureClientFlashArrayApiTokenDataSource(
+                self._cli, page_size=self._page_size("api_tokens")
+            ))
         )
         self._smtpservers = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArraySNMPServersDataSource(self._cli)
+            self._persistent("smtp_servers", PyPureClientFlashArraySNMPServersDataSource(self._cli))
         )
         self._arrayconnections = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayArrayConnectionDataSource(self._cli)
+            PyPureClientFlashArrayArrayConnectionDataSource(self._cli, page_size=self._page_size("array_connections"))
         )
         self._networkinterfaces = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayNetworkInterfacesDataSource(self._cli)
+            PyPureClientFlashArrayNetworkInterfacesDataSource(
+                self._cli, page_size=self._page_size("network_interfaces")
+            )
         )
         self._port_details = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayPortDetailsDataSource(self._cli)
+            PyPureClientFlashArrayPortDetailsDataSource(self._cli, raw=raw)
         )
         self._hosts = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayHostsDataSource(self._cli)
+            self._persistent("hosts", PyPureClientFlashArrayHostsDataSource(
+                self._cli, page_size=self._page_size("hosts"), raw=raw
+            ))
         )
-        self._volumes = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayVolumesDataSource(self._cli)
+        self._volumes = self._single_use(
+            self._persistent("volumes", PyPureClientFlashArrayVolumesDataSource(
+                self._cli, page_size=self._page_size("volumes"), workers=cfg.pagination_workers, raw=raw
+            ))
         )
         self._support = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArraySupportDataSource(self._cli)
+            self._persistent("support", PyPureClientFlashArraySupportDataSource(self._cli))
         )
         self._controllers = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayControllerDataSource(self._cli)
+            PyPureClientFlashArrayControllerDataSource(self._cli, page_size=self._page_size("controllers"))
+        )
+        self._alert_state = None
+        alerts_query = None
+        if cfg.alerts is not None:
+            if cfg.alerts.incremental:
+                self._alert_state = AlertState(self._persistent_cache, cfg.alerts.closed_alerts_lifetime)
+                alerts_query = self._alert_state.filter()
+            else:
+                alerts_query = alerts_filter(int(1000 * (time.time() - cfg.alerts.closed_alerts_lifetime)))
+        self._alerts = self._single_use(
+            PyPureClientFlashArrayAlertsDataSource(
+                self._cli, alerts_query, self._page_size("alerts"), cfg.pagination_workers, raw
+            )
         )
-        self._nics = CachingFlashArraySpecialAgentDataSource(
-            PyPureClientFlashArrayNICDataSource(self._cli)
+        # The data sources each section is collected from, keyed by the name of the section. The results sections are
+        # named after the fields of the results section.
+        self._section_data_sources = {
+            "hardware": [self._hardware_components, self._controllers],
+            "certificates": [self._certificates],
+            "drives": [self._drives],
+            "array": [self._arrays],
+            "alerts": [self._alerts] if cfg.alerts is not None else [],
+            "arrayconnections": [self._arrayconnections],
+            "portdetails": [self._port_details],
+            "inventory": [
+                self._hardware,
+                self._arrays,
+                self._adminsettings,
+                self._smtpservers,
+                self._dnssettings,
+                self._apitokens,
+                self._networkinterfaces,
+                self._hosts,
+                self._volumes,
+                self._support,
+            ],
+        }
+
+    def _single_use(self, backend: FlashArraySpecialAgentDataSource[T]) -> FlashArraySpecialAgentDataSource[T]:
+        """
+        This function wraps data sources that are only queried once per run. In streaming mode they are used directly,
+        so their items are processed page by page instead of being kept in memory. Otherwise, they are cached so they
+        can be prefetched.
+        """
+        if self._cfg.streaming:
+            return backend
+        return CachingFlashArraySpecialAgentDataSource(backend)
+
+    def _page_size(self, key: str) -> int:
+        return self._cfg.page_sizes.get(key, default_page_size)
+
+    def _persistent(
+            self,
+            key: str,
+            backend: PyPureClientFlashArraySpecialAgentDataSource[T]
+    ) -> FlashArraySpecialAgentDataSource[T]:
+        return PersistentCachingFlashArraySpecialAgentDataSource(
+            backend,
+            self._persistent_cache,
+            key,
+            self._cfg.cache_ttls.get(key, 0),
+            backend.record,
         )
 
-    def __del__(self):
-        if self._cert_file is not None:
-            self._cert_file.close()
+    def requests(self) -> Dict[str, int]:
+        """
+        :return: The number of REST API requests sent in this run per endpoint.
+        """
+        return self._requests.requests()
+
+    def agent_stats(self) -> AgentStatsSection:
+        """
+        :return: The measurements of this run so far, see AgentStats.
+        """
+        return self._stats.section((self._cfg.agent_runtime.warn, self._cfg.agent_runtime.crit))
+
+    def prefetch(self, sections: Optional[Iterable[str]] = None):
+        """
+        This function fetches all data sources used by results() and inventory() concurrently, so a run takes about as
+        long as the slowest endpoint instead of the sum of all endpoints. A subset of a data source that is fetched as
+        well is not requested on its own, but taken from the complete items when it is queried.
+
+        :param sections: The names of the sections to fetch the data sources for. All sections by default.
+        """
+        if sections is None:
+            sections = self._section_data_sources.keys()
+        data_sources = []
+        for section in sections:
+            for data_source in self._section_data_sources[section]:
+                if isinstance(data_source, Prefetchable) and data_source not in data_sources:
+                    data_sources.append(data_source)
+        data_sources = [
+            data_source for data_source in data_sources
+            if not isinstance(data_source, SubsetFlashArraySpecialAgentDataSource) or
+            data_source.complete not in data_sources
+        ]
+        prefetch(data_sources, self._cfg.prefetch_workers)
+
+    def _result_collectors(self) -> Dict[str, Callable[[], SpecialAgentResult]]:
+        return {
+            "hardware": self._collect_hardware_components,
+            "certificates": self._collect_certificates,
+            "drives": self._collect_drives,
+            "array": self._collect_array,
+            "alerts": self._collect_alerts,
+            "arrayconnections": self._collect_arrayconnections,
+            "portdetails": self._collect_portdetails,
+        }
 
     def results(self) -> FlashArraySpecialAgentResultsSection:
         return FlashArraySpecialAgentResultsSection(
-            hardware=self._collect_hardware_components(),
-            certificates=self._collect_certificates(),
-            drives=self._collect_drives(),
-            array=self._collect_array(),
-            alerts=self._collect_alerts(),
-            arrayconnections=self._collect_arrayconnections(),
-            portdetails=self._collect_portdetails(),
+            **{name: collect() for name, collect in self._result_collectors().items()}
         )
 
+    def sections(self) -> Iterator[CheckmkSection]:
+        """
+        This function produces the sections of a run: one section per subsystem of the results, and the inventory. The
+        output of sections with an interval is reused as long as it is fresh, and their data sources are not fetched.
+        The last section holds the measurements of the run, so it must be requested after the others are written.
+        """
+        yield from self._stats.output(self._sections())
+        yield CheckmkSection(flasharray_agent_stats_section_id, self.agent_stats().to_section())
+
+    def _sections(self) -> Iterator[CheckmkSection]:
+        cached = CachedSections(self._persistent_cache, self._cfg.section_intervals)
+        with self._stats.step("Prefetch"):
+            self.prefetch(name for name in self._section_data_sources.keys() if not cached.fresh(name))
+        for name, collect in self._stats.collectors(self._result_collectors()).items():
+            yield cached.section(
+                name,
+                flasharray_section_id(name),
+                lambda: encode_section_lines({name: collect()}.items()),
+            )
+        # The parts of the inventory are collected before the header is written, so a failing collector can't leave a
+        # truncated section behind. They are still encoded one at a time while the section is written.
+        yield cached.section(
+            "inventory",
+            flasharray_inventory_section_id,
+            lambda: encode_section_lines([
+                (name, inventorize())
+                for name, inventorize in self._stats.collectors(self._inventory_collectors(), "inventory/").items()
+            ]),
+        )
+
+    def _inventory_collectors(self) -> Dict[str, Callable[[], SpecialAgentInventory]]:
+        return {
+            "hardware": self._inventorize_hardware,
+            "software": self._inventorize_software,
+            "dns": self._inventorize_dns,
+            "apitokens": self._inventorize_apitokens,
+            "network_interfaces": self._inventorize_network_interfaces,
+            "hosts": self._inventorize_hosts,
+            "volumes": self._inventorize_volumes,
+            "support": self._inventorize_support,
+            "nics": self._inventorize_nics,
+        }
+
     def inventory(self) -> FlashArraySpecialAgentInventorySection:
         return FlashArraySpecialAgentInventorySection(
-            hardware=self._inventorize_hardware(),
-            software=self._inventorize_software(),
-            dns=self._inventorize_dns(),
-            apitokens=self._inventorize_apitokens(),
-            network_interfaces=self._inventorize_network_interfaces(),
-            hosts=self._inventorize_hosts(),
-            volumes=self._inventorize_volumes(),
-            support=self._inventorize_support(),
-            nics=self._inventorize_nics(),
+            **{name: inventorize() for name, inventorize in self._inventory_collectors().items()}
         )
 
     def _collect_portdetails(self) -> SpecialAgentResult:
@@ -277,10 +829,7 @@ class FlashArraySpecialAgent:
         for port in port_details:
             for metric in ["temperature", "voltage", "tx_bias", "tx_power", "rx_power"]:
                 for val in getattr(port, metric):
-                    if hasattr(val, "channel") and val.channel is None:
-                        name = f"Port {port.name} {metric} (channel {val.channel})"
-                    else:
-                        name = f"Port {port.name} {metric}"
+                    name = f"Port {port.name} {metric}"
                     state = State.UNKNOWN
                     if val.status in ["ok", "healthy","empty"]:
                         state = State.OK
@@ -323,95 +872,72 @@ class FlashArraySpecialAgent:
 
     def _collect_drives(self) -> SpecialAgentResult:
         result = SpecialAgentResult()
-        finished = False
-        continuation_token = None
-        while not finished:
-            resp = CheckResponse(self._cli.get_drives(continuation_token=continuation_token))
-            if resp.continuation_token is None:
-                finished = True
-            else:
-                continuation_token = resp.continuation_token
-            for item in resp.items:
-                state = State.UNKNOWN
-                if item.status in ["healthy", "empty"]:
-                    state = State.OK
-                elif item.status in [
-                    "unhealthy", "identifying", "recovering", "unadmitted", "unrecognized", "updating"
-                ]:
-                    state = State.WARN
-                elif item.status in ["failed", "missing"]:
-                    state = State.CRIT
-                elif item.status in ["unused"]:
-                    continue
-                result.add_service(item.name, Result(
-                    state=state,
-                    summary=item.status,
-                    # details=item.details # API lies, it is not returning details
-                ))
+        for item in self._drives.query():
+            state = State.UNKNOWN
+            if item.status in ["healthy", "empty"]:
+                state = State.OK
+            elif item.status in [
+                "unhealthy", "identifying", "recovering", "unadmitted", "unrecognized", "updating"
+            ]:
+                state = State.WARN
+            elif item.status in ["failed", "missing"]:
+                state = State.CRIT
+            result.add_service(item.name, Result(
+                state=state,
+                summary=item.status,
+                # details=item.details # API lies, it is not returning details
+            ))
         return result
 
     def _collect_arrayconnections(self) -> SpecialAgentResult:
         result = SpecialAgentResult()
-        finished = False
-        continuation_token = None
-        while not finished:
-            resp = CheckResponse(self._cli.get_array_connections(continuation_token=continuation_token))
-            if resp.continuation_token is None:
-                finished = True
-            else:
-                continuation_token = resp.continuation_token
-            for item in resp.items:
-                state = State.UNKNOWN
-                if item.status == "connected":
-                    state = State.OK
-                if item.status == "connecting" or item.status == "partially_connected" or item.status == "unbalanced":
-                    state = State.WARN
-                result.add_service(item.name, Result(
-                    state=state,
-                    summary=item.status,
-                    details=None
-                ))
-            return result
+        for item in self._arrayconnections.query():
+            state = State.UNKNOWN
+            if item.status == "connected":
+                state = State.OK
+            if item.status == "connecting" or item.status == "partially_connected" or item.status == "unbalanced":
+                state = State.WARN
+            result.add_service(item.name, Result(
+                state=state,
+                summary=item.status,
+                details=None
+            ))
+        return result
 
     def _collect_alerts(self) -> SpecialAgentResult:
         result = SpecialAgentResult()
         if self._cfg.alerts is None:
             return result
-        finished = False
-        continuation_token = None
-        while not finished:
-            resp = CheckResponse(self._cli.get_alerts(continuation_token=continuation_token))
-            if resp.continuation_token is None:
-                finished = True
-            else:
-                continuation_token = resp.continuation_token
-            for item in resp.items:
-                state = State.UNKNOWN
-                create = False
-                if item.state == "open" or item.state == "closing":
+        alerts = self._alerts.query()
+        if self._alert_state is not None:
+            alerts = self._alert_state.update(alerts)
+        for item in alerts:
+            state = State.UNKNOWN
+            create = False
+            if item.state == "open" or item.state == "closing":
+                create = True
+                if item.severity == "info" or item.severity == "warning" or item.severity == "hidden":
+                    state = state.WARN
+                if item.severity == "critical":
+                    state = state.CRIT
+            elif item.state == "closed":
+                now = time.time()
+                age = (now - (item.updated / 1000))
+                if age < self._cfg.alerts.closed_alerts_lifetime:
                     create = True
-                    if item.severity == "info" or item.severity == "warning" or item.severity == "hidden":
-                        state = state.WARN
-                    if item.severity == "critical":
-                        state = state.CRIT
-                elif item.state == "closed":
-                    now = time.time()
-                    age = (now - (item.updated / 1000))
-                    if age < self._cfg.alerts.closed_alerts_lifetime:
-                        create = True
-                        state = state.OK
-                if create and (
-                        item.severity not in ["info", "warning", "critical", "hidden"] or
-                        (item.severity == "info" and self._cfg.alerts.info) or
-                        (item.severity == "warning" and self._cfg.alerts.warning) or
-                        (item.severity == "critical" and self._cfg.alerts.critical) or
-                        (item.severity == "hidden" and self._cfg.alerts.hidden)
-                ):
-                    result.add_service(f"Alert {item.name}", Result(
-                        state=state,
-                        summary=item.summary,
-                        details=item.description
-                    ))
+                    state = state.OK
+            if create and (
+                    item.severity not in ["info", "warning", "critical", "hidden"] or
+                    (item.severity == "info" and self._cfg.alerts.info) or
+                    (item.severity == "warning" and self._cfg.alerts.warning) or
+                    (item.severity == "critical" and self._cfg.alerts.critical) or
+                    (item.severity == "hidden" and self._cfg.alerts.hidden)
+            ):
+                result.add_service(f"Alert {item.name}", Result(
+                    state=state,
+                    summary=item.summary,
+                    details=item.description
+                ))
         return result
 
     def _collect_performance(self) -> SpecialAgentResult:
@@ -423,7 +949,8 @@ class FlashArraySpecialAgent:
             customizations[item.api_type] = item
 
         result = SpecialAgentResult()
-        for item in self._hardware.query():
+        controllers = None
+        for item in self._hardware_components.query():
             state = State.UNKNOWN
             if item.status == "ok" or item.status == "healthy":
                 state = State.OK
@@ -431,47 +958,36 @@ class FlashArraySpecialAgent:
                 state = State.WARN
             elif item.status == "critical":
                 state = State.CRIT
-            elif item.status == "unused" or item.status == "not_installed":
-                continue
+            summary = item.status
+            details = item.details
             if item.type == "controller":
-                for controller in self._controllers.query():
-                    if controller.name == item.name:
-                        item.status = controller.status
-                        item.details = controller.mode
+                if controllers is None:
+                    controllers = self._controllers.index(name_key)
+                for controller in controllers.get(item.name):
+                    summary = controller.status
+                    details = controller.mode
             name = item.name
             if item.type in customizations:
                 name = str(customizations[item.type].prefix) + str(name) + str(customizations[item.type].suffix)
-            try:
-                result.add_service(name, Result(
-                    state=state,
-                    summary=item.status,
-                    details=item.details
+            result.add_service(name, Result(
+                state=state,
+                summary=summary,
+                details=details
+            ))
+
+            if item.temperature is not None:
+                result.add_metric(f"{name}", Metric(
+                    value=item.temperature,
                 ))
-            except AttributeError:
-                result.add_service(name, Result(
-                    state=state,
-                    summary=item.status,
+            if item.speed is not None:
+                result.add_metric(f"{name}", Metric(
+                    value=item.speed,
                 ))
-
-            try:
-                if item.temperature is not None:
-                    result.add_metric(f"{name}", Metric(
-                        value=item.temperature,
-                    ))
-            except AttributeError:
-                pass
-            try:
-                if item.speed is not None:
-                    result.add_metric(f"{name}", Metric(
-                        value=item.speed,
-                    ))
-            except AttributeError:
-                pass
         return result
 
     def _inventorize_nics(self) -> SpecialAgentInventory:
         result = SpecialAgentInventory()
-        for nic_item in self._nics.query():
+        for nic_item in self._networkinterfaces.query():
             name = self._resolve_attr(nic_item, ["name"])
             speed = self._resolve_attr(nic_item, ["speed"])
             interface_type = self._resolve_attr(nic_item, ["interface_type"])
@@ -513,7 +1029,7 @@ class FlashArraySpecialAgent:
                 ))
             if nic_item.interface_type == "fc":
                 fc = nic_item.fc
-                wwn = self._resolve_attr(nic_item, ["wwn"])
+                wwn = self._resolve_attr(fc, ["wwn"])
                 result.add_table_row(NIC(
                     name=name,
                     speed=speed,
@@ -533,49 +1049,25 @@ class FlashArraySpecialAgent:
         smtp_server = None
         lockout_duration = None
         for adminsettings_item in self._adminsettings.query():
-            try:
-                if adminsettings_item.single_sign_on_enabled is not None:
-                    single_sign_on_enabled = adminsettings_item.single_sign_on_enabled
-            except AttributeError:
-                pass
-            try:
-                if adminsettings_item.min_password_length is not None:
-                    min_password_length = adminsettings_item.min_password_length
-            except AttributeError:
-                pass
-            try:
-                if adminsettings_item.max_login_attempts is not None:
-                    max_login_attempts = adminsettings_item.max_login_attempts
-            except AttributeError:
-                pass
-            try:
-                if adminsettings_item.lockout_duration is not None:
-                    lockout_duration = adminsettings_item.lockout_duration
-            except AttributeError:
-                pass
-        for arraysettings_item in self._arraysettings.query():
-            try:
-                if arraysettings_item.os is not None:
-                    array_os = arraysettings_item.os
-            except AttributeError:
-                pass
-            try:
-                if arraysettings_item.version is not None:
-                    array_version = arraysettings_item.version
-            except AttributeError:
-                pass
-            try:
-                if arraysettings_item.ntp_servers is not None:
-                    ntp_servers = ','.join(arraysettings_item.ntp_servers)
-            except AttributeError:
-                pass
+            if adminsettings_item.single_sign_on_enabled is not None:
+                single_sign_on_enabled = adminsettings_item.single_sign_on_enabled
+            if adminsettings_item.min_password_length is not None:
+                min_password_length = adminsettings_item.min_password_length
+            if adminsettings_item.max_login_attempts is not None:
+                max_login_attempts = adminsettings_item.max_login_attempts
+            if adminsettings_item.lockout_duration is not None:
+                lockout_duration = adminsettings_item.lockout_duration
+        for arraysettings_item in self._arrays.query():
+            if arraysettings_item.os is not None:
+                array_os = arraysettings_item.os
+            if arraysettings_item.version is not None:
+                array_version = arraysettings_item.version
+            if arraysettings_item.ntp_servers is not None:
+                ntp_servers = ','.join(arraysettings_item.ntp_servers)
         smtp_servers = []
         for smtpservers_item in self._smtpservers.query():
-            try:
-                if smtpservers_item.relay_host is not None:
-                    smtp_servers.append(smtpservers_item.relay_host)
-            except AttributeError:
-                pass
+            if smtpservers_item.relay_host is not None:
+                smtp_servers.append(smtpservers_item.relay_host)
 
         result.add_attributes(FlashArraySoftwareAttributes(
             single_sign_on_enabled=single_sign_on_enabled,
@@ -595,14 +1087,11 @@ class FlashArraySpecialAgent:
             if apitoken_item.name is not None:
                 created_at = None
                 expires_at = None
-                try:
-                    created_at = apitoken_item.api_token.created_at / 1000
-                except AttributeError:
-                    pass
-                try:
-                    expires_at = apitoken_item.api_token.expires_at / 1000
-                except AttributeError:
-                    pass
+                api_token = apitoken_item.api_token
+                if api_token is not None and api_token.created_at is not None:
+                    created_at = api_token.created_at / 1000
+                if api_token is not None and api_token.expires_at is not None:
+                    expires_at = api_token.expires_at / 1000
                 result.add_table_row(APIToken(
                     name=apitoken_item.name,
                     created_at=created_at,
@@ -668,6 +1157,7 @@ class FlashArraySpecialAgent:
 
     def _inventorize_network_interfaces(self) -> SpecialAgentInventory:
         result = SpecialAgentInventory()
+        hardware = None
         for networkinterface_item in self._networkinterfaces.query():
             vlans = []
             vlan = self._resolve_attr(networkinterface_item, ["eth", "vlan"])
@@ -677,20 +1167,16 @@ class FlashArraySpecialAgent:
             status = None
             administrative_status = None
             networkinterface_item_name = self._resolve_attr(networkinterface_item, ["name"])
-            for hardware_item in self._hardware.query():
+            hardware_items = []
+            if networkinterface_item_name is not None:
+                if hardware is None:
+                    hardware = self._hardware.index(lower_name_key)
+                hardware_items = hardware.get(networkinterface_item_name.lower())
+            for hardware_item in hardware_items:
                 hardware_item_type = self._resolve_attr(hardware_item, ["type"])
-                hardware_item_name = self._resolve_attr(hardware_item, ["name"])
-                if (
-                        (hardware_item_type == "eth_port" or hardware_item_type == "fc") and
-                        hardware_item_name is not None and
-                        networkinterface_item_name is not None and
-                        hardware_item_name.lower() == networkinterface_item_name.lower()
-                ):
-                    try:
-                        if hardware_item.speed is not None:
-                            speed = hardware_item.speed
-                    except AttributeError:
-                        pass
+                if hardware_item_type == "eth_port" or hardware_item_type == "fc":
+                    if hardware_item.speed is not None:
+                        speed = hardware_item.speed
 
                     if hardware_item.status not in ["unused", "not_installed"]:
                         if hardware_item.status in ["healthy", "ok"]:
@@ -801,12 +1287,7 @@ class FlashArraySpecialAgent:
                 # Inventorized through the interfaces call
                 continue
             elif hardware_item.type == "fc_port":
-                speed = None
-                try:
-                    if hardware_item.speed is not None:
-                        speed = hardware_item.speed
-                except AttributeError:
-                    pass
+                speed = hardware_item.speed
                 status = None
                 if hardware_item.status not in ["unused", "not_installed"]:
                     if hardware_item.status in ["healthy", "ok"]:
@@ -862,39 +1343,35 @@ class FlashArraySpecialAgent:
                 summary="%.1f%% full (%s of %s)" % (ratio, format_bytes(physical), format_bytes(capacity))
             )
             for name, value in {
-                "total physical": lambda: space.total_physical,
-                "shared": lambda: space.shared,
-                "snapshots": lambda: space.snapshots,
-                "system": lambda: space.system,
-                "total provisioned": lambda: space.total_provisioned,
-                "used provisioned": lambda: space.used_provisioned,
-                "total capacity": lambda: item.capacity
+                "total physical": space.total_physical,
+                "shared": space.shared,
+                "snapshots": space.snapshots,
+                "system": space.system,
+                "total provisioned": space.total_provisioned,
+                "used provisioned": space.used_provisioned,
+                "total capacity": item.capacity
             }.items():
-                try:
+                if value is not None:
                     result.add_metric_with_service(
                         name,
                         Metric(
-                            value=value(),
+                            value=value,
                         ),
-                        summary=format_bytes(value()),
+                        summary=format_bytes(value),
                     )
-                except AttributeError:
-                    pass
             for name, value in {
-                "total reduction": lambda: space.total_reduction,
-                "data reduction": lambda: space.data_reduction,
+                "total reduction": space.total_reduction,
+                "data reduction": space.data_reduction,
             }.items():
-                try:
+                if value is not None:
                     result.add_metric_with_service(
                         name,
                         Metric(
-                            value=value(),
+                            value=value,
                         ),
-                        summary=str("%.1f to 1" % value()),
+                        summary=str("%.1f to 1" % value),
                     )
-                except AttributeError:
-                    pass
-            try:
+            if space.thin_provisioning is not None:
                 thin_provisioning = space.thin_provisioning * 100
                 result.add_metric_with_service(
                     "thin provisioning",
@@ -903,8 +1380,6 @@ class FlashArraySpecialAgent:
                     ),
                     summary="%.1f%%" % thin_provisioning
                 )
-            except AttributeError:
-                pass
         return result
 
     def _collect_certificates(self) -> SpecialAgentResult:
@@ -927,28 +1402,28 @@ class FlashArraySpecialAgent:
         return result
 
 
-def run(stdin: TextIO, stdout: TextIO) -> int:
+def run(stdin: TextIO, stdout: TextIO, argv: Sequence[str] = ()) -> int:
     """
     This function runs the special agent and produces the output data.
     :param stdin: The standard input to read the configuration from.
     :param stdout: The standard output to write the section to.
+    :param argv: The command line options, see special_agent_argument_parser().
     :return: The return code.
     """
+    args = special_agent_argument_parser("FlashArray").parse_args(argv)
     stdin_data = stdin.read()
     cfg: FlashArraySpecialAgentConfiguration = FlashArraySpecialAgentConfiguration.from_json(stdin_data)
-    try:
-        cli = FlashArraySpecialAgent(cfg)
-    except Exception as e:
-        logging.fatal(f"Invalid FlashArray configuration or FlashArray not reachable at {cfg.host} ({e.__str__()}")
-        return 1
-    section = CheckmkSection(
-        flasharray_results_section_id,
-        cli.results()
-    )
-    stdout.write(str(section))
-    section = CheckmkSection(
-        flasharray_inventory_section_id,
-        cli.inventory()
-    )
-    stdout.write(str(section))
-    return 0
+    with profile(args.profile, args.profile_dir, f"flasharray-{cfg.host}", args.profile_top) as tracer:
+        if tracer is not None:
+            stdout = tracer.stream(stdout)
+        try:
+            cli = FlashArraySpecialAgent(cfg, tracer)
+        except Exception as e:
+            logging.fatal(f"Invalid FlashArray configuration or FlashArray not reachable at {cfg.host} ({e.__str__()}")
+            return 1
+        for section in cli.sections():
+            section.write(stdout)
+            stdout.flush()
+        if args.stats:
+            print(cli.agent_stats().report(), file=sys.stderr)
+        return 0
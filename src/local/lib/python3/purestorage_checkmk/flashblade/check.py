@@ -4,54 +4,69 @@ from typing import Optional
 from cmk.base.api.agent_based.checking_classes import DiscoveryResult, CheckResult, Service
 from cmk.base.api.agent_based.inventory_classes import InventoryResult
 from cmk.base.api.agent_based.type_defs import StringTable
-from purestorage_checkmk.checkmk import result_to_checkmk, result_to_metric, result_to_attributes, result_to_table_row
-from purestorage_checkmk.flashblade.common import FlashBladeSpecialAgentResultsSection, \
-    FlashBladeSpecialAgentInventorySection
+from purestorage_checkmk.checkmk import result_to_checkmk, result_to_metric, result_to_attributes, result_to_table_row, \
+    table_to_table_rows, agent_stats_to_checkmk
+from purestorage_checkmk.common import IndexedResultsSection, AgentStatsSection, indexed_items, indexed_results, \
+    legacy_results_sections
+from purestorage_checkmk.flashblade.common import FlashBladeSpecialAgentInventorySection
 
 
-def parse_flashblade(string_table: StringTable) -> FlashBladeSpecialAgentResultsSection:
-    return FlashBladeSpecialAgentResultsSection.from_section(string_table[0][0])
+def parse_flashblade(string_table: StringTable) -> IndexedResultsSection:
+    return IndexedResultsSection.from_string_table(string_table)
 
 
 def parse_flashblade_inventory(
         string_table: StringTable
 ) -> FlashBladeSpecialAgentInventorySection:
-    return FlashBladeSpecialAgentInventorySection.from_section(string_table[0][0])
+    return FlashBladeSpecialAgentInventorySection.from_string_table(string_table)
 
 
-def discover_purestorage_flashblade(section: Optional[FlashBladeSpecialAgentResultsSection] = None) -> DiscoveryResult:
+def discover_purestorage_flashblade(
+        section_purestorage_flashblade_hardware: Optional[IndexedResultsSection] = None,
+        section_purestorage_flashblade_alerts: Optional[IndexedResultsSection] = None,
+        section_purestorage_flashblade_certificates: Optional[IndexedResultsSection] = None,
+        section_purestorage_flashblade_space: Optional[IndexedResultsSection] = None,
+        section_purestorage_flashblade: Optional[IndexedResultsSection] = None,
+) -> DiscoveryResult:
     """
-    This function discovers the services of the FlashBlade.
-    :param section: Data from the special agent.
+    This function discovers the services of the FlashBlade. The special agent sends one section per subsystem, each of
+    which may be missing, for example if it failed or is not configured. The single results section of older versions
+    of the special agent is read if none of them is present.
     :return:
     """
-    if section is None:
-        return
-    for field in fields(FlashBladeSpecialAgentResultsSection):
-        for name in getattr(section, field.name).services.keys():
-            yield Service(item=name)
-        for name in getattr(section, field.name).metrics.keys():
-            yield Service(item=name)
+    for name in indexed_items(legacy_results_sections((
+            section_purestorage_flashblade_hardware,
+            section_purestorage_flashblade_alerts,
+            section_purestorage_flashblade_certificates,
+            section_purestorage_flashblade_space,
+        ), section_purestorage_flashblade)):
+        yield Service(item=name)
 
 
 def check_purestorage_flashblade(
         item: str = "",
-        section: Optional[FlashBladeSpecialAgentResultsSection] = None,
+        section_purestorage_flashblade_hardware: Optional[IndexedResultsSection] = None,
+        section_purestorage_flashblade_alerts: Optional[IndexedResultsSection] = None,
+        section_purestorage_flashblade_certificates: Optional[IndexedResultsSection] = None,
+        section_purestorage_flashblade_space: Optional[IndexedResultsSection] = None,
+        section_purestorage_flashblade: Optional[IndexedResultsSection] = None,
 ) -> CheckResult:
     """
-    This function parses the section from the special agent and returns the result. It will be invoked
+    This function returns the result for an item from the sections of the special agent. It will be invoked
     once per discovered item.
     :param item: The item being checked.
-    :param section: The section received from the special agent.
     :return: The check result.
     """
-    if section is None:
-        return
-    for field in fields(FlashBladeSpecialAgentResultsSection):
-        if item in getattr(section, field.name).services:
-            yield result_to_checkmk(getattr(section, field.name).services[item])
-        if item in getattr(section, field.name).metrics:
-            yield result_to_metric(item, getattr(section, field.name).metrics[item])
+    for service, metric in indexed_results(item, legacy_results_sections((
+            section_purestorage_flashblade_hardware,
+            section_purestorage_flashblade_alerts,
+            section_purestorage_flashblade_certificates,
+            section_purestorage_flashblade_space,
+        ), section_purestorage_flashblade)):
+        if service is not None:
+            yield result_to_checkmk(service)
+        if metric is not None:
+            yield result_to_metric(item, metric)
 
 
 def inventory_purestorage_flashblade(
@@ -62,3 +77,20 @@ def inventory_purestorage_flashblade(
             yield result_to_attributes(attributes)
         for table_row in getattr(section, field.name).inventory_table_rows:
             yield result_to_table_row(table_row)
+        for table in getattr(section, field.name).inventory_tables:
+            yield from table_to_table_rows(table)
+
+
+def parse_flashblade_agent_stats(string_table: StringTable) -> AgentStatsSection:
+    return AgentStatsSection.from_string_table(string_table)
+
+
+def discover_purestorage_flashblade_agent_stats(section: AgentStatsSection) -> DiscoveryResult:
+    yield Service()
+
+
+def check_purestorage_flashblade_agent_stats(section: AgentStatsSection) -> CheckResult:
+    """
+    This function reports how long the last run of the special agent took and where the time went.
+    """
+    yield from agent_stats_to_checkmk(section)
@@ -9,9 +9,20 @@ from purestorage_checkmk.common import SpecialAgentResult, AbstractSpecialAgentS
 
 flashblade_results_section_id = "purestorage_flashblade"
 flashblade_inventory_section_id = "purestorage_flashblade_inventory"
+flashblade_agent_stats_section_id = "purestorage_flashblade_agent_stats"
+
+
+def flashblade_section_id(subsystem: str) -> str:
+    """
+    This function returns the ID of the section holding the results of a single subsystem, e.g. the hardware.
+    """
+    return f"{flashblade_results_section_id}_{subsystem}"
+
 
 default_cert_warn = 90
 default_cert_crit = 30
+default_runtime_warn = 45
+default_runtime_crit = 55
 default_closed_alerts_lifetime = 3600
 default_alert_crit = 30
 default_array_space_warn = 80
@@ -20,6 +31,30 @@ default_filesystem_space_warn = 80
 default_filesystem_space_crit = 90
 default_objectstore_space_warn = 80
 default_objectstore_space_crit = 90
+default_prefetch_workers = 8
+default_session_lifetime = 30 * 60
+default_cache_ttls = {
+    "api_tokens": 4 * 3600,
+    "certificates": 4 * 3600,
+    "dns": 4 * 3600,
+    "smtp_servers": 4 * 3600,
+    "support": 4 * 3600,
+}
+default_section_intervals = {
+    "space": 5 * 60,
+    "certificates": 4 * 3600,
+    "inventory": 4 * 3600,
+}
+default_page_size = 1000
+default_pagination_workers = 4
+default_page_sizes = {
+    "alerts": default_page_size,
+    "api_tokens": default_page_size,
+    "blades": default_page_size,
+    "certificates": default_page_size,
+    "hardware": default_page_size,
+    "network_interfaces": default_page_size,
+}
 
 
 @dataclasses.dataclass
@@ -28,6 +63,7 @@ class AlertsConfiguration:
     info: bool
     warning: bool
     critical: bool
+    incremental: bool = False
 
 
 @dataclasses.dataclass
@@ -68,6 +104,22 @@ class FlashBladeSpecialAgentConfiguration(AbstractSpecialAgentConfiguration):
         default_objectstore_space_warn,
         default_objectstore_space_crit
     ))
+    prefetch_workers: int = default_prefetch_workers
+    cache_ttls: typing.Dict[str, int] = dataclasses.field(
+        default_factory=dict,
+    )
+    session_lifetime: int = 0
+    streaming: bool = False
+    page_sizes: typing.Dict[str, int] = dataclasses.field(
+        default_factory=dict,
+    )
+    pagination_workers: int = default_pagination_workers
+    section_intervals: typing.Dict[str, int] = dataclasses.field(
+        default_factory=dict,
+    )
+    agent_runtime: LimitConfiguration = dataclasses.field(
+        default_factory=lambda: LimitConfiguration(default_runtime_warn, default_runtime_crit)
+    )
 
 
 @dataclasses.dataclass
@@ -78,6 +130,11 @@ class FlashBladeSpecialAgentResultsSection(AbstractSpecialAgentSection):
     space: SpecialAgentResult
 
 
+flashblade_section_ids = [
+    flashblade_section_id(field.name) for field in dataclasses.fields(FlashBladeSpecialAgentResultsSection)
+]
+
+
 @dataclasses.dataclass
 class FlashBladeSpecialAgentInventorySection(AbstractSpecialAgentSection):
     hardware: SpecialAgentInventory
@@ -91,6 +148,8 @@ class FlashBladeSpecialAgentInventorySection(AbstractSpecialAgentSection):
 
 @dataclasses.dataclass
 class FlashBladeSoftwareAttributes(Attributes):
+    __slots__ = ()
+
     def __init__(
             self,
             single_sign_on_enabled: typing.Optional[bool] = None,
@@ -7,7 +7,9 @@ from purestorage_checkmk.common import SpecialAgentConfiguration, LimitConfigura
 from purestorage_checkmk.flashblade.common import FlashBladeSpecialAgentConfiguration, flashblade_results_section_id, \
     default_cert_warn, default_cert_crit, AlertsConfiguration, default_array_space_warn, default_array_space_crit, \
     default_filesystem_space_warn, default_filesystem_space_crit, default_objectstore_space_warn, \
-    default_objectstore_space_crit, FlashBladeHardwareServiceNameCustomization
+    default_objectstore_space_crit, FlashBladeHardwareServiceNameCustomization, default_prefetch_workers, \
+    default_cache_ttls, default_session_lifetime, default_page_sizes, \
+    default_pagination_workers, default_section_intervals, default_runtime_warn, default_runtime_crit
 
 
 def _build_parameters(
@@ -30,7 +32,8 @@ def _build_parameters(
             params["alerts"]["closed_alerts_lifetime"],
             params["alerts"]["severities"]["info"],
             params["alerts"]["severities"]["warning"],
-            params["alerts"]["severities"]["critical"]
+            params["alerts"]["severities"]["critical"],
+            incremental=bool(params["alerts"]["incremental"]) if "incremental" in params["alerts"] else True,
         )
 
     hardware = []
@@ -44,6 +47,21 @@ def _build_parameters(
                 )
             )
 
+    cache_ttls = dict(default_cache_ttls)
+    if "cache" in params:
+        for key, ttl in params["cache"].items():
+            cache_ttls[key] = int(ttl)
+
+    page_sizes = dict(default_page_sizes)
+    if "page_sizes" in params:
+        for key, page_size in params["page_sizes"].items():
+            page_sizes[key] = int(page_size)
+
+    section_intervals = dict(default_section_intervals)
+    if "section_intervals" in params:
+        for key, interval in params["section_intervals"].items():
+            section_intervals[key] = int(interval)
+
     cfg = FlashBladeSpecialAgentConfiguration(
         str(host_ip),
         str(params["apitoken"]),
@@ -75,6 +93,19 @@ def _build_parameters(
             default_crit=default_objectstore_space_crit,
             prefix="objectstore_used_"
         ),
+        int(params["prefetch_workers"]) if "prefetch_workers" in params else default_prefetch_workers,
+        cache_ttls,
+        int(params["session_lifetime"]) if "session_lifetime" in params else default_session_lifetime,
+        bool(params["streaming"]) if "streaming" in params else False,
+        page_sizes,
+        int(params["pagination_workers"]) if "pagination_workers" in params else default_pagination_workers,
+        section_intervals,
+        LimitConfiguration.default(
+            params["agent_runtime"] if "agent_runtime" in params else {},
+            default_warn=default_runtime_warn,
+            default_crit=default_runtime_crit,
+            prefix="runtime_"
+        ),
     )
 
     return SpecialAgentConfiguration(
@@ -1,58 +1,299 @@
 import abc
+import dataclasses
 import logging
-import tempfile
+import sys
+import threading
 import time
-from typing import TextIO, TypeVar, Generic, List, Optional
+from typing import TextIO, TypeVar, Generic, List, Optional, Iterable, Iterator, Dict, Callable, Type, Hashable, \
+    Sequence
 
 import pypureclient
-from pypureclient.flashblade.FB_2_13 import models
 
 from purestorage_checkmk.common import SpecialAgentResult, State, Result, Metric, CheckmkSection, CheckResponse, \
     NetworkAddressTableRow, NetworkInterfaceTableRow, SpecialAgentInventory, ChassisAttributes, PSUTableRow, \
     OtherHardwareComponentTableRow, FanTableRow, ManagementPortTableRow, NetworkRouteTableRow, ipv4_regex, \
     NetworkInterfaceStatus, HardwareModuleTableRow, DriveController, Compare, SupportAttributes, DNSAttributes, \
-    SMTPAttributes, format_bytes, APIToken
+    SMTPAttributes, format_bytes, APIToken, Prefetchable, prefetch, PersistentCache, cache_directory, SessionCache, \
+    AlertRecord, AlertState, ItemFilter, alerts_filter, page_items, \
+    paginate_by_offset, RequestCounter, CachedSections, encode_section_lines, ModelRecord, projector, \
+    ItemIndex, name_key, AgentStats, AgentStatsSection, special_agent_argument_parser, profile, Tracer
 from purestorage_checkmk.flashblade.common import FlashBladeSpecialAgentConfiguration, \
     FlashBladeSpecialAgentResultsSection, \
-    flashblade_results_section_id, FlashBladeSpecialAgentInventorySection, flashblade_inventory_section_id, \
-    FlashBladeSoftwareAttributes
+    flashblade_section_id, FlashBladeSpecialAgentInventorySection, flashblade_inventory_section_id, \
+    flashblade_agent_stats_section_id, \
+    FlashBladeSoftwareAttributes, default_page_size, default_pagination_workers
 from purestorage_checkmk.version import __version__
 
 T = TypeVar("T")
 
+# The subset of the hardware endpoint the result collectors report on.
+hardware_components_filter = ItemFilter.not_in("status", ["unused"])
+
+
+# The records below hold the attributes of the pypureclient models the collectors read. The data sources keep these
+# records instead of the models for the rest of the run, and in the persistent cache.
+
+
+@dataclasses.dataclass(slots=True)
+class HardwareRecord(ModelRecord):
+    name: Optional[str] = None
+    type: Optional[str] = None
+    status: Optional[str] = None
+    details: Optional[str] = None
+    slot: Optional[int] = None
+    model: Optional[str] = None
+    serial: Optional[str] = None
+    speed: Optional[int] = None
+    temperature: Optional[int] = None
+
+
+@dataclasses.dataclass(slots=True)
+class NetworkInterfaceRecord(ModelRecord):
+    name: Optional[str] = None
+    type: Optional[str] = None
+    enabled: Optional[bool] = None
+    address: Optional[str] = None
+    netmask: Optional[str] = None
+    gateway: Optional[str] = None
+    vlan: Optional[int] = None
+
+
+@dataclasses.dataclass(slots=True)
+class CertificateRecord(ModelRecord):
+    name: Optional[str] = None
+    status: Optional[str] = None
+    valid_to: Optional[int] = None
+
+
+@dataclasses.dataclass(slots=True)
+class BladeRecord(ModelRecord):
+    name: Optional[str] = None
+    raw_capacity: Optional[int] = None
+
+
+@dataclasses.dataclass(slots=True)
+class SpaceRecord(ModelRecord):
+    total_physical: Optional[int] = None
+    snapshots: Optional[int] = None
+    unique: Optional[int] = None
+    virtual: Optional[int] = None
+    data_reduction: Optional[float] = None
+
+
+@dataclasses.dataclass(slots=True)
+class ArraySpaceRecord(ModelRecord):
+    capacity: Optional[int] = None
+    parity: Optional[float] = None
+    space: Optional[SpaceRecord] = None
+
+
+@dataclasses.dataclass(slots=True)
+class SupportRecord(ModelRecord):
+    id: Optional[str] = None
+    name: Optional[str] = None
+    phonehome_enabled: Optional[bool] = None
+    remote_assist_active: Optional[bool] = None
+
+
+@dataclasses.dataclass(slots=True)
+class ArrayRecord(ModelRecord):
+    os: Optional[str] = None
+    version: Optional[str] = None
+    ntp_servers: Optional[List[str]] = None
+
+
+@dataclasses.dataclass(slots=True)
+class DNSRecord(ModelRecord):
+    name: Optional[str] = None
+    domain: Optional[str] = None
+    nameservers: Optional[List[str]] = None
+
+
+@dataclasses.dataclass(slots=True)
+class SMTPServerRecord(ModelRecord):
+    name: Optional[str] = None
+    relay_host: Optional[str] = None
+    sender_domain: Optional[str] = None
+
+
+@dataclasses.dataclass(slots=True)
+class ReferenceRecord(ModelRecord):
+    name: Optional[str] = None
+
+
+@dataclasses.dataclass(slots=True)
+class APITokenRecord(ModelRecord):
+    created_at: Optional[int] = None
+    expires_at: Optional[int] = None
+
+
+@dataclasses.dataclass(slots=True)
+class AdminAPITokenRecord(ModelRecord):
+    admin: Optional[ReferenceRecord] = None
+    api_token: Optional[APITokenRecord] = None
+
 
 class FlashBladeSpecialAgentDataSource(Generic[T], abc.ABC):
     @abc.abstractmethod
-    def query(self) -> List[T]:
+    def query(self) -> Iterable[T]:
+        """
+        This function returns the items of the data source. The items may be returned as a generator that fetches
+        them page by page, in which case they can only be iterated once.
+        """
         pass
 
 
-class CachingFlashBladeSpecialAgentDataSource(FlashBladeSpecialAgentDataSource[T]):
+class CachingFlashBladeSpecialAgentDataSource(FlashBladeSpecialAgentDataSource[T], Prefetchable):
+    """
+    This data source queries the backend once and keeps the result for the rest of the run. It can be filled ahead of
+    time using prefetch(). If the backend fails, the error is kept and raised again on every query.
+    """
     _cache: Optional[List[T]] = None
+    _error: Optional[Exception] = None
 
     def __init__(self, backend: FlashBladeSpecialAgentDataSource[T]):
         self._backend = backend
+        self._lock = threading.Lock()
+        self._indexes: Dict[Callable[[T], Hashable], ItemIndex[T]] = {}
+
+    def prefetch(self) -> None:
+        try:
+            self.query()
+        except Exception as e:
+            logging.debug(f"Prefetching {type(self._backend).__name__} failed ({e.__str__()})")
 
     def query(self) -> List[T]:
-        if self._cache is None:
-            result = []
-            for item in self._backend.query():
-                result.append(item)
-            self._cache = result
+        with self._lock:
+            if self._cache is None:
+                if self._error is not None:
+                    raise self._error
+                try:
+                    result = self._backend.query()
+                    if not isinstance(result, list):
+                        result = list(result)
+                except Exception as e:
+                    self._error = e
+                    raise
+                self._cache = result
+            return self._cache
+
+    def cached(self) -> Optional[List[T]]:
+        """
+        This function returns the result if the backend has already been queried successfully, or None otherwise.
+        """
         return self._cache
 
+    def index(self, key: Callable[[T], Hashable]) -> ItemIndex[T]:
+        """
+        This function returns the result grouped by the specified key function, e.g. name_key. The index is built on
+        first use and shared by all collectors for the rest of the run.
+        """
+        items = self.query()
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = ItemIndex(items, key)
+                self._indexes[key] = index
+            return index
+
+
+class SubsetFlashBladeSpecialAgentDataSource(CachingFlashBladeSpecialAgentDataSource[T]):
+    """
+    This data source returns the items of another data source that match a filter. If the other data source has
+    already been fetched, the subset is taken from it. Otherwise, only the subset is requested from the backend, which
+    must apply the same filter. When both are prefetched in the same run, only the other data source is fetched, see
+    FlashBladeSpecialAgent.prefetch().
+    """
+
+    def __init__(
+            self,
+            complete: CachingFlashBladeSpecialAgentDataSource[T],
+            backend: FlashBladeSpecialAgentDataSource[T],
+            item_filter: ItemFilter,
+    ):
+        super().__init__(backend)
+        self.complete = complete
+        self._item_filter = item_filter
+
+    def query(self) -> List[T]:
+        items = self.complete.cached()
+        if items is not None:
+            return [item for item in items if self._item_filter.matches(item)]
+        return super().query()
+
+
+class PersistentCachingFlashBladeSpecialAgentDataSource(FlashBladeSpecialAgentDataSource[T]):
+    """
+    This data source keeps the results of its backend on disk for ttl seconds, so slowly changing data is not fetched
+    and deserialized again on every run. A ttl of 0 disables the cache. The items are stored as JSON and decoded into
+    the record type of the backend when they are loaded.
+    """
+
+    def __init__(
+            self,
+            backend: FlashBladeSpecialAgentDataSource[T],
+            cache: PersistentCache,
+            key: str,
+            ttl: int,
+            record: Type[ModelRecord],
+    ):
+        self._backend = backend
+        self._cache = cache
+        self._key = key
+        self._ttl = ttl
+        self._record = record
+
+    def query(self) -> Iterable[T]:
+        if self._ttl <= 0:
+            return self._backend.query()
+        result = self._cache.load(self._key, self._ttl, List[self._record])
+        if result is None:
+            result = list(self._backend.query())
+            self._cache.store(self._key, result)
+        return result
+
 
 class PyPureClientFlashBladeSpecialAgentDataSource(FlashBladeSpecialAgentDataSource[T], abc.ABC):
+    record: Optional[Type[ModelRecord]] = None
+    """
+    The record type holding the attributes of the models the collectors read. Data sources without a record type return
+    the models of the client.
+    """
 
-    def __init__(self, cli: pypureclient.flashblade.client.Client):
+    def __init__(
+            self,
+            cli: pypureclient.flashblade.client.Client,
+            item_filter: Optional[str] = None,
+            page_size: int = default_page_size,
+    ):
+        """
+        :param cli: The client to query.
+        :param item_filter: A REST API filter expression limiting the returned items. Only used by data sources for
+            endpoints that support filtering.
+        :param page_size: The maximum number of items fetched in a single request. Only used by data sources for
+            endpoints that support pagination.
+        """
         self._cli = cli
+        self._filter = item_filter
+        self._page_size = page_size
+
+    def _records(self, items: Iterable) -> Iterable[T]:
+        """
+        This function projects the models returned by the client to the record type of the data source.
+        """
+        if self.record is None:
+            return items
+        return map(projector(self.record), items)
 
     @abc.abstractmethod
     def _query(self, continuation_token: str):
+        """
+        This function requests a single page. Implementations for paginated endpoints must pass the continuation token
+        and self._page_size as the limit.
+        """
         pass
 
-    def query(self) -> List[T]:
-        result = []
+    def query(self) -> Iterator[T]:
         finished = False
         continuation_token = None
         while not finished:
@@ -61,103 +302,183 @@ class PyPureClientFlashBladeSpecialAgentDataSource(FlashBladeSpecialAgentDataSou
                 finished = True
             else:
                 continuation_token = resp.continuation_token
-            for item in resp.items:
-                result.append(item)
-        return result
+            yield from self._records(page_items(resp))
 
 
-class PyPureClientFlashBladeHardwareDataSource(PyPureClientFlashBladeSpecialAgentDataSource[models.Hardware]):
+class PyPureClientFlashBladeSpecialAgentOffsetPaginatedDataSource(
+    PyPureClientFlashBladeSpecialAgentDataSource[T], abc.ABC):
+    """
+    This data source fetches its items in pages of at most page_size items. Once the first page has been fetched, the
+    remaining pages are fetched concurrently by offset. It is meant for large collections, see paginate_by_offset().
+    """
+
+    def __init__(
+            self,
+            cli: pypureclient.flashblade.client.Client,
+            item_filter: Optional[str] = None,
+            page_size: int = default_page_size,
+            workers: int = default_pagination_workers,
+    ):
+        """
+        :param workers: The maximum number of pages fetched concurrently.
+        """
+        super().__init__(cli, item_filter, page_size)
+        self._workers = workers
+
+    @abc.abstractmethod
+    def _query(self, offset: int):
+        """
+        This function requests the page starting at offset. Implementations must pass self._page_size as the limit.
+        """
+        pass
+
+    def query(self) -> Iterator[T]:
+        return self._records(paginate_by_offset(self._query, self._workers))
+
+
+class PyPureClientFlashBladeHardwareDataSource(PyPureClientFlashBladeSpecialAgentDataSource[HardwareRecord]):
+    record = HardwareRecord
+
     def _query(self, continuation_token):
-        return self._cli.get_hardware(continuation_token=continuation_token)
+        return self._cli.get_hardware(
+            filter=self._filter,
+            continuation_token=continuation_token,
+            limit=self._page_size
+        )
 
 
 class PyPureClientFlashBladeNetworkInterfacesDataSource(
-    PyPureClientFlashBladeSpecialAgentDataSource[models.NetworkInterface]):
+    PyPureClientFlashBladeSpecialAgentDataSource[NetworkInterfaceRecord]):
+    record = NetworkInterfaceRecord
+
     def _query(self, continuation_token):
-        return self._cli.get_network_interfaces(continuation_token=continuation_token)
+        return self._cli.get_network_interfaces(continuation_token=continuation_token, limit=self._page_size)
 
 
-class PyPureClientFlashBladeCertificatesDataSource(PyPureClientFlashBladeSpecialAgentDataSource[models.Certificate]):
+class PyPureClientFlashBladeCertificatesDataSource(PyPureClientFlashBladeSpecialAgentDataSource[CertificateRecord]):
+    record = CertificateRecord
+
     def _query(self, continuation_token):
-        return self._cli.get_certificates(continuation_token=continuation_token)
+        return self._cli.get_certificates(continuation_token=continuation_token, limit=self._page_size)
+
 
+class PyPureClientFlashBladeBladesDataSource(PyPureClientFlashBladeSpecialAgentDataSource[BladeRecord]):
+    record = BladeRecord
 
-class PyPureClientFlashBladeBladesDataSource(PyPureClientFlashBladeSpecialAgentDataSource[models.Blade]):
     def _query(self, continuation_token):
-        return self._cli.get_blades(continuation_token=continuation_token)
+        return self._cli.get_blades(continuation_token=continuation_token, limit=self._page_size)
 
 
-class PyPureClientFlashBladeArraySpaceDataSource(PyPureClientFlashBladeSpecialAgentDataSource[models.ArraySpace]):
+class PyPureClientFlashBladeArraySpaceDataSource(PyPureClientFlashBladeSpecialAgentDataSource[ArraySpaceRecord]):
+    record = ArraySpaceRecord
+
     def _query(self, continuation_token: str):
         return self._cli.get_arrays_space(type="array")
 
 
-class PyPureClientFlashBladeFileSystemSpaceDataSource(PyPureClientFlashBladeSpecialAgentDataSource[models.ArraySpace]):
+class PyPureClientFlashBladeFileSystemSpaceDataSource(PyPureClientFlashBladeSpecialAgentDataSource[ArraySpaceRecord]):
+    record = ArraySpaceRecord
+
     def _query(self, continuation_token: str):
         return self._cli.get_arrays_space(type="file-system")
 
 
 class PyPureClientFlashBladeObjectStorageSpaceDataSource(
-    PyPureClientFlashBladeSpecialAgentDataSource[models.ArraySpace]):
+    PyPureClientFlashBladeSpecialAgentDataSource[ArraySpaceRecord]):
+    record = ArraySpaceRecord
+
     def _query(self, continuation_token: str):
         return self._cli.get_arrays_space(type="object-store")
 
 
-class PyPureClientFlashBladeSupportDataSource(PyPureClientFlashBladeSpecialAgentDataSource[models.Support]):
+class PyPureClientFlashBladeSupportDataSource(PyPureClientFlashBladeSpecialAgentDataSource[SupportRecord]):
+    record = SupportRecord
+
     def _query(self, continuation_token):
         return self._cli.get_support()
 
 
-class PyPureClientFlashBladeArrayDataSource(PyPureClientFlashBladeSpecialAgentDataSource[models.Array]):
+class PyPureClientFlashBladeArrayDataSource(PyPureClientFlashBladeSpecialAgentDataSource[ArrayRecord]):
+    record = ArrayRecord
+
     def _query(self, continuation_token):
         return self._cli.get_arrays()
 
 
-class PyPureClientFlashBladeDNSDataSource(PyPureClientFlashBladeSpecialAgentDataSource[models.Dns]):
+class PyPureClientFlashBladeDNSDataSource(PyPureClientFlashBladeSpecialAgentDataSource[DNSRecord]):
+    record = DNSRecord
+
     def _query(self, continuation_token):
         return self._cli.get_dns()
 
 
-class PyPureClientFlashBladeSMTPDataSource(PyPureClientFlashBladeSpecialAgentDataSource[models.SmtpServer]):
+class PyPureClientFlashBladeSMTPDataSource(PyPureClientFlashBladeSpecialAgentDataSource[SMTPServerRecord]):
+    record = SMTPServerRecord
+
     def _query(self, continuation_token):
         return self._cli.get_smtp_servers()
 
 
-class PyPureClientFlashBladeAPITokensDataSource(PyPureClientFlashBladeSpecialAgentDataSource[models.AdminApiToken]):
+class PyPureClientFlashBladeAPITokensDataSource(PyPureClientFlashBladeSpecialAgentDataSource[AdminAPITokenRecord]):
+    record = AdminAPITokenRecord
+
     def _query(self, continuation_token):
-        return self._cli.get_admins_api_tokens()
+        return self._cli.get_admins_api_tokens(continuation_token=continuation_token, limit=self._page_size)
 
 
-class FlashBladeSpecialAgent:
-    _cert_file = None
+class PyPureClientFlashBladeAlertsDataSource(PyPureClientFlashBladeSpecialAgentOffsetPaginatedDataSource[AlertRecord]):
+    record = AlertRecord
+
+    def _query(self, offset: int):
+        return self._cli.get_alerts(filter=self._filter, offset=offset, limit=self._page_size)
 
-    def __init__(self, cfg: FlashBladeSpecialAgentConfiguration):
+
+class FlashBladeSpecialAgent:
+    def __init__(self, cfg: FlashBladeSpecialAgentConfiguration, tracer: Optional[Tracer] = None):
+        """
+        :param cfg: The configuration of the special agent.
+        :param tracer: The tracer to record the spans of the run with, if the run is traced.
+        """
         self._cfg = cfg
+        self._requests = RequestCounter(tracer)
+        self._stats = AgentStats(self._requests, tracer)
+        directory = cache_directory("flashblade", cfg.host)
+        self._session = SessionCache(directory, cfg.api_token, cfg.session_lifetime)
         ssl_cert = None
         if cfg.verify_tls:
-            self._cert_file = tempfile.NamedTemporaryFile()
-            self._cert_file.write(cfg.cacert.encode('ascii'))
-            self._cert_file.flush()
-            ssl_cert = self._cert_file.name
-
-        self._cli = pypureclient.flashblade.client.Client(
-            cfg.host,
-            api_token=cfg.api_token,
-            ssl_cert=ssl_cert,
-            user_agent=f"checkmk-purefa-{__version__}"
-
-        )
+            ssl_cert = self._session.cert_file(cfg.cacert)
+
+        with self._stats.step("Client bootstrap"):
+            self._cli = self._requests.wrap(self._session.client(
+                pypureclient.flashblade.client,
+                cfg.host,
+                api_token=cfg.api_token,
+                ssl_cert=ssl_cert,
+                user_agent=f"checkmk-purefa-{__version__}"
+            ))
+        self._persistent_cache = PersistentCache(directory)
         self._hardware = CachingFlashBladeSpecialAgentDataSource(
-            PyPureClientFlashBladeHardwareDataSource(self._cli)
+            PyPureClientFlashBladeHardwareDataSource(self._cli, page_size=self._page_size("hardware"))
+        )
+        self._hardware_components = SubsetFlashBladeSpecialAgentDataSource(
+            self._hardware,
+            PyPureClientFlashBladeHardwareDataSource(
+                self._cli, str(hardware_components_filter), self._page_size("hardware")
+            ),
+            hardware_components_filter,
         )
         self._network_interfaces = CachingFlashBladeSpecialAgentDataSource(
-            PyPureClientFlashBladeNetworkInterfacesDataSource(self._cli)
+            PyPureClientFlashBladeNetworkInterfacesDataSource(
+                self._cli, page_size=self._page_size("network_interfaces")
+            )
         )
         self._certificates = CachingFlashBladeSpecialAgentDataSource(
-            PyPureClientFlashBladeCertificatesDataSource(self._cli)
+            self._persistent("certificates", PyPureClientFlashBladeCertificatesDataSource(
+                self._cli, page_size=self._page_size("certificates")
+            ))
         )
         self._blades = CachingFlashBladeSpecialAgentDataSource(
-            PyPureClientFlashBladeBladesDataSource(self._cli)
+            PyPureClientFlashBladeBladesDataSource(self._cli, page_size=self._page_size("blades"))
         )
         self._array = CachingFlashBladeSpecialAgentDataSource(
             PyPureClientFlashBladeArrayDataSource(self._cli)
@@ -172,39 +493,168 @@ class FlashBladeSpecialAgent:
             PyPureClientFlashBladeObjectStorageSpaceDataSource(self._cli)
         )
         self._support = CachingFlashBladeSpecialAgentDataSource(
-            PyPureClientFlashBladeSupportDataSource(self._cli)
+            self._persistent("support", PyPureClientFlashBladeSupportDataSource(self._cli))
         )
         self._dns = CachingFlashBladeSpecialAgentDataSource(
-            PyPureClientFlashBladeDNSDataSource(self._cli)
+            self._persistent("dns", PyPureClientFlashBladeDNSDataSource(self._cli))
         )
         self._smtp = CachingFlashBladeSpecialAgentDataSource(
-            PyPureClientFlashBladeSMTPDataSource(self._cli)
+            self._persistent("smtp_servers", PyPureClientFlashBladeSMTPDataSource(self._cli))
         )
         self._api_tokens = CachingFlashBladeSpecialAgentDataSource(
-            PyPureClientFlashBladeAPITokensDataSource(self._cli)
+            self._persistent("api_tokens", PyPureClientFlashBladeAPITokensDataSource(
+                self._cli, page_size=self._page_size("api_tokens")
+            ))
+        )
+        self._alert_state = None
+        alerts_query = None
+        if cfg.alerts is not None:
+            if cfg.alerts.incremental:
+                self._alert_state = AlertState(self._persistent_cache, cfg.alerts.closed_alerts_lifetime)
+                alerts_query = self._alert_state.filter()
+            else:
+                alerts_query = alerts_filter(int(1000 * (time.time() - cfg.alerts.closed_alerts_lifetime)))
+        self._alerts = self._single_use(
+            PyPureClientFlashBladeAlertsDataSource(
+                self._cli, alerts_query, self._page_size("alerts"), cfg.pagination_workers
+            )
+        )
+        # The data sources each section is collected from, keyed by the name of the section. The results sections are
+        # named after the fields of the results section.
+        self._section_data_sources = {
+            "hardware": [self._hardware_components],
+            "alerts": [self._alerts] if cfg.alerts is not None else [],
+            "certificates": [self._certificates],
+            "space": [self._array_space, self._filesystem_space, self._object_storage_space],
+            "inventory": [
+                self._hardware,
+                self._blades,
+                self._network_interfaces,
+                self._array,
+                self._support,
+                self._api_tokens,
+                self._smtp,
+                self._dns,
+            ],
+        }
+
+    def _single_use(self, backend: FlashBladeSpecialAgentDataSource[T]) -> FlashBladeSpecialAgentDataSource[T]:
+        """
+        This function wraps data sources that are only queried once per run. In streaming mode they are used directly,
+        so their items are processed page by page instead of being kept in memory. Otherwise, they are cached so they
+        can be prefetched.
+        """
+        if self._cfg.streaming:
+            return backend
+        return CachingFlashBladeSpecialAgentDataSource(backend)
+
+    def _page_size(self, key: str) -> int:
+        return self._cfg.page_sizes.get(key, default_page_size)
+
+    def _persistent(
+            self,
+            key: str,
+            backend: PyPureClientFlashBladeSpecialAgentDataSource[T]
+    ) -> FlashBladeSpecialAgentDataSource[T]:
+        return PersistentCachingFlashBladeSpecialAgentDataSource(
+            backend,
+            self._persistent_cache,
+            key,
+            self._cfg.cache_ttls.get(key, 0),
+            backend.record,
         )
 
-    def __del__(self):
-        if self._cert_file is not None:
-            self._cert_file.close()
+    def requests(self) -> Dict[str, int]:
+        """
+        :return: The number of REST API requests sent in this run per endpoint.
+        """
+        return self._requests.requests()
+
+    def agent_stats(self) -> AgentStatsSection:
+        """
+        :return: The measurements of this run so far, see AgentStats.
+        """
+        return self._stats.section((self._cfg.agent_runtime.warn, self._cfg.agent_runtime.crit))
+
+    def prefetch(self, sections: Optional[Iterable[str]] = None):
+        """
+        This function fetches all data sources used by results() and inventory() concurrently, so a run takes about as
+        long as the slowest endpoint instead of the sum of all endpoints. A subset of a data source that is fetched as
+        well is not requested on its own, but taken from the complete items when it is queried.
+
+        :param sections: The names of the sections to fetch the data sources for. All sections by default.
+        """
+        if sections is None:
+            sections = self._section_data_sources.keys()
+        data_sources = []
+        for section in sections:
+            for data_source in self._section_data_sources[section]:
+                if isinstance(data_source, Prefetchable) and data_source not in data_sources:
+                    data_sources.append(data_source)
+        data_sources = [
+            data_source for data_source in data_sources
+            if not isinstance(data_source, SubsetFlashBladeSpecialAgentDataSource) or
+            data_source.complete not in data_sources
+        ]
+        prefetch(data_sources, self._cfg.prefetch_workers)
+
+    def _result_collectors(self) -> Dict[str, Callable[[], SpecialAgentResult]]:
+        return {
+            "hardware": self._check_hardware,
+            "alerts": self._collect_alerts,
+            "certificates": self._collect_certificates,
+            "space": self._collect_space,
+        }
 
     def results(self) -> FlashBladeSpecialAgentResultsSection:
         return FlashBladeSpecialAgentResultsSection(
-            self._check_hardware(),
-            self._collect_alerts(),
-            self._collect_certificates(),
-            self._collect_space(),
+            **{name: collect() for name, collect in self._result_collectors().items()}
+        )
+
+    def sections(self) -> Iterator[CheckmkSection]:
+        """
+        This function produces the sections of a run: one section per subsystem of the results, and the inventory. The
+        output of sections with an interval is reused as long as it is fresh, and their data sources are not fetched.
+        The last section holds the measurements of the run, so it must be requested after the others are written.
+        """
+        yield from self._stats.output(self._sections())
+        yield CheckmkSection(flashblade_agent_stats_section_id, self.agent_stats().to_section())
+
+    def _sections(self) -> Iterator[CheckmkSection]:
+        cached = CachedSections(self._persistent_cache, self._cfg.section_intervals)
+        with self._stats.step("Prefetch"):
+            self.prefetch(name for name in self._section_data_sources.keys() if not cached.fresh(name))
+        for name, collect in self._stats.collectors(self._result_collectors()).items():
+            yield cached.section(
+                name,
+                flashblade_section_id(name),
+                lambda: encode_section_lines({name: collect()}.items()),
+            )
+        # The parts of the inventory are collected before the header is written, so a failing collector can't leave a
+        # truncated section behind. They are still encoded one at a time while the section is written.
+        yield cached.section(
+            "inventory",
+            flashblade_inventory_section_id,
+            lambda: encode_section_lines([
+                (name, inventorize())
+                for name, inventorize in self._stats.collectors(self._inventory_collectors(), "inventory/").items()
+            ]),
         )
 
+    def _inventory_collectors(self) -> Dict[str, Callable[[], SpecialAgentInventory]]:
+        return {
+            "hardware": self._inventorize_hardware,
+            "network_interfaces": self._inventorize_interfaces,
+            "array": self._inventorize_array,
+            "support": self._inventorize_support,
+            "apitokens": self._inventorize_api_tokens,
+            "smtp": self._inventorize_smtp,
+            "dns": self._inventorize_dns,
+        }
+
     def inventory(self) -> FlashBladeSpecialAgentInventorySection:
         return FlashBladeSpecialAgentInventorySection(
-            self._inventorize_hardware(),
-            self._inventorize_interfaces(),
-            self._inventorize_array(),
-            self._inventorize_support(),
-            self._inventorize_api_tokens(),
-            self._inventorize_smtp(),
-            self._inventorize_dns(),
+            **{name: inventorize() for name, inventorize in self._inventory_collectors().items()}
         )
 
     def _inventorize_api_tokens(self):
@@ -303,6 +753,7 @@ class FlashBladeSpecialAgent:
 
     def _inventorize_hardware(self) -> SpecialAgentInventory:
         result = SpecialAgentInventory()
+        blades = None
         for hardware_item in self._hardware.query():
             if hardware_item.type == "ch":
                 result.add_attributes(ChassisAttributes(
@@ -333,12 +784,7 @@ class FlashBladeSpecialAgent:
                     type=hardware_item.type
                 ))
             elif hardware_item.type == "eth":
-                speed = None
-                try:
-                    if hardware_item.speed is not None:
-                        speed = hardware_item.speed
-                except AttributeError:
-                    pass
+                speed = hardware_item.speed
                 status = None
                 if hardware_item.status != "unused":
                     if hardware_item.status == "healthy":
@@ -361,12 +807,10 @@ class FlashBladeSpecialAgent:
                 ))
             elif hardware_item.type == "fb":
                 if hardware_item.status != "unused":
-                    blades = self._blades.query()
-                    raw_capacity = None
-                    for blade in blades:
-                        if blade.name == hardware_item.name:
-                            raw_capacity = blade.raw_capacity
-                            break
+                    if blades is None:
+                        blades = self._blades.index(name_key)
+                    blade = blades.first(hardware_item.name)
+                    raw_capacity = blade.raw_capacity if blade is not None else None
 
                     result.add_table_row(HardwareModuleTableRow(
                         index=hardware_item.slot,
@@ -418,40 +862,35 @@ class FlashBladeSpecialAgent:
         result = SpecialAgentResult()
         if self._cfg.alerts is None:
             return result
-        finished = False
-        continuation_token = None
-        while not finished:
-            resp = CheckResponse(self._cli.get_alerts(continuation_token=continuation_token))
-            if resp.continuation_token is None:
-                finished = True
-            else:
-                continuation_token = resp.continuation_token
-            for item in resp.items:
-                state = State.UNKNOWN
-                create = False
-                if item.state == "open" or item.state == "closing":
+        alerts = self._alerts.query()
+        if self._alert_state is not None:
+            alerts = self._alert_state.update(alerts)
+        for item in alerts:
+            state = State.UNKNOWN
+            create = False
+            if item.state == "open" or item.state == "closing":
+                create = True
+                if item.severity == "info" or item.severity == "warning":
+                    state = state.WARN
+                if item.severity == "critical":
+                    state = state.CRIT
+            elif item.state == "closed":
+                now = time.time()
+                age = (now - (item.updated / 1000))
+                if age < self._cfg.alerts.closed_alerts_lifetime:
                     create = True
-                    if item.severity == "info" or item.severity == "warning":
-                        state = state.WARN
-                    if item.severity == "critical":
-                        state = state.CRIT
-                elif item.state == "closed":
-                    now = time.time()
-                    age = (now - (item.updated / 1000))
-                    if age < self._cfg.alerts.closed_alerts_lifetime:
-                        create = True
-                        state = state.OK
-                if create and (
-                        item.severity not in ["info", "warning", "critical"] or
-                        (item.severity == "info" and self._cfg.alerts.info) or
-                        (item.severity == "warning" and self._cfg.alerts.warning) or
-                        (item.severity == "critical" and self._cfg.alerts.critical)
-                ):
-                    result.add_service(f"Alert {item.name}", Result(
-                        state=state,
-                        summary=item.summary,
-                        details=item.description
-                    ))
+                    state = state.OK
+            if create and (
+                    item.severity not in ["info", "warning", "critical"] or
+                    (item.severity == "info" and self._cfg.alerts.info) or
+                    (item.severity == "warning" and self._cfg.alerts.warning) or
+                    (item.severity == "critical" and self._cfg.alerts.critical)
+            ):
+                result.add_service(f"Alert {item.name}", Result(
+                    state=state,
+                    summary=item.summary,
+                    details=item.description
+                ))
         return result
 
     def _collect_space(self) -> SpecialAgentResult:
@@ -459,7 +898,7 @@ class FlashBladeSpecialAgent:
 
         def add_service_space(
                 name: str,
-                query_space: List[models.ArraySpace],
+                query_space: List[ArraySpaceRecord],
                 warn_threshold: int = 80,
                 crit_threshold: int = 90
         ):
@@ -515,15 +954,13 @@ class FlashBladeSpecialAgent:
             customizations[item.api_type] = item
 
         result = SpecialAgentResult()
-        for item in self._hardware.query():
+        for item in self._hardware_components.query():
             if item.status == "healthy" or item.status == "identifying":
                 state = State.OK
             elif item.status == "unhealthy":
                 state = State.WARN
             elif item.status == "critical":
                 state = State.CRIT
-            elif item.status == "unused":
-                continue
             else:
                 state = State.UNKNOWN
             name = item.name
@@ -534,45 +971,39 @@ class FlashBladeSpecialAgent:
                 summary=item.status,
                 details=item.details
             ))
-            try:
-                if item.temperature is not None:
-                    result.add_metric(f"{name}", Metric(
-                        value=item.temperature,
-                    ))
-            except AttributeError:
-                pass
-            try:
-                if item.speed is not None:
-                    result.add_metric(f"{name}", Metric(
-                        value=item.speed,
-                    ))
-            except AttributeError:
-                pass
+            if item.temperature is not None:
+                result.add_metric(f"{name}", Metric(
+                    value=item.temperature,
+                ))
+            if item.speed is not None:
+                result.add_metric(f"{name}", Metric(
+                    value=item.speed,
+                ))
         return result
 
 
-def run(stdin: TextIO, stdout: TextIO) -> int:
+def run(stdin: TextIO, stdout: TextIO, argv: Sequence[str] = ()) -> int:
     """
     This function runs the special agent and produces the output data.
     :param stdin: The standard input to read the configuration from.
     :param stdout: The standard output to write the section to.
+    :param argv: The command line options, see special_agent_argument_parser().
     :return: The return code.
     """
+    args = special_agent_argument_parser("FlashBlade").parse_args(argv)
     stdin_data = stdin.read()
     cfg = FlashBladeSpecialAgentConfiguration.from_json(stdin_data)
-    try:
-        cli = FlashBladeSpecialAgent(cfg)
-    except Exception as e:
-        logging.fatal(f"Invalid FlashBlade configuration or FlashBlade not reachable at {cfg.host} ({e.__str__()}")
-        return 1
-    section = CheckmkSection(
-        flashblade_results_section_id,
-        cli.results()
-    )
-    stdout.write(str(section))
-    section = CheckmkSection(
-        flashblade_inventory_section_id,
-        cli.inventory()
-    )
-    stdout.write(str(section))
-    return 0
+    with profile(args.profile, args.profile_dir, f"flashblade-{cfg.host}", args.profile_top) as tracer:
+        if tracer is not None:
+            stdout = tracer.stream(stdout)
+        try:
+            cli = FlashBladeSpecialAgent(cfg, tracer)
+        except Exception as e:
+            logging.fatal(f"Invalid FlashBlade configuration or FlashBlade not reachable at {cfg.host} ({e.__str__()}")
+            return 1
+        for section in cli.sections():
+            section.write(stdout)
+            stdout.flush()
+        if args.stats:
+            print(cli.agent_stats().report(), file=sys.stderr)
+        return 0
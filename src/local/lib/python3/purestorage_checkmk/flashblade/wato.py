@@ -8,7 +8,9 @@ from cmk.gui.valuespec import (Dictionary, PasswordSpec, Checkbox, TextAreaUnico
 from cmk.gui.watolib.rulespecs import RulespecRegistry
 from purestorage_checkmk.flashblade.common import default_cert_warn, default_cert_crit, default_closed_alerts_lifetime, \
     default_array_space_warn, default_array_space_crit, default_filesystem_space_warn, default_filesystem_space_crit, \
-    default_objectstore_space_warn, default_objectstore_space_crit
+    default_objectstore_space_warn, default_objectstore_space_crit, default_prefetch_workers, default_cache_ttls, \
+    default_session_lifetime, default_page_sizes, \
+    default_pagination_workers, default_section_intervals, default_runtime_warn, default_runtime_crit
 
 
 def _valuespec_special_agents_purestorage_flashblade() -> ValueSpec:
@@ -52,6 +54,15 @@ def _valuespec_special_agents_purestorage_flashblade() -> ValueSpec:
                 title=_("Port"),
                 default_value=443
             )),
+            ("prefetch_workers", Integer(
+                title=_(f"Concurrent API requests (default: {default_prefetch_workers})"),
+                default_value=default_prefetch_workers,
+                minvalue=1,
+                maxvalue=64,
+                help=_(
+                    "The special agent queries all FlashBlade API endpoints concurrently before evaluating the data. This option limits how many requests are sent to the FlashBlade at the same time."
+                )
+            )),
             ("certificates", Dictionary(
                 title=_("Certificate expiration checks"),
                 elements=[
@@ -76,6 +87,146 @@ def _valuespec_special_agents_purestorage_flashblade() -> ValueSpec:
                     "Certificate checks report the number of days remaining until the certificate expires. You can customize the reporting thresholds here."
                 )
             )),
+            ("session_lifetime", Age(
+                title=_("Reuse API sessions"),
+                display=["days", "hours", "minutes"],
+                default_value=default_session_lifetime,
+                minvalue=0,
+                help=_(
+                    "The special agent keeps the negotiated API version and the session obtained with the API token between runs, so it does not need to log in to the FlashBlade every time. This option sets how long a session is reused before logging in again. If the FlashBlade rejects the session earlier, the special agent logs in again automatically. Set the time to 0 to log in on every run."
+                )
+            )),
+            ("streaming", Checkbox(
+                title=_("Stream large collections"),
+                label=_("process alerts page by page"),
+                default_value=False,
+                help=_(
+                    "By default, the special agent fetches all data concurrently and keeps it in memory until the run is finished. If this option is turned on, alerts are processed page by page as they are received, so the memory use of the special agent does not depend on the size of the FlashBlade. These collections are then fetched after the other data instead of concurrently."
+                )
+            )),
+            ("cache", Dictionary(
+                title=_("Cache slowly changing data"),
+                elements=[
+                    ("api_tokens", Age(
+                        title=_("API tokens"),
+                        display=["days", "hours", "minutes"],
+                        default_value=default_cache_ttls["api_tokens"],
+                        minvalue=0,
+                    )),
+                    ("certificates", Age(
+                        title=_("Certificates"),
+                        display=["days", "hours", "minutes"],
+                        default_value=default_cache_ttls["certificates"],
+                        minvalue=0,
+                    )),
+                    ("dns", Age(
+                        title=_("DNS settings"),
+                        display=["days", "hours", "minutes"],
+                        default_value=default_cache_ttls["dns"],
+                        minvalue=0,
+                    )),
+                    ("smtp_servers", Age(
+                        title=_("SMTP servers"),
+                        display=["days", "hours", "minutes"],
+                        default_value=default_cache_ttls["smtp_servers"],
+                        minvalue=0,
+                    )),
+                    ("support", Age(
+                        title=_("Support settings"),
+                        display=["days", "hours", "minutes"],
+                        default_value=default_cache_ttls["support"],
+                        minvalue=0,
+                    )),
+                ],
+                help=_(
+                    "Data that rarely changes is kept on the Checkmk server and only fetched from the FlashBlade again after the specified time. Set the time to 0 to fetch the data on every run."
+                )
+            )),
+            ("page_sizes", Dictionary(
+                title=_("Page sizes"),
+                elements=[
+                    ("alerts", Integer(
+                        title=_("Alerts"),
+                        default_value=default_page_sizes["alerts"],
+                        minvalue=1,
+                    )),
+                    ("api_tokens", Integer(
+                        title=_("API tokens"),
+                        default_value=default_page_sizes["api_tokens"],
+                        minvalue=1,
+                    )),
+                    ("blades", Integer(
+                        title=_("Blades"),
+                        default_value=default_page_sizes["blades"],
+                        minvalue=1,
+                    )),
+                    ("certificates", Integer(
+                        title=_("Certificates"),
+                        default_value=default_page_sizes["certificates"],
+                        minvalue=1,
+                    )),
+                    ("hardware", Integer(
+                        title=_("Hardware"),
+                        default_value=default_page_sizes["hardware"],
+                        minvalue=1,
+                    )),
+                    ("network_interfaces", Integer(
+                        title=_("Network interfaces"),
+                        default_value=default_page_sizes["network_interfaces"],
+                        minvalue=1,
+                    )),
+                ],
+                help=_(
+                    "The special agent fetches lists from the FlashBlade in pages of at most the specified number of items. Larger pages need fewer requests, smaller pages keep the individual responses small."
+                )
+            )),
+            ("pagination_workers", Integer(
+                title=_(f"Concurrent page requests (default: {default_pagination_workers})"),
+                default_value=default_pagination_workers,
+                minvalue=1,
+                maxvalue=64,
+                help=_(
+                    "Large lists (alerts) are fetched by offset: once the first page has been received, the remaining pages are requested concurrently. This option limits how many pages of a list are requested from the FlashBlade at the same time."
+                )
+            )),
+            ("section_intervals", Dictionary(
+                title=_("Section intervals"),
+                elements=[
+                    ("hardware", Age(
+                        title=_("Hardware"),
+                        display=["days", "hours", "minutes"],
+                        default_value=default_section_intervals.get("hardware", 0),
+                        minvalue=0,
+                    )),
+                    ("alerts", Age(
+                        title=_("Alerts"),
+                        display=["days", "hours", "minutes"],
+                        default_value=default_section_intervals.get("alerts", 0),
+                        minvalue=0,
+                    )),
+                    ("certificates", Age(
+                        title=_("Certificates"),
+                        display=["days", "hours", "minutes"],
+                        default_value=default_section_intervals.get("certificates", 0),
+                        minvalue=0,
+                    )),
+                    ("space", Age(
+                        title=_("Space"),
+                        display=["days", "hours", "minutes"],
+                        default_value=default_section_intervals.get("space", 0),
+                        minvalue=0,
+                    )),
+                    ("inventory", Age(
+                        title=_("Inventory"),
+                        display=["days", "hours", "minutes"],
+                        default_value=default_section_intervals.get("inventory", 0),
+                        minvalue=0,
+                    )),
+                ],
+                help=_(
+                    "The special agent produces one section per subsystem, and one for the inventory. A section with an interval is only collected again after the specified time; in between, the previous output is reused and the endpoints it depends on are not queried. Set the time to 0 to collect the section on every run."
+                )
+            )),
             ("hardware", ListOf(
                 title=_("Hardware service name customization"),
                 valuespec=Tuple(
@@ -142,9 +293,31 @@ def _valuespec_special_agents_purestorage_flashblade() -> ValueSpec:
                 help=_(
                     "Disk space checks report the percentage of disk space filled. You can customize the reporting thresholds here.")
             )),
+            ("agent_runtime", Dictionary(
+                title=_("Agent performance"),
+                elements=[
+                    ("runtime_warn", Age(
+                        title=_(f"Custom warning threshold (default: {default_runtime_warn} seconds)"),
+                        display=["minutes", "seconds"],
+                        default_value=default_runtime_warn,
+                        minvalue=1,
+                        help="If a run of the special agent takes longer than the specified time, Checkmk will issue a warning.",
+                    )),
+                    ("runtime_crit", Age(
+                        title=_(f"Custom critical threshold (default: {default_runtime_crit} seconds)"),
+                        display=["minutes", "seconds"],
+                        default_value=default_runtime_crit,
+                        minvalue=1,
+                        help="If a run of the special agent takes longer than the specified time, Checkmk will issue a critical alert.",
+                    ))
+                ],
+                help=_(
+                    "The Agent performance service reports how long a run of the special agent takes, and how much of it is spent on each REST API endpoint of the FlashBlade, each collector and writing each section. A run that takes longer than the check interval delays the monitoring of the FlashBlade. You can customize the reporting thresholds here."
+                )
+            )),
             ("alerts", Dictionary(
                 title=_("Report alerts as temporary services"),
-                optional_keys=False,
+                optional_keys=["incremental"],
                 elements=[
                     ("closed_alerts_lifetime", Age(
                         display=["minutes"],
@@ -175,12 +348,28 @@ def _valuespec_special_agents_purestorage_flashblade() -> ValueSpec:
                         ],
                         required_keys=["info", "warning", "critical"],
                     )),
+                    ("incremental", Checkbox(
+                        title=_("Fetch alerts incrementally"),
+                        label=_("only request the alerts that changed since the last run"),
+                        default_value=True,
+                        help=_(
+                            "By default, the special agent keeps the alerts it has seen between runs and only requests the alerts that were updated since the last run from the FlashBlade. If this option is turned off, all open alerts and the recently closed ones are requested on every run."
+                        )
+                    )),
                 ]
             )),
         ],
         show_more_keys=[
             "port",
+            "prefetch_workers",
+            "cache",
+            "session_lifetime",
+            "streaming",
+            "page_sizes",
+            "pagination_workers",
+            "section_intervals",
             "certificates",
+            "agent_runtime",
             "alerts",
             "space",
             "hardware"
@@ -1,10 +1,64 @@
+import io
+import os
+import tempfile
 import typing
 import unittest
 
-from purestorage_checkmk.common import SpecialAgentInventory, Attributes, TableRow, Result, State
+from purestorage_checkmk.common import SpecialAgentInventory, Attributes, TableRow, Result, State, CheckmkSection, \
+    IndexedResultsSection
+
+
+class CacheDirectoryTestCase(unittest.TestCase):
+    """
+    This test case points the cache directory of the special agents to a temporary directory. Put it before the base
+    class of the special agent tests, so the cache directory is set up after them.
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.omd_root = os.environ.get("OMD_ROOT")
+        os.environ["OMD_ROOT"] = self.cache_dir.name
+
+    def tearDown(self) -> None:
+        if self.omd_root is None:
+            del os.environ["OMD_ROOT"]
+        else:
+            os.environ["OMD_ROOT"] = self.omd_root
+        self.cache_dir.cleanup()
+        super().tearDown()
 
 
 class SpecialAgentTestCase(unittest.TestCase):
+    @staticmethod
+    def string_tables(sections: typing.Iterable[CheckmkSection]) -> typing.Dict[str, typing.List[typing.List[str]]]:
+        """
+        This function writes the sections of a special agent and splits the output into the string tables Checkmk
+        passes to the parse functions, by section ID.
+        """
+        stream = io.StringIO()
+        for section in sections:
+            section.write(stream)
+        string_tables = {}
+        for line in stream.getvalue().splitlines():
+            if line.startswith("<<<"):
+                section_id = line.strip("<>").split(":")[0]
+                string_tables[section_id] = []
+            else:
+                string_tables[section_id].append(line.split())
+        return string_tables
+
+    def indexed_results_sections(
+            self,
+            sections: typing.Iterable[CheckmkSection],
+            section_ids: typing.List[str],
+    ) -> typing.List[IndexedResultsSection]:
+        """
+        This function parses the results sections of a special agent the way the check plugin receives them.
+        """
+        string_tables = self.string_tables(sections)
+        return [IndexedResultsSection.from_string_table(string_tables[section_id]) for section_id in section_ids]
+
     def assert_inventory_attributes(
             self,
             inventory: SpecialAgentInventory,
@@ -22,7 +76,7 @@ class SpecialAgentTestCase(unittest.TestCase):
             count: typing.Optional[int] = None,
     ) -> typing.List[TableRow]:
         result = []
-        for rows in inventory.inventory_table_rows:
+        for rows in inventory.table_rows():
             if rows.path == path:
                 result.append(rows)
         if count is not None and len(result) != count:
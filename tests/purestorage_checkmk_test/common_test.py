@@ -1,11 +1,572 @@
+import base64
+import dataclasses
+import importlib
+import io
+import json
+import os
+import pickle
 import pprint
+import tempfile
+import threading
+import time
+import typing
 import unittest
+import unittest.mock
 
-from purestorage_checkmk.flasharray.common import FlashArraySpecialAgentResultsSection
+import pypureclient.flasharray.client
+import pypureclient.flashblade.client
+from pypureclient import ValidResponse
+from pypureclient.api_token_manager import APITokenManager
+from pypureclient.responses import ItemIterator
+from pypureclient._transport.rest import ApiException
+from pypureclient.flasharray.FA_2_32 import models
+
+from purestorage_checkmk.common import paginate_by_offset, page_items, SpecialAgentResult, Result, State, Metric, \
+    IndexedResultsSection, from_dict, SpecialAgentInventory, Attributes, TableRow, to_json, encode_section_lines, \
+    CheckmkSection, NetworkInterfaceTableRow, NetworkInterfaceStatus, NetworkRouteTableRow, project, lower_name_key, \
+    name_key, AlertState, AlertRecord, PersistentCache, alerts_filter, check_private_directory, RawClient, \
+    UnsupportedClientException, RequestCounter, legacy_results_sections, indexed_items, indexed_results, SessionCache, \
+    _SessionTokenManager, _client_version
+from purestorage_checkmk.flasharray.common import FlashArraySpecialAgentResultsSection, Volumes, Hosts
+from purestorage_checkmk.flasharray.special_agent import NetworkInterfaceRecord, NetworkInterfaceEthRecord, \
+    ReferenceRecord, SupportRecord, HardwareRecord, CachingFlashArraySpecialAgentDataSource, \
+    FlashArraySpecialAgentDataSource
 
 
 class DecodeTest(unittest.TestCase):
+    data = "eyJoYXJkd2FyZSI6IHsic2VydmljZXMiOiB7IkNUMC5FVEgzIjogeyJzdGF0ZSI6IDAsICJzdW1tYXJ5IjogIm9rIiwgImRldGFpbHMiOiAiZXRoIGRldGFpbHMsIHNwZWVkLCBtYWMsIGV0Yy4iLCAibm90aWNlIjogbnVsbH0sICJDVDAuRVRINCI6IHsic3RhdGUiOiAwLCAic3VtbWFyeSI6ICJvayIsICJkZXRhaWxzIjogImV0aCBkZXRhaWxzLCBzcGVlZCwgbWFjLCBldGMuIiwgIm5vdGljZSI6IG51bGx9LCAiQ1QxLkRDQTUiOiB7InN0YXRlIjogMCwgInN1bW1hcnkiOiAib2siLCAiZGV0YWlscyI6IG51bGwsICJub3RpY2UiOiBudWxsfSwgIkNUMS5EQ0E2IjogeyJzdGF0ZSI6IDAsICJzdW1tYXJ5IjogIm9rIiwgImRldGFpbHMiOiBudWxsLCAibm90aWNlIjogbnVsbH19LCAibWV0cmljcyI6IHt9fSwgImNlcnRpZmljYXRlcyI6IHsic2VydmljZXMiOiB7IkNlcnRpZmljYXRlMSI6IHsic3RhdGUiOiAwLCAic3VtbWFyeSI6IDE5ODMyNzc5MDYuMCwgImRldGFpbHMiOiAic2VsZi1zaWduZWQiLCAibm90aWNlIjogbnVsbH19LCAibWV0cmljcyI6IHsiQ2VydGlmaWNhdGUxIjogeyJ2YWx1ZSI6IDM0NDQuMTIyNTQ3Njg3NTE4NCwgImxldmVscyI6IFs5MCwgMzBdLCAiYm91bmRhcmllcyI6IFtudWxsLCBudWxsXX19fSwgImRyaXZlcyI6IHsic2VydmljZXMiOiB7IkNIMC5CQVkxIjogeyJzdGF0ZSI6IDAsICJzdW1tYXJ5IjogImhlYWx0aHkiLCAiZGV0YWlscyI6IG51bGwsICJub3RpY2UiOiBudWxsfX0sICJtZXRyaWNzIjoge319LCAiYXJyYXkiOiB7InNlcnZpY2VzIjogeyJBcnJheSAxIjogeyJzdGF0ZSI6IDAsICJzdW1tYXJ5IjogbnVsbCwgImRldGFpbHMiOiAiNzAuMCIsICJub3RpY2UiOiBudWxsfX0sICJtZXRyaWNzIjogeyJBcnJheSAxIjogeyJ2YWx1ZSI6IDcwLjAsICJsZXZlbHMiOiBbODAuMCwgOTAuMF0sICJib3VuZGFyaWVzIjogWzAsIDEwMF19fX0sICJjb250cm9sbGVycyI6IHsic2VydmljZXMiOiB7IkNUMSI6IHsic3RhdGUiOiAwLCAic3VtbWFyeSI6ICJyZWFkeSIsICJkZXRhaWxzIjogInNlY29uZGFyeSIsICJub3RpY2UiOiBudWxsfSwgIkNUMiI6IHsic3RhdGUiOiAwLCAic3VtbWFyeSI6ICJyZWFkeSIsICJkZXRhaWxzIjogInByaW1hcnkiLCAibm90aWNlIjogbnVsbH19LCAibWV0cmljcyI6IHt9fX0="
+
     def test_decode(self):
-        data = "eyJoYXJkd2FyZSI6IHsic2VydmljZXMiOiB7IkNUMC5FVEgzIjogeyJzdGF0ZSI6IDAsICJzdW1tYXJ5IjogIm9rIiwgImRldGFpbHMiOiAiZXRoIGRldGFpbHMsIHNwZWVkLCBtYWMsIGV0Yy4iLCAibm90aWNlIjogbnVsbH0sICJDVDAuRVRINCI6IHsic3RhdGUiOiAwLCAic3VtbWFyeSI6ICJvayIsICJkZXRhaWxzIjogImV0aCBkZXRhaWxzLCBzcGVlZCwgbWFjLCBldGMuIiwgIm5vdGljZSI6IG51bGx9LCAiQ1QxLkRDQTUiOiB7InN0YXRlIjogMCwgInN1bW1hcnkiOiAib2siLCAiZGV0YWlscyI6IG51bGwsICJub3RpY2UiOiBudWxsfSwgIkNUMS5EQ0E2IjogeyJzdGF0ZSI6IDAsICJzdW1tYXJ5IjogIm9rIiwgImRldGFpbHMiOiBudWxsLCAibm90aWNlIjogbnVsbH19LCAibWV0cmljcyI6IHt9fSwgImNlcnRpZmljYXRlcyI6IHsic2VydmljZXMiOiB7IkNlcnRpZmljYXRlMSI6IHsic3RhdGUiOiAwLCAic3VtbWFyeSI6IDE5ODMyNzc5MDYuMCwgImRldGFpbHMiOiAic2VsZi1zaWduZWQiLCAibm90aWNlIjogbnVsbH19LCAibWV0cmljcyI6IHsiQ2VydGlmaWNhdGUxIjogeyJ2YWx1ZSI6IDM0NDQuMTIyNTQ3Njg3NTE4NCwgImxldmVscyI6IFs5MCwgMzBdLCAiYm91bmRhcmllcyI6IFtudWxsLCBudWxsXX19fSwgImRyaXZlcyI6IHsic2VydmljZXMiOiB7IkNIMC5CQVkxIjogeyJzdGF0ZSI6IDAsICJzdW1tYXJ5IjogImhlYWx0aHkiLCAiZGV0YWlscyI6IG51bGwsICJub3RpY2UiOiBudWxsfX0sICJtZXRyaWNzIjoge319LCAiYXJyYXkiOiB7InNlcnZpY2VzIjogeyJBcnJheSAxIjogeyJzdGF0ZSI6IDAsICJzdW1tYXJ5IjogbnVsbCwgImRldGFpbHMiOiAiNzAuMCIsICJub3RpY2UiOiBudWxsfX0sICJtZXRyaWNzIjogeyJBcnJheSAxIjogeyJ2YWx1ZSI6IDcwLjAsICJsZXZlbHMiOiBbODAuMCwgOTAuMF0sICJib3VuZGFyaWVzIjogWzAsIDEwMF19fX0sICJjb250cm9sbGVycyI6IHsic2VydmljZXMiOiB7IkNUMSI6IHsic3RhdGUiOiAwLCAic3VtbWFyeSI6ICJyZWFkeSIsICJkZXRhaWxzIjogInNlY29uZGFyeSIsICJub3RpY2UiOiBudWxsfSwgIkNUMiI6IHsic3RhdGUiOiAwLCAic3VtbWFyeSI6ICJyZWFkeSIsICJkZXRhaWxzIjogInByaW1hcnkiLCAibm90aWNlIjogbnVsbH19LCAibWV0cmljcyI6IHt9fX0="
-        decoded = FlashArraySpecialAgentResultsSection.from_section(data)
+        decoded = FlashArraySpecialAgentResultsSection.from_section(self.data)
         pprint.pprint(decoded)
+
+
+class LegacyResultsSectionTest(unittest.TestCase):
+    def test_legacy_section(self):
+        """
+        The single results section of older versions of the special agent must be read if no section per subsystem is
+        present, and ignored otherwise.
+        """
+        legacy = IndexedResultsSection.from_string_table([[DecodeTest.data]])
+        self.assertIn("CH0.BAY1", indexed_items(legacy_results_sections([None, None], legacy)))
+        self.assertEqual(
+            "healthy",
+            indexed_results("CH0.BAY1", legacy_results_sections([None, None], legacy))[0][0].summary
+        )
+
+        result = SpecialAgentResult()
+        result.add_service("CT0", Result(State.OK, "ok"))
+        current = IndexedResultsSection({"controllers": result.to_dict()})
+        self.assertEqual(["CT0"], indexed_items(legacy_results_sections([None, current], legacy)))
+
+
+class FromDictTest(unittest.TestCase):
+    def test_nested(self):
+        result = SpecialAgentResult()
+        result.add_metric_with_service("Array 1", Metric(70.0, (80.0, None), (0, 100)), summary="70%")
+        data = result.to_dict()
+        self.assertEqual(result, from_dict(data, SpecialAgentResult))
+        self.assertEqual(result.to_dict(), data, "The data must not be modified while decoding.")
+
+    def test_inventory(self):
+        inventory = SpecialAgentInventory()
+        inventory.add_attributes(Attributes(["hardware"], {"model": "FA-X70"}))
+        inventory.add_table_row(TableRow(["hardware", "volumes"], {"name": "vol1"}, {"size": 1024}))
+        self.assertEqual(inventory, from_dict(inventory.to_dict(), SpecialAgentInventory))
+
+    def test_invalid_enum(self):
+        with self.assertRaises(ValueError):
+            from_dict({"state": 5, "summary": "unknown"}, Result)
+
+
+class ProjectTest(unittest.TestCase):
+    def test_nested(self):
+        interface = models.NetworkInterface(
+            name="ct0.eth2",
+            interface_type="eth",
+            services=["replication"],
+            eth=models.NetworkInterfaceEth(
+                address="10.0.0.2",
+                subinterfaces=[models.FixedReferenceNoId(name="ct0.eth2.100")],
+            ),
+        )
+        record = project(interface, NetworkInterfaceRecord)
+        self.assertEqual(
+            NetworkInterfaceRecord(
+                name="ct0.eth2",
+                interface_type="eth",
+                eth=NetworkInterfaceEthRecord(
+                    address="10.0.0.2",
+                    subinterfaces=[ReferenceRecord("ct0.eth2.100")],
+                ),
+            ),
+            record,
+        )
+        self.assertFalse(hasattr(record, "__dict__"))
+        self.assertEqual(record, pickle.loads(pickle.dumps(record)))
+
+    def test_unset(self):
+        class Support:
+            phonehome_enabled = True
+
+            @property
+            def remote_assist_active(self):
+                # Older pypureclient models raise an AttributeError for unset attributes.
+                raise AttributeError("remote_assist_active")
+
+        self.assertEqual(SupportRecord(True, None), project(Support(), SupportRecord))
+        self.assertIsNone(project(None, SupportRecord))
+
+
+class ItemIndexTest(unittest.TestCase):
+    def test_index(self):
+        queries = []
+
+        class _DataSource(FlashArraySpecialAgentDataSource[HardwareRecord]):
+            def query(self):
+                queries.append(1)
+                return [
+                    HardwareRecord(name="CT0.ETH0", type="eth_port", speed=1),
+                    HardwareRecord(name="ct0.eth0", type="eth_port", speed=2),
+                    HardwareRecord(name="CT0.FC0", type="fc_port"),
+                    HardwareRecord(type="chassis"),
+                ]
+
+        hardware = CachingFlashArraySpecialAgentDataSource(_DataSource())
+        index = hardware.index(lower_name_key)
+        self.assertEqual([1, 2], [item.speed for item in index.get("ct0.eth0")])
+        self.assertEqual([], index.get("ct1.eth0"))
+        self.assertIs(index, hardware.index(lower_name_key))
+        self.assertEqual("ct0.eth0", hardware.index(name_key).first("ct0.eth0").name)
+        self.assertIsNone(hardware.index(name_key).first("CT1.ETH0"))
+        self.assertEqual(1, len(queries))
+
+
+class CompactTableRowTest(unittest.TestCase):
+    def test_wire_format(self):
+        row = NetworkInterfaceTableRow(
+            "eth0",
+            "CT0.ETH0",
+            snmp_type=6,
+            vlans=[1, 2],
+            operational_status=NetworkInterfaceStatus.UP,
+        )
+        self.assertFalse(hasattr(row, "__dict__"))
+        self.assertEqual(
+            {
+                "path": ["networking", "interfaces"],
+                "key_columns": {"port_type": 6, "description": "eth0", "alias": "CT0.ETH0"},
+                "inventory_columns": {
+                    "model": None,
+                    "serial": None,
+                    "speed": None,
+                    "phys_address": None,
+                    "oper_status": 1,
+                    "admin_status": None,
+                    "vlans": "1,2",
+                },
+                "status_columns": None,
+            },
+            json.loads(to_json(row)),
+        )
+        self.assertEqual({}, NetworkRouteTableRow("0.0.0.0/0", "10.0.0.1").status_columns)
+
+    def test_shared_columns(self):
+        first = Volumes("vol1", "1")
+        second = Volumes("vol2", "2")
+        self.assertIs(type(first).key_column_names, type(second).key_column_names)
+        self.assertEqual(json.loads(to_json(first)), dataclasses.asdict(from_dict(json.loads(to_json(first)), TableRow)))
+        self.assertNotEqual(first, second)
+        self.assertEqual(first, Volumes("vol1", "1"))
+
+
+class InventoryTableTest(unittest.TestCase):
+    def test_columns(self):
+        inventory = SpecialAgentInventory()
+        inventory.add_table_row(Volumes("vol1", "1", 2))
+        inventory.add_table_row(Hosts("host1", 2))
+        inventory.add_table_row(Volumes("vol2", "2"))
+        inventory.add_table_row(TableRow(["hardware", "volumes"], {"name": "vol3"}, {"id": "3", "connection_count": 0}))
+        self.assertEqual(3, len(inventory.inventory_tables))
+        volumes = inventory.inventory_tables[0]
+        self.assertEqual(["hardware", "array", "volumes"], volumes.path)
+        self.assertEqual([["vol1", "vol2"], ["1", "2"], [2, None]], volumes.values)
+        self.assertEqual(
+            [json.loads(to_json(row)) for row in [Volumes("vol1", "1", 2), Volumes("vol2", "2"), Hosts("host1", 2)]],
+            [json.loads(to_json(row)) for row in inventory.table_rows()][:3],
+        )
+        decoded = from_dict(json.loads(to_json(inventory)), SpecialAgentInventory)
+        self.assertEqual(list(inventory.table_rows()), list(decoded.table_rows()))
+
+    def test_legacy(self):
+        data = {
+            "inventory_attributes": [],
+            "inventory_table_rows": [
+                {"path": ["hardware", "volumes"], "key_columns": {"name": "vol1"}, "inventory_columns": None,
+                 "status_columns": None},
+            ],
+        }
+        rows = list(from_dict(data, SpecialAgentInventory).table_rows())
+        self.assertEqual([TableRow(["hardware", "volumes"], {"name": "vol1"})], rows)
+
+
+class SectionEncodingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        hardware = SpecialAgentResult()
+        for i in range(100):
+            hardware.add_service(f"CH0.BAY{i}", Result(State.OK, summary="healthy", details=f"Drive {i}"))
+        array = SpecialAgentResult()
+        array.add_metric_with_service("Array 1", Metric(70.0, (80.0, 90.0), (0, 100)), summary="70%")
+        self.section = FlashArraySpecialAgentResultsSection(
+            hardware=hardware,
+            certificates=SpecialAgentResult(),
+            drives=SpecialAgentResult(),
+            array=array,
+            alerts=SpecialAgentResult(),
+            arrayconnections=SpecialAgentResult(),
+            portdetails=SpecialAgentResult(),
+        )
+
+    def test_encode(self):
+        data = self.section.to_section()
+        lines = data.splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual("purestorage-section 2 zlib", lines[0])
+        self.assertLess(len(lines[1]), len(base64.b64encode(self.section.toJSON().encode('ascii'))) / 5)
+        self.assertEqual(self.section, FlashArraySpecialAgentResultsSection.from_section(data))
+
+    def test_lines(self):
+        collected = []
+
+        def items():
+            for field in dataclasses.fields(self.section):
+                collected.append(field.name)
+                yield field.name, getattr(self.section, field.name)
+
+        lines = encode_section_lines(items(), line_bytes=30)
+        self.assertEqual("purestorage-section 2 zlib", next(lines))
+        self.assertEqual([], collected, "The items must be collected while the lines are consumed.")
+        stream = io.StringIO()
+        CheckmkSection("purestorage_flasharray", lines).write(stream)
+        data = stream.getvalue().splitlines()
+        self.assertEqual("<<<purestorage_flasharray>>>", data[0])
+        self.assertGreater(len(data), 3)
+        self.assertTrue(all(len(line) <= 40 for line in data[1:]))
+        self.assertEqual(
+            self.section,
+            FlashArraySpecialAgentResultsSection.from_section("\n".join(["purestorage-section 2 zlib"] + data[1:]))
+        )
+
+    def test_to_json(self):
+        self.assertEqual(json.dumps(dataclasses.asdict(self.section)), to_json(self.section))
+
+    def test_string_table(self):
+        string_table = [line.split() for line in self.section.to_section().splitlines()]
+        self.assertEqual(self.section, FlashArraySpecialAgentResultsSection.from_string_table(string_table))
+
+    def test_legacy(self):
+        data = base64.b64encode(self.section.toJSON().encode('ascii')).decode('ascii')
+        self.assertEqual(self.section, FlashArraySpecialAgentResultsSection.from_section(data))
+        self.assertEqual(self.section, FlashArraySpecialAgentResultsSection.from_string_table([[data]]))
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            FlashArraySpecialAgentResultsSection.from_section("purestorage-section 3 zstd\nabc")
+
+    def test_indexed(self):
+        string_table = [line.split() for line in self.section.to_section().splitlines()]
+        indexed = IndexedResultsSection.from_string_table(string_table)
+        self.assertEqual(101, len(list(indexed.items())))
+        self.assertEqual([(self.section.hardware.services["CH0.BAY42"], None)], indexed.results("CH0.BAY42"))
+        self.assertIs(indexed.results("CH0.BAY42")[0][0], indexed.results("CH0.BAY42")[0][0])
+        self.assertEqual(
+            [(self.section.array.services["Array 1"], self.section.array.metrics["Array 1"])],
+            indexed.results("Array 1")
+        )
+        self.assertEqual([], indexed.results("CH0.BAY100"))
+
+    def test_indexed_subsystems(self):
+        """
+        This test makes sure that an item reported by several subsystems keeps the results of all of them, so a failed
+        drive is not hidden behind the OK hardware result of its bay.
+        """
+        self.section.drives.add_service("CH0.BAY1", Result(State.CRIT, summary="Drive failed"))
+        string_table = [line.split() for line in self.section.to_section().splitlines()]
+        indexed = IndexedResultsSection.from_string_table(string_table)
+        self.assertEqual(1, list(indexed.items()).count("CH0.BAY1"))
+        results = indexed.results("CH0.BAY1")
+        self.assertEqual(
+            [self.section.hardware.services["CH0.BAY1"], self.section.drives.services["CH0.BAY1"]],
+            [service for service, _ in results]
+        )
+        self.assertEqual([State.OK, State.CRIT], [service.state for service, _ in results])
+
+
+class PaginateByOffsetTest(unittest.TestCase):
+    class _Response(ValidResponse):
+        def __init__(self, items, total_item_count):
+            super().__init__(200, None, total_item_count, items, {})
+
+    def _query(self, items, page_size, total=True):
+        lock = threading.Lock()
+        requests = []
+        in_flight = [0, 0]
+
+        def query(offset: int):
+            with lock:
+                requests.append(offset)
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return self._Response(items[offset:offset + page_size], len(items) if total else None)
+
+        return query, requests, in_flight
+
+    def test_parallel(self):
+        items = list(range(95))
+        query, requests, in_flight = self._query(items, 10)
+        self.assertEqual(items, list(paginate_by_offset(query, 3)))
+        self.assertEqual(list(range(0, 95, 10)), sorted(requests))
+        self.assertLessEqual(in_flight[1], 3)
+
+    def test_single_page(self):
+        query, requests, _ = self._query([1, 2, 3], 10)
+        self.assertEqual([1, 2, 3], list(paginate_by_offset(query, 3)))
+        self.assertEqual([0], requests)
+
+    def test_without_total(self):
+        items = list(range(20))
+        query, requests, _ = self._query(items, 10, total=False)
+        self.assertEqual(items, list(paginate_by_offset(query, 3)))
+        self.assertEqual([0, 10, 20], requests)
+
+
+class PageItemsTest(unittest.TestCase):
+    def _response(self, items, more_items_remaining):
+        requests = []
+
+        def endpoint(**kwargs):
+            requests.append(kwargs)
+            raise AssertionError("page_items() must not request another page")
+
+        iterator = ItemIterator(endpoint, {"limit": 10}, "token", None, items, None, more_items_remaining)
+        return ValidResponse(200, "token", None, iter(iterator), {}, None, more_items_remaining), requests
+
+    def test_last_page(self):
+        response, requests = self._response([1, 2, 3], False)
+        self.assertEqual([1, 2, 3], page_items(response))
+        self.assertEqual([], requests)
+
+    def test_short_page(self):
+        """
+        A page shorter than the limit with more items remaining must not make the iterator fetch the next page.
+        """
+        response, requests = self._response([1, 2, 3], True)
+        self.assertEqual([1, 2, 3], page_items(response))
+        self.assertEqual([], requests)
+
+    def test_unsupported_iterator(self):
+        response = ValidResponse(200, "token", None, iter([1, 2, 3]), {}, None, True)
+        with self.assertRaises(UnsupportedClientException):
+            page_items(response)
+
+
+class RawClientTest(unittest.TestCase):
+    class _Client:
+        """
+        This class has the internals of a pypureclient client RawClient relies on, but no versioned module.
+        """
+
+        class _ApiClient:
+            def call_api(self, *args, **kwargs):
+                raise NotImplementedError()
+
+        def __init__(self):
+            self._api_client = self._ApiClient()
+            self._timeout = None
+
+        def _call_with_retries(self, request):
+            return request()
+
+        def _create_error_response(self, e):
+            raise NotImplementedError()
+
+    def test_unsupported(self):
+        with self.assertRaises(UnsupportedClientException):
+            RawClient(object())
+        with self.assertRaises(UnsupportedClientException):
+            RawClient(self._Client())
+        with self.assertLogs(level="WARNING"):
+            self.assertIsNone(RawClient.create(self._Client()))
+        client = self._Client()
+        del client._api_client
+        with self.assertRaisesRegex(UnsupportedClientException, "_api_client"):
+            RawClient(client)
+
+
+class SessionCacheTest(unittest.TestCase):
+    """
+    SessionCache relies on internals of pypureclient. These tests run against the installed version of the library, so
+    they fail once a release changes how the versioned clients create their token manager.
+    """
+
+    def _session(self, directory: str) -> SessionCache:
+        session = SessionCache(directory, "api-token", 3600)
+        session.version = "2.21"
+        session.session_token = "session-token"
+        session.expires = time.time() + 3600
+        return session
+
+    def test_session_client(self):
+        for factory, version in ((pypureclient.flasharray.client, "2.21"), (pypureclient.flashblade.client, "2.17")):
+            with self.subTest(factory.__name__), tempfile.TemporaryDirectory() as directory:
+                session = self._session(directory)
+                session.version = version
+                cli = session._session_client(factory, "127.0.0.1", api_token="api-token")
+                self.assertEqual(version, _client_version(cli))
+                self.assertIsInstance(cli._token_man, _SessionTokenManager)
+                self.assertEqual("session-token", cli._token_man.get_session_token())
+
+    def test_unsupported(self):
+        module = importlib.import_module("pypureclient.flasharray.FA_2_21")
+
+        def init(client, configuration, api_token=None, **kwargs):
+            client._token_man = None
+
+        with tempfile.TemporaryDirectory() as directory:
+            session = self._session(directory)
+            with unittest.mock.patch.object(module.Client, "__init__", init):
+                with self.assertRaisesRegex(UnsupportedClientException, "APITokenManager"):
+                    session._session_client(pypureclient.flasharray.client, "127.0.0.1", api_token="api-token")
+                cli = object()
+                with unittest.mock.patch.object(pypureclient.flasharray.client, "Client", return_value=cli):
+                    with self.assertLogs(level="WARNING"):
+                        self.assertIs(cli, session.client(pypureclient.flasharray.client, "127.0.0.1"))
+            session.version = "1.99"
+            with self.assertRaisesRegex(UnsupportedClientException, "1.99"):
+                session._session_client(pypureclient.flasharray.client, "127.0.0.1", api_token="api-token")
+
+    def test_adopt(self):
+        token_manager = APITokenManager.__new__(APITokenManager)
+        token_manager._session_token = "session-token"
+        with tempfile.TemporaryDirectory() as directory:
+            session = SessionCache(directory, "api-token", 3600)
+            _SessionTokenManager.adopt(token_manager, session)
+            self.assertIsInstance(token_manager, _SessionTokenManager)
+            self.assertEqual("session-token", session.session_token)
+            token_manager.close_session()
+            self.assertEqual("session-token", token_manager.get_session_token())
+
+
+class RequestCounterTest(unittest.TestCase):
+    class _ApiClient:
+        def __init__(self, response):
+            self.response = response
+
+        def request(self, *args, **kwargs):
+            if isinstance(self.response, Exception):
+                raise self.response
+            return self.response
+
+    class _Client:
+        def __init__(self, api_client=None):
+            if api_client is not None:
+                self._api_client = api_client
+
+        def get_volumes(self):
+            return self._api_client.request() if hasattr(self, "_api_client") else None
+
+    class _Response:
+        data = b"{}"
+        status = 429
+
+    def test_http_requests(self):
+        counter = RequestCounter()
+        counter.wrap(self._Client(self._ApiClient(self._Response()))).get_volumes()
+        stats = counter.endpoints()["get_volumes"]
+        self.assertEqual((1, 1, 2, 1), (stats.requests, stats.http_requests, stats.bytes, stats.throttled))
+
+    def test_missing_attributes(self):
+        """
+        This test makes sure that a client lacking the internals the HTTP counters rely on is still counted per call.
+        """
+        counter = RequestCounter()
+        counter.wrap(self._Client()).get_volumes()
+        # The API client has no request function to count the HTTP requests with.
+        self.assertIsNotNone(counter.wrap(self._Client(object())))
+        counter.wrap(self._Client(self._ApiClient(object()))).get_volumes()
+        # An exception raised without calling the constructor has none of its attributes.
+        cli = counter.wrap(self._Client(self._ApiClient(ApiException.__new__(ApiException))))
+        with self.assertRaises(ApiException):
+            cli.get_volumes()
+        stats = counter.endpoints()["get_volumes"]
+        self.assertEqual((3, 2, 0, 0), (stats.requests, stats.http_requests, stats.bytes, stats.throttled))
+
+
+class PersistentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.base = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.base.name, "cache")
+
+    def tearDown(self):
+        self.base.cleanup()
+
+    def test_records(self):
+        cache = PersistentCache(self.directory)
+        records = [
+            NetworkInterfaceRecord(
+                name="ct0.eth0",
+                eth=NetworkInterfaceEthRecord(address="10.0.0.1", subinterfaces=[ReferenceRecord(name="ct0.eth0.1")]),
+            ),
+            NetworkInterfaceRecord(name="ct0.eth1"),
+        ]
+        cache.store("network_interfaces", records)
+        self.assertEqual(0o700, os.stat(self.directory).st_mode & 0o777)
+        with open(os.path.join(self.directory, "network_interfaces.json")) as f:
+            self.assertEqual(json.loads(to_json(records)), json.load(f))
+        self.assertEqual(records, cache.load("network_interfaces", 3600, typing.List[NetworkInterfaceRecord]))
+        self.assertIsNone(cache.load("network_interfaces", 0, typing.List[NetworkInterfaceRecord]))
+        self.assertIsNone(cache.load("missing", 3600))
+
+    def test_untrusted_directory(self):
+        """
+        This test makes sure that entries are neither read from nor written to a directory other users can access or
+        have replaced with a symlink.
+        """
+        cache = PersistentCache(self.directory)
+        cache.store("entry", [1, "a"])
+        self.assertEqual([1, "a"], cache.load("entry", None))
+        os.chmod(self.directory, 0o755)
+        with self.assertRaises(PermissionError):
+            check_private_directory(self.directory)
+        self.assertIsNone(cache.load("entry", None))
+        cache.store("other", [2])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "other.json")))
+
+        os.chmod(self.directory, 0o700)
+        link = os.path.join(self.base.name, "link")
+        os.symlink(self.directory, link)
+        with self.assertRaises(PermissionError):
+            check_private_directory(link)
+        self.assertIsNone(PersistentCache(link).load("entry", None))
+
+
+class AlertStateTest(unittest.TestCase):
+    def test_watermark(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = PersistentCache(directory)
+            # Far in the past for the local clock, so a watermark derived from it would skip this alert.
+            updated = 1000
+            state = AlertState(cache, 86400)
+            self.assertIsNone(state.filter())
+            alerts = state.update([AlertRecord("1", "1", "warning", "open", "Summary", None, updated)])
+            self.assertEqual(["1"], [alert.id for alert in alerts])
+            self.assertEqual(alerts_filter(updated), AlertState(cache, 86400).filter())
+
+    def test_no_updated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = PersistentCache(directory)
+            AlertState(cache, 86400).update([AlertRecord("1", "1", "warning", "open", "Summary", None, None)])
+            self.assertIsNone(AlertState(cache, 86400).filter())
@@ -5,6 +5,7 @@ from typing import Optional, List
 from purestorage_checkmk_test.flasharray.mock_route import _AuthenticatedJSONRoute, _AuthTokenStorage, \
     _ContinuationTokenContainer, _JSONRequest, _JSONResponse
 from purestorage_checkmk_test.httpmock import Response
+from purestorage_checkmk_test.mock_filter import matches, FilterSyntaxError
 
 
 @dataclasses.dataclass
@@ -76,11 +77,13 @@ class _AlertsRoute(_AuthenticatedJSONRoute):
                 {},
                 "The sort parameter is not supported by the mock.".encode('ascii')
             )
-        if query.filter is not None:
+        try:
+            alerts = [alert for alert in self._container.alerts if matches(query.filter, alert)]
+        except FilterSyntaxError as e:
             return Response(
                 400,
                 {},
-                "The filter parameter is not supported by the mock.".encode('ascii')
+                str(e).encode('ascii')
             )
         if query.ids is not None:
             return Response(
@@ -107,13 +110,13 @@ class _AlertsRoute(_AuthenticatedJSONRoute):
                 continuation_token = None
         else:
             continuation_token, items, remaining_items, total = self._continuation_token_container.create(
-                self._container.alerts, None, query.limit, query.offset
+                alerts, None, query.limit, query.offset
             )
 
         return _JSONResponse(
             body=_AlertsResponse(
                 continuation_token=continuation_token,
-                total_item_count=len(self._container.alerts),
+                total_item_count=len(alerts),
                 items=items
             )
         )
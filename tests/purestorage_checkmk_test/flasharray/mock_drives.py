@@ -6,6 +6,7 @@ from typing import Optional, List
 from purestorage_checkmk_test.flasharray.mock_route import _AuthenticatedJSONRoute, _AuthTokenStorage, \
     _ContinuationTokenContainer, _JSONRequest, _JSONResponse
 from purestorage_checkmk_test.httpmock import Response
+from purestorage_checkmk_test.mock_filter import matches, FilterSyntaxError
 
 
 @dataclasses.dataclass
@@ -83,11 +84,13 @@ class _DrivesRoute(_AuthenticatedJSONRoute):
                 {},
                 "The sort parameter is not supported by the mock.".encode('ascii')
             )
-        if query.filter is not None:
+        try:
+            drives = [item for item in self._container.drives if matches(query.filter, item)]
+        except FilterSyntaxError as e:
             return Response(
                 400,
                 {},
-                "The filter parameter is not supported by the mock.".encode('ascii')
+                str(e).encode('ascii')
             )
         if query.ids is not None:
             return Response(
@@ -114,12 +117,12 @@ class _DrivesRoute(_AuthenticatedJSONRoute):
                 continuation_token = None
         else:
             total_capacity = 0
-            for drive in self._container.drives:
+            for drive in drives:
                 total_capacity += drive.capacity
 
             # noinspection PyProtectedMember
             continuation_token, items, remaining_items, total = self._continuation_token_container.create(
-                self._container.drives, Drive(
+                drives, Drive(
                     capacity=total_capacity
                 ), query.limit, query.offset
             )
@@ -127,7 +130,7 @@ class _DrivesRoute(_AuthenticatedJSONRoute):
         return _JSONResponse(
             body=_DrivesResponse(
                 continuation_token=continuation_token,
-                total_item_count=len(self._container.drives),
+                total_item_count=len(drives),
                 total=total,
                 items=items,
             )
@@ -8,6 +8,7 @@ from purestorage_checkmk_test.flasharray.mock_port_details import PortContainer
 from purestorage_checkmk_test.flasharray.mock_route import _AuthenticatedJSONRoute, _AuthTokenStorage, \
     _ContinuationTokenContainer, _JSONRequest, _JSONResponse
 from purestorage_checkmk_test.httpmock import Response
+from purestorage_checkmk_test.mock_filter import matches, FilterSyntaxError
 
 
 @dataclasses.dataclass
@@ -196,11 +197,13 @@ class _HardwaresRoute(_AuthenticatedJSONRoute):
                 {},
                 "The sort parameter is not supported by the mock.".encode('ascii')
             )
-        if query.filter is not None:
+        try:
+            hardwares = [item for item in self._container.hardwares if matches(query.filter, item)]
+        except FilterSyntaxError as e:
             return Response(
                 400,
                 {},
-                "The filter parameter is not supported by the mock".encode('ascii')
+                str(e).encode('ascii')
             )
         if query.ids is not None:
             return Response(
@@ -227,13 +230,13 @@ class _HardwaresRoute(_AuthenticatedJSONRoute):
                 continuation_token = None
         else:
             continuation_token, items, remaining_items, total = self._continuation_token_container.create(
-                self._container.hardwares, None, query.limit, query.offset
+                hardwares, None, query.limit, query.offset
             )
 
         return _JSONResponse(
             body=_HardwaresResponse(
                 continuation_token=continuation_token,
-                total_item_count=len(self._container.hardwares),
+                total_item_count=len(hardwares),
                 items=items
             )
         )
@@ -1,12 +1,20 @@
 import abc
+import contextlib
+import io
+import json
 import logging
 import os
+import pstats
+import tempfile
 import time
 import typing
 import unittest
+import unittest.mock
 import uuid
 
 import pypureclient
+import pypureclient.flasharray.client
+from pypureclient.api_token_manager import APITokenManager
 from pypureclient.flasharray.FA_2_24 import models
 
 import purestorage_checkmk_test.flasharray.mock_admin_settings
@@ -23,13 +31,18 @@ import purestorage_checkmk_test.flasharray.mock_network_interfaces
 import purestorage_checkmk_test.flasharray.mock_smtp
 import purestorage_checkmk_test.flasharray.mock_support
 import purestorage_checkmk_test.flasharray.mock_volumes
-from purestorage_checkmk.common import State, CheckResponse, LimitConfiguration
+from purestorage_checkmk.common import State, CheckResponse, LimitConfiguration, cache_directory, AgentStatsSection, \
+    indexed_items, indexed_results, RawClient, write_private_file
 from purestorage_checkmk.flasharray.common import FlashArraySpecialAgentConfiguration, default_closed_alerts_lifetime, \
-    AlertsConfiguration, default_array_warn, default_array_crit, default_cert_warn, default_cert_crit
-from purestorage_checkmk.flasharray.special_agent import FlashArraySpecialAgent
-from purestorage_checkmk_test.common import SpecialAgentTestCase
+    AlertsConfiguration, default_array_warn, default_array_crit, default_cert_warn, default_cert_crit, \
+    flasharray_section_id, flasharray_section_ids, flasharray_inventory_section_id, \
+    FlashArraySpecialAgentInventorySection, flasharray_agent_stats_section_id
+from purestorage_checkmk.flasharray.special_agent import FlashArraySpecialAgent, \
+    PyPureClientFlashArraySpecialAgentPaginatedDataSource, run, CachingFlashArraySpecialAgentDataSource
+from purestorage_checkmk_test.common import SpecialAgentTestCase, CacheDirectoryTestCase
 from purestorage_checkmk_test.flasharray import mock
 from purestorage_checkmk_test.flasharray.mock_apitokens_container import APITokensContainer
+from purestorage_checkmk_test.flasharray.mock_route import _AuthTokenStorage
 from purestorage_checkmk_test.flasharray.mock_port_details import PortContainer
 
 
@@ -1057,6 +1070,29 @@ class FlashArrayLUNUnitTest(FlashArraySpecialAgentUnitTest):
                         self.assertEqual(row.inventory_columns["connection_count"], volume.connection_count)
                 self.assertTrue(found, f"LUN {volume.name} not found in inventory.")
 
+    def test_inventory_paginated(self):
+        """
+        This test makes sure that all pages are fetched if there are more volumes than fit into a single page.
+        """
+        self.volumes.volumes = [
+            purestorage_checkmk_test.flasharray.mock_volumes.Volume(
+                id=str(uuid.uuid4()),
+                name=f"volume {i}",
+                connection_count=i,
+            ) for i in range(5)
+        ]
+        cfg = FlashArraySpecialAgentConfiguration(page_sizes={"volumes": 2})
+        with self.special_agent(cfg) as agent:
+            volume_rows = self.assert_inventory_table_rows(
+                agent.inventory().volumes,
+                ["hardware", "array", "volumes"],
+                len(self.volumes.volumes)
+            )
+            self.assertEqual(
+                sorted(volume.name for volume in self.volumes.volumes),
+                sorted(row.key_columns["name"] for row in volume_rows)
+            )
+
 
 class FlashArrayLUNIntegrationTest(FlashArraySpecialAgentIntegrationTest):
     def test_inventory(self):
@@ -1100,5 +1136,565 @@ class FlashArrayPortDetailsIntegrationTest(FlashArraySpecialAgentIntegrationTest
         with self.special_agent() as agent:
             self.assertGreater(len(agent.results().portdetails.services), 0)
 
+
+class FlashArrayPrefetchUnitTest(FlashArraySpecialAgentUnitTest):
+    def test_prefetch(self):
+        with self.special_agent() as agent:
+            agent.prefetch()
+            self.assertGreater(len(agent.results().hardware.services), 0)
+            self.assertGreater(len(list(agent.inventory().volumes.table_rows())), 0)
+
+    def test_prefetch_failure(self):
+        """
+        A failing endpoint must not affect the other data sources.
+        """
+        self.volumes.volumes = None
+        with self.special_agent() as agent:
+            agent.prefetch()
+            self.assertGreater(len(agent.results().hardware.services), 0)
+            with self.assertRaises(Exception):
+                agent.inventory()
+
+
+class FlashArrayFilterUnitTest(FlashArraySpecialAgentUnitTest):
+    def test_hardware_components(self):
+        """
+        The hardware services must be the same whether the filter is applied by the API or to the prefetched hardware.
+        """
+        with self.special_agent() as agent:
+            filtered_services = agent.results().hardware.services
+        with self.special_agent() as agent:
+            agent.prefetch()
+            prefetched_services = agent.results().hardware.services
+        self.assertGreater(len(filtered_services), 0)
+        self.assertEqual(sorted(filtered_services.keys()), sorted(prefetched_services.keys()))
+        self.assertEqual(
+            0,
+            len([service for service in filtered_services.values() if service.summary == "not_installed"])
+        )
+
+
+class FlashArrayStreamingUnitTest(FlashArraySpecialAgentUnitTest):
+    def test_streaming(self):
+        cfg = FlashArraySpecialAgentConfiguration(
+            alerts=AlertsConfiguration(
+                closed_alerts_lifetime=default_closed_alerts_lifetime,
+                info=True,
+                warning=True,
+                critical=True,
+                hidden=True,
+            ),
+            streaming=True,
+        )
+        self.alerts.alerts.append(purestorage_checkmk_test.flasharray.mock_alerts.Alert(
+            name="1",
+            id=str(uuid.uuid4()),
+            state="open",
+            severity="warning",
+            summary="(array: GSE-ARRAY10): Eula not accepted",
+            updated=1000 * (int(time.time()) - 60),
+        ))
+        with self.special_agent(cfg) as agent:
+            agent.prefetch()
+            results = agent.results()
+            self.assertEqual(
+                len(results.drives.services),
+                len([drive for drive in self.drives.drives if drive.status != "unused"])
+            )
+            self.assertEqual(len(results.alerts.services), 1)
+            self.assert_inventory_table_rows(
+                agent.inventory().volumes,
+                ["hardware", "array", "volumes"],
+                len(self.volumes.volumes)
+            )
+
+    def test_paginated_query(self):
+        """
+        Paginated data sources must return the items of a page before the next page is requested.
+        """
+        requested_pages = []
+
+        class _Response:
+            def __init__(self, items, continuation_token):
+                self.items = items
+                self.continuation_token = continuation_token
+
+        class _DataSource(PyPureClientFlashArraySpecialAgentPaginatedDataSource[int]):
+            def _query(self, continuation_token: str):
+                page = 0 if continuation_token is None else int(continuation_token)
+                requested_pages.append(page)
+                return _Response([2 * page, 2 * page + 1], str(page + 1) if page < 2 else None)
+
+        items = _DataSource(None).query()
+        self.assertEqual(0, next(items))
+        self.assertEqual(1, next(items))
+        self.assertEqual([0], requested_pages)
+        self.assertEqual([2, 3, 4, 5], list(items))
+        self.assertEqual([0, 1, 2], requested_pages)
+
+
+class FlashArrayRequestsUnitTest(FlashArraySpecialAgentUnitTest):
+    def test_requests(self):
+        """
+        This test makes sure that a run, as performed by run(), requests every endpoint at most once.
+        """
+        cfg = FlashArraySpecialAgentConfiguration(
+            alerts=AlertsConfiguration(
+                closed_alerts_lifetime=default_closed_alerts_lifetime,
+                info=True,
+                warning=True,
+                critical=True,
+                hidden=True,
+            ),
+            cache_ttls={},
+        )
+        with self.special_agent(cfg) as agent:
+            agent.prefetch()
+            agent.results()
+            agent.inventory()
+            requests = agent.requests()
+            self.assertIn("get_drives", requests)
+            self.assertIn("get_array_connections", requests)
+            self.assertIn("get_alerts", requests)
+            for endpoint, count in requests.items():
+                self.assertEqual(1, count, f"{endpoint} was requested {count} times.")
+
+
+class FlashArrayRawJSONUnitTest(FlashArraySpecialAgentUnitTest):
+    def test_raw_json(self):
+        """
+        This test makes sure that reading the large collections as JSON results in the same sections as reading them
+        through the models of the client.
+        """
+        self.alerts.alerts.append(purestorage_checkmk_test.flasharray.mock_alerts.Alert(
+            name="1",
+            id=str(uuid.uuid4()),
+            state="open",
+            severity="warning",
+            summary="(array: GSE-ARRAY10): Eula not accepted",
+            updated=1000 * (int(time.time()) - 60),
+        ))
+        sections = []
+        for raw_json in [False, True]:
+            cfg = FlashArraySpecialAgentConfiguration(
+                alerts=AlertsConfiguration(
+                    closed_alerts_lifetime=default_closed_alerts_lifetime,
+                    info=True,
+                    warning=True,
+                    critical=True,
+                    hidden=True,
+                ),
+                raw_json=raw_json,
+            )
+            with self.special_agent(cfg) as agent:
+                agent.prefetch()
+                results = agent.results().to_dict()
+                # The remaining lifetime of the certificates changes between the runs.
+                del results["certificates"]
+                sections.append((results, agent.inventory().to_dict(), agent.requests()))
+        self.assertEqual(1, len(sections[1][0]["alerts"]["services"]))
+        self.assertEqual(sections[0], sections[1])
+
+    def test_unsupported_client(self):
+        """
+        This test makes sure that the special agent falls back to the models if the client lacks an internal the JSON
+        requests rely on.
+        """
+        cfg = FlashArraySpecialAgentConfiguration(raw_json=True)
+        with unittest.mock.patch.object(RawClient, "_client_attributes", RawClient._client_attributes + ("_missing",)):
+            with self.assertLogs(level=logging.WARNING) as logs, self.special_agent(cfg) as agent:
+                self.assertGreater(len(list(agent.inventory().volumes.table_rows())), 0)
+                self.assertIn("get_volumes", agent.requests())
+        self.assertIn("_missing", "\n".join(logs.output))
+
+
+class FlashArrayCacheDirectoryUnitTest(CacheDirectoryTestCase, FlashArraySpecialAgentUnitTest, abc.ABC):
+    """
+    This test case points the cache directory of the special agent to a temporary directory.
+    """
+
+
+class FlashArrayPersistentCacheUnitTest(FlashArrayCacheDirectoryUnitTest):
+    def test_inventory(self):
+        cfg = FlashArraySpecialAgentConfiguration(cache_ttls={"volumes": 3600})
+        with self.special_agent(cfg) as agent:
+            volumes = self.assert_inventory_table_rows(agent.inventory().volumes, ["hardware", "array", "volumes"])
+
+        self.volumes.volumes = self.volumes.volumes + [purestorage_checkmk_test.flasharray.mock_volumes.Volume(
+            id=str(uuid.uuid4()),
+            name="cached volume",
+            connection_count=0,
+        )]
+
+        with self.special_agent(cfg) as agent:
+            self.assert_inventory_table_rows(
+                agent.inventory().volumes,
+                ["hardware", "array", "volumes"],
+                len(volumes)
+            )
+
+        cfg.cache_ttls = {}
+        with self.special_agent(cfg) as agent:
+            self.assert_inventory_table_rows(
+                agent.inventory().volumes,
+                ["hardware", "array", "volumes"],
+                len(volumes) + 1
+            )
+
+
+class FlashArraySectionIntervalsUnitTest(FlashArrayCacheDirectoryUnitTest):
+    def test_sections(self):
+        """
+        This test makes sure that a section with an interval is sent with a cached header and that its endpoints are not
+        requested again while it is fresh.
+        """
+        cfg = FlashArraySpecialAgentConfiguration(cache_ttls={}, section_intervals={"certificates": 3600})
+        with self.special_agent(cfg) as agent:
+            sections = {section.id: section for section in agent.sections()}
+            self.assertIn("get_certificates", agent.requests())
+        self.assertEqual(
+            set(flasharray_section_ids + [flasharray_inventory_section_id, flasharray_agent_stats_section_id]),
+            set(sections.keys())
+        )
+        certificates = sections[flasharray_section_id("certificates")]
+        self.assertIsNotNone(certificates.cached)
+        self.assertEqual(3600, certificates.cached[1])
+        self.assertTrue(str(certificates).startswith(
+            f"<<<{flasharray_section_id('certificates')}:cached({certificates.cached[0]},3600)>>>\n"
+        ))
+        self.assertIsNone(sections[flasharray_section_id("hardware")].cached)
+
+        with self.special_agent(cfg) as agent:
+            cached_sections = {section.id: section for section in agent.sections()}
+            self.assertNotIn("get_certificates", agent.requests())
+            self.assertIn("get_hardware", agent.requests())
+        self.assertEqual(str(certificates), str(cached_sections[flasharray_section_id("certificates")]))
+
+    def test_hardware_requests(self):
+        """
+        This test makes sure that the hardware is requested once per run: completely if the inventory is collected, and
+        only the components the hardware section reports on while the stored inventory is fresh.
+        """
+        cfg = FlashArraySpecialAgentConfiguration(cache_ttls={}, section_intervals={"inventory": 3600})
+        endpoints = []
+        for _ in range(2):
+            with self.special_agent(cfg) as agent:
+                for section in agent.sections():
+                    section.write(io.StringIO())
+                endpoints.append(agent.agent_stats().endpoints["get_hardware"])
+        self.assertEqual([1, 1], [endpoint.requests for endpoint in endpoints])
+        self.assertLess(endpoints[1].items, endpoints[0].items)
+
+    def test_failing_inventory(self):
+        """
+        This test makes sure that an inventory collector failing while the sections are written doesn't leave a
+        truncated inventory section behind.
+        """
+        cfg = FlashArraySpecialAgentConfiguration(cache_ttls={}, section_intervals={})
+        stream = io.StringIO()
+        with self.special_agent(cfg) as agent:
+            with unittest.mock.patch.object(agent, "_inventorize_dns", side_effect=Exception("DNS failed")):
+                with self.assertRaisesRegex(Exception, "DNS failed"):
+                    for section in agent.sections():
+                        section.write(stream)
+        self.assertIn(f"<<<{flasharray_section_id('hardware')}>>>", stream.getvalue())
+        self.assertNotIn(f"<<<{flasharray_inventory_section_id}>>>", stream.getvalue())
+
+    def test_check(self):
+        """
+        This test makes sure that an item reported in several sections is discovered once and checked with the results
+        of all of them, so a failed drive is not hidden behind the OK hardware result of its bay.
+        """
+        # The second drive is in the bay the hardware reports as CH0.BAY1, like the first drive in the drives.
+        self.drives.add(1)
+        self.drives.add(1)
+        self.drives.drives[0].status = "unhealthy"
+        cfg = FlashArraySpecialAgentConfiguration(cache_ttls={}, section_intervals={})
+        with self.special_agent(cfg) as agent:
+            sections = self.indexed_results_sections(agent.sections(), flasharray_section_ids)
+        items = indexed_items(sections)
+        self.assertEqual(len(set(items)), len(items))
+        self.assertIn("Certificate1 certificate", items)
+        self.assertIn("CH0.BAY1", items)
+        for item in items:
+            self.assertEqual(
+                [result for section in sections for result in section.results(item)],
+                indexed_results(item, sections)
+            )
+        self.assertEqual(
+            [State.OK, State.WARN],
+            [service.state for service, _ in indexed_results("CH0.BAY1", sections)]
+        )
+        # Sections that are missing, e.g. because their subsystem failed, are skipped.
+        self.assertEqual(
+            [State.WARN],
+            [service.state for service, _ in indexed_results("CH0.BAY1", [None, None, sections[2]])]
+        )
+
+    def test_write(self):
+        cfg = FlashArraySpecialAgentConfiguration(cache_ttls={})
+        stream = io.StringIO()
+        with self.special_agent(cfg) as agent:
+            for section in agent.sections():
+                section.write(stream)
+        sections = {}
+        for line in stream.getvalue().splitlines():
+            if line.startswith("<<<"):
+                section_id = line.strip("<>")
+                sections[section_id] = []
+            else:
+                sections[section_id].append(line)
+        inventory = FlashArraySpecialAgentInventorySection.from_section(
+            "\n".join(sections[flasharray_inventory_section_id])
+        )
+        self.assertGreater(len(list(inventory.volumes.table_rows())), 0)
+
+    def test_agent_stats(self):
+        """
+        This test makes sure that the last section holds the durations of the endpoints, collectors and sections of the
+        run, and that the runtime levels are applied to the agent performance service.
+        """
+        cfg = FlashArraySpecialAgentConfiguration(cache_ttls={}, agent_runtime=LimitConfiguration(0, 3600))
+        stream = io.StringIO()
+        with self.special_agent(cfg) as agent:
+            sections = []
+            for section in agent.sections():
+                section.write(stream)
+                sections.append(section)
+            requests = agent.requests()
+        self.assertEqual(flasharray_agent_stats_section_id, sections[-1].id)
+        stats = AgentStatsSection.from_section(sections[-1].data)
+        self.assertEqual(requests, {endpoint: stats.requests for endpoint, stats in stats.endpoints.items()})
+        self.assertIn("Client bootstrap", stats.steps)
+        self.assertIn("hardware", stats.collectors)
+        self.assertIn("inventory/volumes", stats.collectors)
+        self.assertEqual(
+            set(flasharray_section_ids + [flasharray_inventory_section_id]),
+            set(stats.sections.keys())
+        )
+        self.assertGreaterEqual(stats.runtime, sum(stats.steps.values()))
+
+        result, metrics = stats.performance()
+        self.assertEqual(State.WARN, result.state)
+        self.assertEqual((0, 3600), metrics["runtime"].levels)
+        self.assertIn("get_hardware_seconds", metrics)
+
+        hardware = stats.endpoints["get_hardware"]
+        self.assertEqual(hardware.requests, hardware.pages)
+        self.assertGreater(hardware.items, 0)
+        self.assertEqual(hardware.requests, hardware.http_requests)
+        self.assertGreater(hardware.bytes, 0)
+        self.assertEqual(0, hardware.retries)
+
+    def test_stats_option(self):
+        """
+        This test makes sure that the --stats option prints the request counters to the standard error without changing
+        the output of the special agent.
+        """
+        cfg = FlashArraySpecialAgentConfiguration(
+            host=f"127.0.0.1:{self.mock_server.port()}",
+            api_token=self.api_token,
+            verify_tls=False,
+            cache_ttls={},
+        )
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            self.assertEqual(0, run(io.StringIO(cfg.to_json()), stdout, ["--stats"]))
+        self.assertIn(f"<<<{flasharray_agent_stats_section_id}>>>", stdout.getvalue())
+        self.assertNotIn("get_hardware", stdout.getvalue())
+        report = stderr.getvalue().splitlines()
+        self.assertTrue(report[0].startswith("endpoint"))
+        self.assertIn("get_hardware", [line.split()[0] for line in report])
+
+    def test_profile_option(self):
+        """
+        This test makes sure that the --profile option writes a cProfile file, a memory report and a trace named after
+        the array host, and leaves the output of the special agent alone.
+        """
+        cfg = FlashArraySpecialAgentConfiguration(
+            host=f"127.0.0.1:{self.mock_server.port()}",
+            api_token=self.api_token,
+            verify_tls=False,
+            cache_ttls={},
+        )
+        stdout = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(0, run(
+                io.StringIO(cfg.to_json()),
+                stdout,
+                ["--profile", "cpu,memory,trace", "--profile-dir", directory, "--profile-top", "5"],
+            ))
+            files = os.listdir(directory)
+            self.assertEqual(3, len(files), files)
+            cpu = [name for name in files if name.endswith(".prof")][0]
+            self.assertTrue(cpu.startswith(f"flasharray-127.0.0.1_{self.mock_server.port()}-"))
+            memory = cpu[:-len(".prof")] + "-memory.txt"
+            self.assertIn(memory, files)
+            stats = pstats.Stats(os.path.join(directory, cpu))
+            self.assertGreater(stats.total_calls, 0)
+            # The data sources are prefetched in worker threads, which are profiled as well.
+            code = CachingFlashArraySpecialAgentDataSource.prefetch.__code__
+            self.assertIn((code.co_filename, code.co_firstlineno, code.co_name), stats.stats)
+            with open(os.path.join(directory, memory)) as f:
+                report = f.read().splitlines()
+            self.assertTrue(report[0].startswith("Peak traced memory"))
+            self.assertEqual(5, len(report) - 3)
+            trace = cpu[:-len(".prof")] + ".trace.json"
+            self.assertIn(trace, files)
+            with open(os.path.join(directory, trace)) as f:
+                events = json.load(f)["traceEvents"]
+        spans = {(event["cat"], event["name"]) for event in events if event["ph"] == "X"}
+        self.assertIn(("agent", "Client bootstrap"), spans)
+        self.assertIn(("rest", "get_hardware"), spans)
+        self.assertIn(("collector", "hardware"), spans)
+        self.assertIn(("collector", "inventory/volumes"), spans)
+        self.assertIn(("encode", flasharray_inventory_section_id), spans)
+        self.assertIn(("section", flasharray_inventory_section_id), spans)
+        self.assertIn(("stdout", "write"), spans)
+        headers = [line for line in stdout.getvalue().splitlines() if line.startswith("<<<")]
+        self.assertEqual(
+            [f"<<<{section_id}>>>" for section_id in flasharray_section_ids] + [
+                f"<<<{flasharray_inventory_section_id}>>>", f"<<<{flasharray_agent_stats_section_id}>>>"
+            ],
+            headers
+        )
+
+
+class FlashArraySessionUnitTest(FlashArrayCacheDirectoryUnitTest):
+    def session(self) -> dict:
+        with open(os.path.join(
+                cache_directory("flasharray", f"127.0.0.1:{self.mock_server.port()}"),
+                "session.json"
+        )) as f:
+            return json.load(f)
+
+    def test_session_reuse(self):
+        cfg = FlashArraySpecialAgentConfiguration(session_lifetime=3600)
+        with self.special_agent(cfg) as agent:
+            self.assertGreater(len(agent.results().hardware.services), 0)
+        session = self.session()
+        self.assertEqual("2.21", session["version"])
+
+        with self.special_agent(cfg) as agent:
+            self.assertGreater(len(agent.results().hardware.services), 0)
+        self.assertEqual(session["session_token"], self.session()["session_token"])
+
+    def test_session_bootstrap(self):
+        """
+        With a stored version and session token, the special agent must neither negotiate the version through the
+        factory module nor log in, and must leave the pypureclient classes unchanged.
+        """
+        cfg = FlashArraySpecialAgentConfiguration(session_lifetime=3600)
+        request_session_token = APITokenManager._request_session_token
+        with self.special_agent(cfg) as agent:
+            self.assertGreater(len(agent.results().hardware.services), 0)
+        with self.special_agent(cfg) as agent:
+            self.assertGreater(len(agent.results().hardware.services), 0)
+        logins = len(_AuthTokenStorage.auth_tokens)
+
+        with unittest.mock.patch.object(
+                pypureclient.flasharray.client,
+                "Client",
+                wraps=pypureclient.flasharray.client.Client
+        ) as factory_client:
+            with self.special_agent(cfg) as agent:
+                self.assertGreater(len(agent.results().hardware.services), 0)
+        factory_client.assert_not_called()
+        self.assertEqual(logins, len(_AuthTokenStorage.auth_tokens))
+        self.assertIs(request_session_token, APITokenManager._request_session_token)
+
+    def test_session_unsupported_version(self):
+        """
+        When the client library does not offer the stored version, the special agent must negotiate it again.
+        """
+        cfg = FlashArraySpecialAgentConfiguration(session_lifetime=3600)
+        with self.special_agent(cfg) as agent:
+            self.assertGreater(len(agent.results().hardware.services), 0)
+        session = self.session()
+        session["version"] = "1.99"
+        write_private_file(
+            os.path.join(cache_directory("flasharray", f"127.0.0.1:{self.mock_server.port()}"), "session.json"),
+            json.dumps(session).encode("ascii")
+        )
+
+        with self.assertLogs(level=logging.WARNING):
+            with self.special_agent(cfg) as agent:
+                self.assertGreater(len(agent.results().hardware.services), 0)
+        self.assertEqual("2.21", self.session()["version"])
+
+    def test_session_expired(self):
+        """
+        When the array rejects the stored session, the special agent must log in again.
+        """
+        cfg = FlashArraySpecialAgentConfiguration(session_lifetime=3600)
+        with self.special_agent(cfg) as agent:
+            self.assertGreater(len(agent.results().hardware.services), 0)
+        session = self.session()
+        _AuthTokenStorage.auth_tokens.discard(session["session_token"])
+        logins = len(_AuthTokenStorage.auth_tokens)
+
+        with self.assertNoLogs(level=logging.ERROR):
+            with self.special_agent(cfg) as agent:
+                self.assertGreater(len(agent.results().hardware.services), 0)
+        self.assertNotEqual(session["session_token"], self.session()["session_token"])
+        self.assertEqual(logins + 1, len(_AuthTokenStorage.auth_tokens))
+        self.assertIn(self.session()["session_token"], _AuthTokenStorage.auth_tokens)
+
+
+class FlashArrayIncrementalAlertUnitTest(FlashArrayCacheDirectoryUnitTest):
+    def alert(self, state: str, updated: int) -> purestorage_checkmk_test.flasharray.mock_alerts.Alert:
+        return purestorage_checkmk_test.flasharray.mock_alerts.Alert(
+            name=str(len(self.alerts.alerts) + 1),
+            id=str(uuid.uuid4()),
+            state=state,
+            severity="warning",
+            summary="(array: GSE-ARRAY10): Eula not accepted",
+            description="Description of the Alert",
+            created=updated,
+            updated=updated,
+        )
+
+    def test_services(self):
+        cfg = FlashArraySpecialAgentConfiguration(
+            alerts=AlertsConfiguration(
+                closed_alerts_lifetime=default_closed_alerts_lifetime,
+                info=True,
+                warning=True,
+                critical=True,
+                hidden=True,
+                incremental=True,
+            )
+        )
+        now = 1000 * int(time.time())
+        self.alerts.alerts.append(self.alert("open", now - 60000))
+        self.alerts.alerts.append(self.alert("closed", now - 1000 * (cfg.alerts.closed_alerts_lifetime + 60)))
+
+        with self.special_agent(cfg) as agent:
+            alert_services = agent.results().alerts.services
+            self.assertEqual(len(alert_services), 1)
+            self.assertEqual(list(alert_services.values())[0].state, State.WARN)
+
+        # Alerts updated before the watermark are no longer fetched, their state is kept locally.
+        self.alerts.alerts[0].state = "closed"
+        self.alerts.alerts[0].updated = now
+        self.alerts.alerts.append(self.alert("closed", now - 120000))
+
+        with self.special_agent(cfg) as agent:
+            alert_services = agent.results().alerts.services
+            self.assertEqual(len(alert_services), 1)
+            self.assertEqual(list(alert_services.values())[0].state, State.OK)
+
+        self.alerts.alerts.append(self.alert("open", now + 1000))
+
+        with self.special_agent(cfg) as agent:
+            alert_services = agent.results().alerts.services
+            self.assertEqual(len(alert_services), 2)
+            self.assertEqual(
+                sorted(service.state for service in alert_services.values()),
+                [State.OK, State.WARN],
+            )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -7,6 +7,7 @@ from purestorage_checkmk_test.flashblade.mock_blades import BladesContainer
 from purestorage_checkmk_test.flashblade.mock_route import _AuthenticatedJSONRoute, _AuthTokenStorage, \
     _ContinuationTokenContainer, _JSONRequest, _JSONResponse
 from purestorage_checkmk_test.httpmock import Response
+from purestorage_checkmk_test.mock_filter import matches, FilterSyntaxError
 
 
 @dataclasses.dataclass
@@ -170,11 +171,13 @@ class _HardwareRoute(_AuthenticatedJSONRoute):
                 {},
                 "The sort parameter is not supported by the mock.".encode('ascii')
             )
-        if query.filter is not None:
+        try:
+            hardware_items = [item for item in self._container.hardware_items if matches(query.filter, item)]
+        except FilterSyntaxError as e:
             return Response(
                 400,
                 {},
-                "The filter parameter is not supported by the mock.".encode('ascii')
+                str(e).encode('ascii')
             )
         if query.ids is not None:
             return Response(
@@ -202,13 +205,13 @@ class _HardwareRoute(_AuthenticatedJSONRoute):
         else:
             # noinspection PyProtectedMember
             continuation_token, items, remaining_items, total = self._continuation_token_container.create(
-                self._container.hardware_items, None, query.limit, query.offset
+                hardware_items, None, query.limit, query.offset
             )
         # noinspection PyProtectedMember
         return _JSONResponse(
             body=_HardwareResponse(
                 continuation_token=continuation_token,
-                total_item_count=len(self._container.hardware_items),
+                total_item_count=len(hardware_items),
                 items=items,
             )
         )
@@ -152,7 +152,7 @@ class _ContinuationTokenContainer(Generic[T]):
     def get(self, continuation_token: str, limit: int, offset: int = 0) -> Tuple[List[T], List[T], T]:
         try:
             entry = self._data[continuation_token]
-            result = entry.items[offset:limit].copy()
+            result = entry.items[offset:offset + limit].copy()
             entry.items = entry.items[offset + limit:].copy()
             remaining_items = entry.items
             total = self._data[continuation_token].total
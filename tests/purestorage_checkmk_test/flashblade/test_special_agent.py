@@ -1,21 +1,25 @@
 import abc
+import io
 import logging
 import os
 import time
 import typing
 import unittest
+import unittest.mock
 import uuid
 
 import pypureclient
 from pypureclient.flashblade.FB_2_9 import models
 
+import purestorage_checkmk_test.flashblade.mock_alerts
 import purestorage_checkmk_test.flashblade.mock_blades
-from purestorage_checkmk.common import State, LimitConfiguration
+from purestorage_checkmk.common import State, LimitConfiguration, indexed_items, indexed_results, to_json
 from purestorage_checkmk.flashblade.common import FlashBladeSpecialAgentConfiguration, AlertsConfiguration, \
     default_closed_alerts_lifetime, default_array_space_warn, default_array_space_crit, default_cert_warn, \
-    default_cert_crit
+    default_cert_crit, flashblade_section_id, flashblade_section_ids, flashblade_inventory_section_id, \
+    flashblade_agent_stats_section_id, default_cache_ttls
 from purestorage_checkmk.flashblade.special_agent import FlashBladeSpecialAgent
-from purestorage_checkmk_test.common import SpecialAgentTestCase
+from purestorage_checkmk_test.common import SpecialAgentTestCase, CacheDirectoryTestCase
 from purestorage_checkmk_test.flashblade import mock
 from purestorage_checkmk_test.flashblade.mock_alerts import AlertsContainer
 from purestorage_checkmk_test.flashblade.mock_apitokens_container import APITokensContainer
@@ -910,5 +914,193 @@ class FlashBladeSystemSettingsIntegrationTest(FlashBladeSpecialAgentIntegrationT
             )
 
 
+class FlashBladePrefetchUnitTest(FlashBladeSpecialAgentUnitTest):
+    def test_prefetch(self):
+        with self.special_agent() as agent:
+            agent.prefetch()
+            self.assertGreater(len(agent.results().hardware.services), 0)
+            self.assertGreater(len(agent.results().space.services), 0)
+            self.assertGreater(len(list(agent.inventory().hardware.table_rows())), 0)
+
+    def test_requests(self):
+        """
+        This test makes sure that a run, as performed by run(), requests every endpoint at most once. The space
+        endpoint is requested once for each type of space.
+        """
+        cfg = FlashBladeSpecialAgentConfiguration(
+            alerts=AlertsConfiguration(
+                closed_alerts_lifetime=default_closed_alerts_lifetime,
+                info=True,
+                warning=True,
+                critical=True,
+            )
+        )
+        with self.special_agent(cfg) as agent:
+            agent.prefetch()
+            agent.results()
+            agent.inventory()
+            requests = agent.requests()
+            self.assertEqual(3, requests.pop("get_arrays_space"))
+            self.assertIn("get_alerts", requests)
+            for endpoint, count in requests.items():
+                self.assertEqual(1, count, f"{endpoint} was requested {count} times.")
+
+
+class FlashBladeIncrementalAlertUnitTest(CacheDirectoryTestCase, FlashBladeSpecialAgentUnitTest):
+    def alert(self, state: str, updated: int) -> purestorage_checkmk_test.flashblade.mock_alerts.Alert:
+        return purestorage_checkmk_test.flashblade.mock_alerts.Alert(
+            name=str(len(self.alerts.alerts) + 1),
+            id=str(uuid.uuid4()),
+            state=state,
+            severity="warning",
+            summary="(array: GSE-ARRAY10): Eula not accepted",
+            description="Description of the Alert",
+            created=updated,
+            updated=updated,
+        )
+
+    def test_services(self):
+        cfg = FlashBladeSpecialAgentConfiguration(
+            alerts=AlertsConfiguration(
+                closed_alerts_lifetime=default_closed_alerts_lifetime,
+                info=True,
+                warning=True,
+                critical=True,
+                incremental=True,
+            )
+        )
+        now = 1000 * int(time.time())
+        self.alerts.alerts.append(self.alert("open", now - 60000))
+
+        with self.special_agent(cfg) as agent:
+            alert_services = agent.results().alerts.services
+            self.assertEqual(len(alert_services), 1)
+            self.assertEqual(list(alert_services.values())[0].state, State.WARN)
+
+        # Alerts updated before the watermark are no longer fetched, their state is kept locally.
+        self.alerts.alerts[0].state = "closed"
+        self.alerts.alerts[0].updated = now
+        self.alerts.alerts.append(self.alert("closed", now - 120000))
+
+        with self.special_agent(cfg) as agent:
+            alert_services = agent.results().alerts.services
+            self.assertEqual(len(alert_services), 1)
+            self.assertEqual(list(alert_services.values())[0].state, State.OK)
+
+
+class FlashBladePersistentCacheUnitTest(CacheDirectoryTestCase, FlashBladeSpecialAgentUnitTest):
+    def test_services(self):
+        """
+        This test makes sure that the cached endpoints are read back from the cache as the same records, and that they
+        are not requested again while the cache is fresh.
+        """
+        cfg = FlashBladeSpecialAgentConfiguration(cache_ttls=dict(default_cache_ttls), section_intervals={})
+        with self.special_agent(cfg) as agent:
+            certificate_services = agent.results().certificates.services
+            inventory = to_json(agent.inventory())
+            self.assertIn("get_certificates", agent.requests())
+        self.assert_named_item_service_state(self.certificates.certificates, certificate_services, State.OK)
+
+        for cert in self.certificates.certificates:
+            cert.valid_to = (int(time.time()) + default_cert_crit * 86400 - 1) * 1000
+
+        with self.special_agent(cfg) as agent:
+            self.assert_named_item_service_state(
+                self.certificates.certificates,
+                agent.results().certificates.services,
+                State.OK
+            )
+            self.assertEqual(inventory, to_json(agent.inventory()))
+            for endpoint in ["get_certificates", "get_support", "get_dns", "get_smtp_servers", "get_admins_api_tokens"]:
+                self.assertNotIn(endpoint, agent.requests())
+
+        cfg.cache_ttls = {}
+        with self.special_agent(cfg) as agent:
+            self.assert_named_item_service_state(
+                self.certificates.certificates,
+                agent.results().certificates.services,
+                State.CRIT
+            )
+
+
+class FlashBladeSectionIntervalsUnitTest(CacheDirectoryTestCase, FlashBladeSpecialAgentUnitTest):
+    def test_sections(self):
+        """
+        This test makes sure that a section with an interval is sent with a cached header and that its endpoints are not
+        requested again while it is fresh.
+        """
+        cfg = FlashBladeSpecialAgentConfiguration(cache_ttls={}, section_intervals={"certificates": 3600})
+        with self.special_agent(cfg) as agent:
+            sections = {section.id: section for section in agent.sections()}
+            self.assertIn("get_certificates", agent.requests())
+        self.assertEqual(
+            set(flashblade_section_ids + [flashblade_inventory_section_id, flashblade_agent_stats_section_id]),
+            set(sections.keys())
+        )
+        certificates = sections[flashblade_section_id("certificates")]
+        self.assertIsNotNone(certificates.cached)
+        self.assertEqual(3600, certificates.cached[1])
+        self.assertIsNone(sections[flashblade_section_id("hardware")].cached)
+
+        with self.special_agent(cfg) as agent:
+            cached_sections = {section.id: section for section in agent.sections()}
+            self.assertNotIn("get_certificates", agent.requests())
+            self.assertIn("get_hardware", agent.requests())
+        self.assertEqual(str(certificates), str(cached_sections[flashblade_section_id("certificates")]))
+
+    def test_hardware_requests(self):
+        """
+        This test makes sure that the hardware is requested once per run: completely if the inventory is collected, and
+        only the components the hardware section reports on while the stored inventory is fresh.
+        """
+        cfg = FlashBladeSpecialAgentConfiguration(cache_ttls={}, section_intervals={"inventory": 3600})
+        endpoints = []
+        for _ in range(2):
+            with self.special_agent(cfg) as agent:
+                for section in agent.sections():
+                    section.write(io.StringIO())
+                endpoints.append(agent.agent_stats().endpoints["get_hardware"])
+        self.assertEqual([1, 1], [endpoint.requests for endpoint in endpoints])
+        self.assertLess(endpoints[1].items, endpoints[0].items)
+
+    def test_failing_inventory(self):
+        """
+        This test makes sure that an inventory collector failing while the sections are written doesn't leave a
+        truncated inventory section behind.
+        """
+        cfg = FlashBladeSpecialAgentConfiguration(cache_ttls={}, section_intervals={})
+        stream = io.StringIO()
+        with self.special_agent(cfg) as agent:
+            with unittest.mock.patch.object(agent, "_inventorize_dns", side_effect=Exception("DNS failed")):
+                with self.assertRaisesRegex(Exception, "DNS failed"):
+                    for section in agent.sections():
+                        section.write(stream)
+        self.assertIn(f"<<<{flashblade_section_id('hardware')}>>>", stream.getvalue())
+        self.assertNotIn(f"<<<{flashblade_inventory_section_id}>>>", stream.getvalue())
+
+    def test_check(self):
+        """
+        This test makes sure that the items of all sections are discovered once and checked with the results of every
+        section that reports them.
+        """
+        cfg = FlashBladeSpecialAgentConfiguration(cache_ttls={}, section_intervals={})
+        with self.special_agent(cfg) as agent:
+            sections = self.indexed_results_sections(agent.sections(), flashblade_section_ids)
+        items = indexed_items(sections)
+        self.assertEqual(len(set(items)), len(items))
+        self.assertIn("Certificate1 certificate", items)
+        self.assertIn("Array space", items)
+        for item in items:
+            results = indexed_results(item, sections)
+            self.assertGreater(len(results), 0)
+            self.assertEqual([result for section in sections for result in section.results(item)], results)
+        # Sections that are missing, e.g. because their subsystem failed, are skipped.
+        self.assertEqual(
+            sections[2].results("Certificate1 certificate"),
+            indexed_results("Certificate1 certificate", [None, None, sections[2], None])
+        )
+        self.assertEqual([], indexed_results("Certificate1 certificate", [None, None, None, None]))
+
+
 if __name__ == "__main__":
     unittest.main()
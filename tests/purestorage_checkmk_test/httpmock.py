@@ -10,6 +10,7 @@ import threading
 import time
 import typing
 import unittest
+import urllib.parse
 from datetime import datetime, timedelta
 from socketserver import ThreadingMixIn
 from typing import Dict, List
@@ -36,7 +37,7 @@ class Request:
         if len(parts) == 1:
             return query_string
         for component in parts[1].split("&"):
-            component_parts = component.split("=", 1)
+            component_parts = [urllib.parse.unquote_plus(part) for part in component.split("=", 1)]
             if len(component_parts) == 2:
                 if component_parts[0] not in query_string:
                     query_string[component_parts[0]] = []
@@ -68,7 +69,7 @@ class Request:
 class Response:
     status: int = 200
     headers: Dict[str, List[str]] = dataclasses.field(default_factory=dict)
-    body: bytes = ''
+    body: bytes = b''
 
 
 class Route(abc.ABC):
@@ -0,0 +1,147 @@
+import re
+import typing
+import unittest
+
+_token_regex = re.compile(r"\s*(?:(?P<op>!=|>=|<=|=|>|<)|(?P<paren>[()])|'(?P<string>[^']*)'|(?P<word>[a-zA-Z0-9_.-]+))")
+
+
+class FilterSyntaxError(Exception):
+    pass
+
+
+def _tokenize(expression: str) -> typing.List[typing.Tuple[str, str]]:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _token_regex.match(expression, position)
+        if match is None:
+            raise FilterSyntaxError(f"Invalid filter expression at position {position}: {expression}")
+        position = match.end()
+        for kind in ["op", "paren", "string", "word"]:
+            if match.group(kind) is not None:
+                tokens.append((kind, match.group(kind)))
+                break
+    return tokens
+
+
+class _Parser:
+    """
+    This class evaluates a subset of the filter syntax of the Pure Storage REST API for the mocks. It supports
+    comparisons of attributes (nested attributes separated by dots) with quoted strings and numbers, "and", "or", "not"
+    and parentheses.
+    """
+
+    def __init__(self, expression: str, item: typing.Any):
+        self._tokens = _tokenize(expression)
+        self._position = 0
+        self._item = item
+
+    def parse(self) -> bool:
+        result = self._or()
+        if self._position != len(self._tokens):
+            raise FilterSyntaxError(f"Unexpected token {self._tokens[self._position][1]}")
+        return result
+
+    def _peek(self) -> typing.Optional[typing.Tuple[str, str]]:
+        if self._position < len(self._tokens):
+            return self._tokens[self._position]
+        return None
+
+    def _next(self) -> typing.Tuple[str, str]:
+        token = self._peek()
+        if token is None:
+            raise FilterSyntaxError("Unexpected end of filter expression")
+        self._position += 1
+        return token
+
+    def _or(self) -> bool:
+        result = self._and()
+        while self._peek() == ("word", "or"):
+            self._next()
+            right = self._and()
+            result = result or right
+        return result
+
+    def _and(self) -> bool:
+        result = self._not()
+        while self._peek() == ("word", "and"):
+            self._next()
+            right = self._not()
+            result = result and right
+        return result
+
+    def _not(self) -> bool:
+        if self._peek() == ("word", "not"):
+            self._next()
+            return not self._not()
+        if self._peek() == ("paren", "("):
+            self._next()
+            result = self._or()
+            if self._next() != ("paren", ")"):
+                raise FilterSyntaxError("Missing closing parenthesis")
+            return result
+        return self._comparison()
+
+    def _comparison(self) -> bool:
+        kind, attribute = self._next()
+        if kind != "word":
+            raise FilterSyntaxError(f"Expected attribute name instead of {attribute}")
+        kind, op = self._next()
+        if kind != "op":
+            raise FilterSyntaxError(f"Expected operator instead of {op}")
+        kind, value = self._next()
+        if kind not in ["string", "word"]:
+            raise FilterSyntaxError(f"Expected value instead of {value}")
+
+        actual = self._item
+        for part in attribute.split("."):
+            actual = getattr(actual, part, None)
+        if kind == "word":
+            value = float(value)
+        if actual is None:
+            return op == "!="
+        if op == "=":
+            return actual == value
+        if op == "!=":
+            return actual != value
+        if op == ">":
+            return actual > value
+        if op == ">=":
+            return actual >= value
+        if op == "<":
+            return actual < value
+        return actual <= value
+
+
+def matches(expression: typing.Optional[str], item: typing.Any) -> bool:
+    """
+    This function returns True if the item matches the filter expression, or if there is no filter expression.
+
+    :raises FilterSyntaxError: If the expression is not supported.
+    """
+    if expression is None or expression == "":
+        return True
+    return _Parser(expression, item).parse()
+
+
+class MatchesTest(unittest.TestCase):
+    def test_matches(self):
+        class Item:
+            state = "open"
+            updated = 100
+            severity = None
+
+        self.assertTrue(matches(None, Item()))
+        self.assertTrue(matches("state='open'", Item()))
+        self.assertFalse(matches("state!='open'", Item()))
+        self.assertTrue(matches("state!='closed' or updated>=200", Item()))
+        self.assertFalse(matches("state='closed' or updated>=200", Item()))
+        self.assertTrue(matches("not (state='closed' and updated>=50)", Item()))
+        self.assertTrue(matches("severity!='info'", Item()))
+        with self.assertRaises(FilterSyntaxError):
+            matches("state=", Item())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+"""
+This script runs micro-benchmarks of the section handling of the plugin on synthetic data. It does not need a Checkmk
+site or an array. Run it before and after a change to compare the results:
+
+    python tools/benchmark.py --items 10000 decode
+
+The rest benchmark queries the FlashArray mock of the tests and needs the test dependencies.
+"""
+import argparse
+import atexit
+import copy
+import os
+import sys
+import time
+import tracemalloc
+import typing
+
+import uuid
+
+_root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+
+checkmk_lib_path = os.path.abspath(
+    os.path.join(_root_path, "src/local/lib/python3")
+)
+if checkmk_lib_path not in sys.path:
+    sys.path.insert(
+        0,
+        checkmk_lib_path
+    )
+
+import pypureclient
+from pypureclient.flasharray.FA_2_32 import models
+
+from purestorage_checkmk.common import SpecialAgentResult, SpecialAgentInventory, Result, Metric, State, \
+    Attributes, TableRow, from_dict, projector, RawClient
+from purestorage_checkmk.flasharray.common import FlashArraySpecialAgentResultsSection, \
+    FlashArraySpecialAgentInventorySection, Volumes, Hosts
+from purestorage_checkmk.flasharray.special_agent import VolumeRecord, PyPureClientFlashArrayVolumesDataSource
+
+
+def _results(items: int) -> SpecialAgentResult:
+    result = SpecialAgentResult()
+    for i in range(items):
+        result.add_metric_with_service(
+            f"Volume {i}",
+            Metric(float(i % 100), (80.0, 90.0), (0, 100)),
+            summary=f"{i % 100}% used",
+        )
+        result.add_service(f"Drive {i}", Result(State.OK, summary="healthy", details=f"Drive {i} in CH0"))
+    return result
+
+
+def _inventory(items: int) -> SpecialAgentInventory:
+    inventory = SpecialAgentInventory()
+    inventory.add_attributes(Attributes(["hardware", "system"], {"model": "FA-X70", "serial": "PS-1234"}))
+    for i in range(items):
+        inventory.add_table_row(TableRow(
+            ["hardware", "volumes"],
+            {"name": f"vol{i}"},
+            {"serial": f"{i:024X}", "size": i * 1024 * 1024, "connections": i % 4},
+        ))
+    return inventory
+
+
+Benchmark = typing.Tuple[typing.Callable[[], any], typing.Callable[[any], any]]
+"""
+A benchmark case consists of a function preparing the input of a run, and the function that is measured with it.
+"""
+
+
+def benchmark_decode(items: int) -> typing.Dict[str, Benchmark]:
+    """
+    Decoding the JSON data of a results and an inventory section into dataclasses with from_dict().
+    """
+    results = _results(items).to_dict()
+    inventory = _inventory(items).to_dict()
+    return {
+        "results": (lambda: copy.deepcopy(results), lambda data: from_dict(data, SpecialAgentResult)),
+        "inventory": (lambda: copy.deepcopy(inventory), lambda data: from_dict(data, SpecialAgentInventory)),
+    }
+
+
+def benchmark_encode(items: int) -> typing.Dict[str, Benchmark]:
+    """
+    Encoding a results and an inventory section with to_section(), as the special agent does.
+    """
+    results = FlashArraySpecialAgentResultsSection(
+        hardware=_results(items),
+        certificates=SpecialAgentResult(),
+        drives=SpecialAgentResult(),
+        array=SpecialAgentResult(),
+        alerts=SpecialAgentResult(),
+        arrayconnections=SpecialAgentResult(),
+        portdetails=SpecialAgentResult(),
+    )
+    inventory = FlashArraySpecialAgentInventorySection(
+        hardware=SpecialAgentInventory(),
+        software=SpecialAgentInventory(),
+        dns=SpecialAgentInventory(),
+        apitokens=SpecialAgentInventory(),
+        network_interfaces=SpecialAgentInventory(),
+        hosts=SpecialAgentInventory(),
+        volumes=_inventory(items),
+        support=SpecialAgentInventory(),
+        nics=SpecialAgentInventory(),
+    )
+    return {
+        "results": (lambda: results, lambda section: section.to_section()),
+        "inventory": (lambda: inventory, lambda section: section.to_section()),
+    }
+
+
+def benchmark_rows(items: int) -> typing.Dict[str, Benchmark]:
+    """
+    Building the volume and host rows of a FlashArray inventory. The peak memory is the memory the rows occupy.
+    """
+
+    def inventorize(_) -> SpecialAgentInventory:
+        inventory = SpecialAgentInventory()
+        for i in range(items):
+            inventory.add_table_row(Volumes(f"vol{i}", f"{i:024X}", i % 4))
+            inventory.add_table_row(Hosts(f"host{i}", i % 4, f"iqn.2024-01.com.example:host{i}"))
+        return inventory
+
+    return {
+        "inventory": (lambda: None, inventorize),
+    }
+
+
+def benchmark_records(items: int) -> typing.Dict[str, Benchmark]:
+    """
+    Keeping the volumes of a FlashArray for a run, as the pypureclient models and as the records of the data source. The
+    peak memory is the memory the kept volumes occupy.
+    """
+    volumes = [
+        {
+            "id": f"{i:08x}-0000-0000-0000-000000000000",
+            "name": f"vol{i}",
+            "serial": f"{i:024X}",
+            "connection_count": i % 4,
+            "created": 1700000000000 + i,
+            "destroyed": False,
+            "provisioned": 1024 ** 4,
+            "subtype": "regular",
+            "space": {"data_reduction": 3.2, "total_physical": i * 1024, "unique": i * 512, "virtual": i * 2048},
+        }
+        for i in range(items)
+    ]
+    project_volume = projector(VolumeRecord)
+    return {
+        "models": (lambda: volumes, lambda data: [models.Volume.from_dict(volume) for volume in data]),
+        "records": (lambda: volumes, lambda data: [project_volume(models.Volume.from_dict(volume)) for volume in data]),
+    }
+
+
+def benchmark_rest(items: int) -> typing.Dict[str, Benchmark]:
+    """
+    Fetching the volumes of a FlashArray mock with the volumes data source, through the pypureclient models and as JSON
+    (raw_json). The mock runs in the same process, but serves the same pages in both cases.
+    """
+    tests_path = os.path.join(_root_path, "tests")
+    if tests_path not in sys.path:
+        sys.path.insert(0, tests_path)
+    from purestorage_checkmk_test.flasharray import mock, mock_volumes
+
+    api_token = str(uuid.uuid4())
+    drives = mock.DrivesContainer()
+    controllers = mock.ControllersContainer()
+    ports = mock.PortContainer(controllers)
+    volumes = mock.VolumesContainer()
+    volumes.volumes = [
+        mock_volumes.Volume(
+            id=f"{i:08x}-0000-0000-0000-000000000000",
+            name=f"vol{i}",
+            connection_count=i % 4,
+            created=1700000000000 + i,
+            destroyed=False,
+            provisioned=1024 ** 4,
+            serial=f"{i:024X}",
+            subtype="regular",
+            space=mock_volumes._VolumeSpace(
+                data_reduction=3.2, total_physical=i * 1024, unique=i * 512, virtual=i * 2048
+            ),
+        )
+        for i in range(items)
+    ]
+    server = mock.FlashArray(
+        api_tokens_container=mock.APITokensContainer({api_token}),
+        drives_container=drives,
+        controllers_container=controllers,
+        hardwares_container=mock.HardwaresContainer(drives, controllers, ports),
+        arrays_container=mock.ArraysContainer(),
+        alerts_container=mock.AlertsContainer(),
+        certificates_container=mock.CertificatesContainer(),
+        admin_settings_container=mock.AdminSettingsContainer(),
+        smtp_servers_container=mock.SMTPServersContainer(),
+        dns_servers_container=mock.DNSServersContainer(),
+        array_connections_container=mock.ArrayConnectionContainer(),
+        network_interfaces_container=mock.NetworkInterfaceContainer(),
+        hosts_container=mock.HostsContainer(),
+        volumes_container=volumes,
+        support_container=mock.SupportContainer(),
+        port_container=ports,
+    )
+    server.start()
+    atexit.register(server.stop)
+    cli = pypureclient.flasharray.client.Client(f"127.0.0.1:{server.port()}", api_token=api_token)
+    raw = RawClient(cli)
+    return {
+        "models": (lambda: None, lambda _: list(PyPureClientFlashArrayVolumesDataSource(cli).query())),
+        "raw": (lambda: None, lambda _: list(PyPureClientFlashArrayVolumesDataSource(cli, raw=raw).query())),
+    }
+
+
+def _measure(benchmark: Benchmark, repeat: int) -> typing.Tuple[float, float, int]:
+    """
+    :return: The fastest of the runs in seconds, the lowest CPU time of the process during a run in seconds, and the
+        peak memory allocated during a run in bytes.
+    """
+    setup, function = benchmark
+    durations = []
+    cpu_times = []
+    for _ in range(repeat):
+        data = setup()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        function(data)
+        cpu_times.append(time.process_time() - cpu_start)
+        durations.append(time.perf_counter() - start)
+    data = setup()
+    tracemalloc.start()
+    try:
+        function(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(durations), min(cpu_times), peak
+
+
+benchmarks = {
+    "decode": benchmark_decode,
+    "encode": benchmark_encode,
+    "rows": benchmark_rows,
+    "records": benchmark_records,
+    "rest": benchmark_rest,
+}
+
+
+def main(argv: typing.List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Runs micro-benchmarks of the section handling.")
+    parser.add_argument("--items", type=int, default=10000, help="number of services and table rows to generate")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs, the fastest run is reported")
+    parser.add_argument("benchmarks", nargs="*", help=f"benchmarks to run: {', '.join(benchmarks.keys())} (default: all)")
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in benchmarks:
+            parser.error(f"unknown benchmark {name}")
+
+    for name in args.benchmarks or benchmarks.keys():
+        for case, benchmark in benchmarks[name](args.items).items():
+            duration, cpu_time, peak = _measure(benchmark, args.repeat)
+            print(
+                f"{name}/{case}: {duration * 1000:.1f} ms, {cpu_time * 1000:.1f} ms CPU, "
+                f"{peak / 1024 / 1024:.1f} MB peak ({args.items} items)"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))